@@ -24,8 +24,26 @@ from PyQt4.QtGui import (
         )
 
 from ffmulticonverter import utils
+from ffmulticonverter import cmdline
 from ffmulticonverter import presets_dlgs
 from ffmulticonverter import config
+from ffmulticonverter import probe
+from ffmulticonverter import streamcopy
+
+
+SCALE = re.compile(r'scale=(-?\d+):(-?\d+)')
+
+# filters of the items of rotateQCB
+ROTATIONS = [
+        '',                         # none
+        'transpose=1',              # 90 clockwise
+        'transpose=3',              # 90 clockwise + vertical flip
+        'transpose=2',              # 90 counter clockwise
+        'transpose=0',              # 90 counter clockwise + vertical flip
+        'transpose=2,transpose=2',  # 180
+        'hflip',                    # horizontal flip
+        'vflip'                     # vertical flip
+        ]
 
 
 class AudioVideoTab(QWidget):
@@ -35,6 +53,9 @@ class AudioVideoTab(QWidget):
         self.name = 'AudioVideo'
 
         self.defaultStr = self.tr('Default')
+        # cmdline.Command of commandQLE's text, see edit_command()
+        self.command = None
+        self.command_text = None
 
         self.formats = config.video_formats
         frequency_values = [self.defaultStr] + config.video_frequency_values
@@ -249,6 +270,35 @@ class AudioVideoTab(QWidget):
         # setExclusive(False) in order to be able to uncheck checkboxes and
         # then setExclusive(True) so only one radio button can be set
 
+    def show_source_info(self, path):
+        """
+        Show the size, frame rate, bitrate and duration of path as the
+        placeholder texts of the respective fields, if path has been probed.
+        path None clears them.
+        """
+        info = probe.cached_info(path) if path is not None else None
+        info = info or {}
+        video = streamcopy.first_stream(info.get('streams', []), 'video') or {}
+        audio = streamcopy.first_stream(info.get('streams', []), 'audio') or {}
+
+        rate = streamcopy.parse_rate(video.get('avg_frame_rate', ''))
+        bitrate = streamcopy.parse_bitrate(video.get('bit_rate', ''))
+        duration = info.get('format', {}).get('duration')
+        try:
+            duration = utils.seconds_to_duration(float(duration))
+        except (TypeError, ValueError):
+            duration = ''
+
+        self.widthQLE.setPlaceholderText(str(video.get('width', '')))
+        self.heightQLE.setPlaceholderText(str(video.get('height', '')))
+        self.frameQLE.setPlaceholderText(
+                '{0:g}'.format(round(rate, 2)) if rate else '')
+        self.bitrateQLE.setPlaceholderText(
+                str(int(bitrate // 1000)) if bitrate else '')
+        self.durationQLE.setPlaceholderText(duration)
+        self.vidcodecQCB.setToolTip(video.get('codec_name', ''))
+        self.audcodecQCB.setToolTip(audio.get('codec_name', ''))
+
     def fill_video_comboboxes(self, vcodecs, acodecs, extraformats):
         vcodecs = [i for i in vcodecs.split("\n")] if vcodecs else []
         acodecs = [i for i in acodecs.split("\n")] if acodecs else []
@@ -312,8 +362,33 @@ class AudioVideoTab(QWidget):
             if find >= 0:
                 self.extQCB.setCurrentIndex(find)
 
+    def edit_command(self):
+        """
+        Return the cmdline.Command of self.commandQLE's text, which is parsed
+        again only if the text was changed by something other than
+        update_command().
+        """
+        text = self.commandQLE.text()
+        if self.command is None or text != self.command_text:
+            self.command = cmdline.Command(text)
+            self.command_text = text
+        return self.command
+
+    def update_command(self):
+        """Show the changes of self.command in self.commandQLE."""
+        self.command_text = self.command.text()
+        self.commandQLE.setText(self.command_text)
+
+    def command_update_option(self, option, value):
+        """Set option to value in the command, or remove it if value is ''."""
+        command = self.edit_command()
+        if value:
+            command.set(option, value)
+        else:
+            command.remove(option)
+        self.update_command()
+
     def command_update_size(self):
-        command = self.commandQLE.text()
         text1 = self.widthQLE.text()
         text2 = self.heightQLE.text()
 
@@ -324,15 +399,11 @@ class AudioVideoTab(QWidget):
                 text2 == '-'):
             return
 
-        regex = r'(\s+|^)-s(:v){0,1}\s+\d+x\d+(\s+|$)'
-        if re.search(regex, command):
-            command = re.sub(regex, '', command)
-
-        regex = r'(,*\s*){0,1}(scale=-?\d+:-?\d+)(\s*,*\s*){0,1}'
+        command = self.edit_command()
+        command.remove('-s')
         _filter = "scale={0}:{1}".format(text1, text2) if text1 and text2 else ''
-
-        self.commandQLE.setText(utils.update_cmdline_text(
-                command, _filter, regex, bool(text1 and text2), 0, 2))
+        command.set_filter(['scale'], [_filter] if _filter else [])
+        self.update_command()
 
     def command_update_preserve_size(self):
         checked = self.preservesizeQChB.isChecked()
@@ -345,32 +416,21 @@ class AudioVideoTab(QWidget):
             self.heightQLE.clear()
             # command_update_size() is triggered here
 
-        command = self.commandQLE.text()
-        regex = r'(\s+|^)-s\s+\d+x\d+(\s+|$)'
-        command = re.sub(' +', ' ', re.sub(regex, ' ', command)).strip()
-        self.commandQLE.setText(command)
+        self.edit_command().remove('-s')
+        self.update_command()
 
     def command_update_aspect(self):
-        command = self.commandQLE.text()
         text1 = self.aspect1QLE.text()
         text2 = self.aspect2QLE.text()
 
         if (text1 or text2) and not (text1 and text2):
             return
 
-        regex = r'(\s+|^)-aspect\s+\d+:\d+(\s+|$)'
-        s = ' -aspect {0}:{1} '.format(text1, text2) if text1 and text2 else ' '
-
-        if re.search(regex, command):
-            command = re.sub(regex, s, command)
-        else:
-            command += s
-
-        command = re.sub(' +', ' ', command).strip()
-        self.commandQLE.setText(command)
+        self.command_update_option(
+                '-aspect',
+                '{0}:{1}'.format(text1, text2) if text1 and text2 else '')
 
     def command_update_preserve_aspect(self):
-        command = self.commandQLE.text()
         checked = self.preserveaspectQChB.isChecked()
 
         self.aspect1QLE.setEnabled(not checked)
@@ -381,212 +441,73 @@ class AudioVideoTab(QWidget):
             self.aspect2QLE.clear()
             # self.command_update_aspect() is triggered here
 
-            regex = r'(,*\s*){0,1}(scale=(-?\d+):(-?\d+))(\s*,*\s*){0,1}'
-            search = re.search(regex, command)
+            _filter = (self.edit_command().find_filter('scale') or '').strip()
+            search = SCALE.match(_filter)
             if search:
-                width = search.groups()[2]
-                height = search.groups()[3]
+                width, height = search.groups()
                 if not (width == '-1' or height == '-1'):
-                    s = "scale=-1:{0}".format(height)
-                    command = re.sub(regex, r'\1{0}\5'.format(s), command)
+                    _filter = 'scale=-1:{0}{1}'.format(
+                            height, _filter[search.end():])
+                    self.edit_command().set_filter(['scale'], [_filter])
+                    self.update_command()
                     self.widthQLE.setText('-1')
                     self.heightQLE.setText(height)
 
-        regex = r'(\s+|^)-aspect\s+\d+:\d+(\s+|$)'
-        command = re.sub(' +', ' ', re.sub(regex, ' ', command)).strip()
-        self.commandQLE.setText(command)
+        self.edit_command().remove('-aspect')
+        self.update_command()
 
     def command_update_frames(self):
-        command = self.commandQLE.text()
-        text = self.frameQLE.text()
-
-        regex = r'(\s+|^)-r\s+\d+(\s+|$)'
-        s = ' -r {0} '.format(text) if text else ' '
-
-        if re.search(regex, command):
-            command = re.sub(regex, s, command)
-        else:
-            command += s
-
-        command = re.sub(' +', ' ', command).strip()
-        self.commandQLE.setText(command)
+        self.command_update_option('-r', self.frameQLE.text())
 
     def command_update_vidbitrate(self):
-        command = self.commandQLE.text()
         text = self.bitrateQLE.text()
-
-        regex = r'(\s+|^)-b(:v){0,1}\s+\d+[kKmM](\s+|$)'
-        s = ' -b:v {0}k '.format(text) if text else ' '
-
-        if re.search(regex, command):
-            command = re.sub(regex, s, command)
-        else:
-            command += s
-
-        command = re.sub('-sameq', '', command)
-        command = re.sub(' +', ' ', command).strip()
-
-        self.commandQLE.setText(command)
+        self.edit_command().remove('-sameq')
+        self.command_update_option('-b:v', '{0}k'.format(text) if text else '')
 
     def command_update_frequency(self):
-        command = self.commandQLE.text()
         text = self.freqQCB.currentText()
-
-        regex = r'(\s+|^)-ar\s+\d+(\s+|$)'
-        s = ' -ar {0} '.format(text) if self.freqQCB.currentIndex() != 0 else ' '
-
-        if re.search(regex, command):
-            command = re.sub(regex, s, command)
-        else:
-            command += s
-
-        command = re.sub(' +', ' ', command).strip()
-        self.commandQLE.setText(command)
+        self.command_update_option(
+                '-ar', text if self.freqQCB.currentIndex() != 0 else '')
 
     def command_update_audbitrate(self):
-        command = self.commandQLE.text()
         text = self.audbitrateQCB.currentText()
-
-        regex = r'(\s+|^)-(ab|b:a)\s+\d+[kKmM](\s+|$)'
-        if self.audbitrateQCB.currentIndex() != 0:
-            s = ' -b:a {0}k '.format(text)
-        else:
-            s = ' '
-
-        if re.search(regex, command):
-            command = re.sub(regex, s, command)
-        else:
-            command += s
-
-        command = re.sub(' +', ' ', command).strip()
-        self.commandQLE.setText(command)
+        self.command_update_option(
+                '-b:a', '{0}k'.format(text)
+                if self.audbitrateQCB.currentIndex() != 0 else '')
 
     def command_update_channels(self, channel):
-        command = self.commandQLE.text()
-
-        regex = r'(\s+|^)-ac\s+\d+(\s+|$)'
-        s = ' -ac {0} '.format(channel)
-
-        if re.search(regex, command):
-            command = re.sub(regex, s, command)
-        else:
-            command += s
-
-        command = re.sub(' +', ' ', command).strip()
-        self.commandQLE.setText(command)
+        self.command_update_option('-ac', channel)
 
     def command_update_threads(self):
-        command = self.commandQLE.text()
-        text = self.threadsQLE.text()
-
-        regex = r'(\s+|^)-threads\s+\d+(\s+|$)'
-        s = ' -threads {0} '.format(text) if text else ' '
-
-        if re.search(regex, command):
-            command = re.sub(regex, s, command)
-        else:
-            command += s
-
-        command = re.sub(' +', ' ', command).strip()
-        self.commandQLE.setText(command)
+        self.command_update_option('-threads', self.threadsQLE.text())
 
     def command_update_begin_time(self):
-        command = self.commandQLE.text()
-        text = self.beginQLE.text()
-
-        regex = r'(\s+|^)-ss\s+\S+(\s+|$)'
-        s = ' -ss {0} '.format(text) if text else ' '
-
-        if re.search(regex, command):
-            command = re.sub(regex, s, command)
-        else:
-            command += s
-
-        command = re.sub(' +', ' ', command).strip()
-        self.commandQLE.setText(command)
+        self.command_update_option('-ss', self.beginQLE.text())
 
     def command_update_duration(self):
-        command = self.commandQLE.text()
-        text = self.durationQLE.text()
-
-        regex = r'(\s+|^)-t\s+\S+(\s+|$)'
-        s = ' -t {0} '.format(text) if text else ' '
-
-        if re.search(regex, command):
-            command = re.sub(regex, s, command)
-        else:
-            command += s
-
-        command = re.sub(' +', ' ', command).strip()
-        self.commandQLE.setText(command)
+        self.command_update_option('-t', self.durationQLE.text())
 
     def command_update_vcodec(self):
-        command = self.commandQLE.text()
         text = self.vidcodecQCB.currentText()
-
-        regex = r'(\s+|^)-(vcodec|c:v)\s+\S+(\s+|$)'
-        if self.vidcodecQCB.currentIndex() != 0:
-            s = ' -vcodec {0} '.format(text)
-        else:
-            s = ' '
-
-        if re.search(regex, command):
-            command = re.sub(regex, s, command)
-        else:
-            command += s
-
-        command = re.sub(' +', ' ', command).strip()
-        self.commandQLE.setText(command)
+        self.command_update_option(
+                '-vcodec', text if self.vidcodecQCB.currentIndex() != 0 else '')
 
     def command_update_acodec(self):
-        command = self.commandQLE.text()
         text = self.audcodecQCB.currentText()
-
-        regex = r'(\s+|^)-(acodec|c:a)\s+\S+(\s+|$)'
-        if self.audcodecQCB.currentIndex() != 0:
-            s = ' -acodec {0} '.format(text)
-        else:
-            s = ' '
-
-        if re.search(regex, command):
-            command = re.sub(regex, s, command)
-        else:
-            command += s
-
-        command = re.sub(' +', ' ', command).strip()
-        self.commandQLE.setText(command)
+        self.command_update_option(
+                '-acodec', text if self.audcodecQCB.currentIndex() != 0 else '')
 
     def command_update_subtitles(self):
-        command = self.commandQLE.text()
-        regex = r'(,*\s*){0,1}(subtitles=\'.*\')(\s*,*\s*){0,1}'
-
         text = self.embedQLE.text()
         _filter = "subtitles='{0}'".format(text) if text else ''
 
-        self.commandQLE.setText(utils.update_cmdline_text(
-                command, _filter, regex, bool(text), 0, 2))
+        self.edit_command().set_filter(
+                ['subtitles'], [_filter] if _filter else [])
+        self.update_command()
 
     def command_update_rotation(self):
-        command = self.commandQLE.text()
-        regex = r'(,*\s*){0,1}(transpose=\d(,\s*transpose=\d)*|vflip|hflip)(\s*,*\s*){0,1}'
-
         rotate = self.rotateQCB.currentIndex()
-        if rotate == 0:   # none
-            _filter = ''
-        elif rotate == 1: # 90 clockwise
-            _filter = 'transpose=1'
-        elif rotate == 2: # 90 clockwise + vertical flip
-            _filter = 'transpose=3'
-        elif rotate == 3: # 90 counter clockwise
-            _filter = 'transpose=2'
-        elif rotate == 4: # 90 counter clockwise + vertical flip
-            _filter = 'transpose=0'
-        elif rotate == 5: # 180
-            _filter = 'transpose=2,transpose=2'
-        elif rotate == 6: # horizontal flip
-            _filter = 'hflip'
-        elif rotate == 7: # vertical flip
-            _filter = 'vflip'
-
-        self.commandQLE.setText(utils.update_cmdline_text(
-                command, _filter, regex, bool(rotate != 0), 0, 3))
+        filters = ROTATIONS[rotate].split(',') if rotate else []
+
+        self.edit_command().set_filter(['transpose', 'hflip', 'vflip'], filters)
+        self.update_command()
@@ -0,0 +1,298 @@
+# Copyright (C) 2011-2015 Ilias Stamatis <stamatis.iliass@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Cache of conversion results.
+
+A result is stored under a key made of the identity of the input file
+(path, size and modification time, or a hash of its content) and of the
+conversion settings, e.g. the converter's command and version. Converting
+an unchanged file with the same settings again just links the stored
+result to the new target.
+
+Several programs may use the cache at the same time: each one keeps its
+own copy of the index and merges it with the one on disk when it saves.
+
+Example:
+    results = cache.ResultCache()
+    key = results.key(source, ['ffmpeg 2.6', '-i', 'SOURCE', 'TARGET.mp4'])
+    if not results.fetch(key, target):
+        convert(source, target)
+        results.store(key, target)
+    results.save()
+"""
+
+import os
+import json
+import fcntl
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+
+from ffmulticonverter import config
+
+
+def file_identity(path, content_hash=False):
+    """
+    Return a list that identifies the content of file path.
+    If content_hash is True the content is hashed, else the size and the
+    modification time are used.
+    """
+    stat = os.stat(path)
+    if not content_hash:
+        return [os.path.realpath(path), stat.st_size, stat.st_mtime_ns]
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return [stat.st_size, digest.hexdigest()]
+
+def link_or_copy(source, target, copy=True):
+    """
+    Make target have the content of source, as a hard link if possible,
+    else as a copy if copy is True. target is replaced at once, so that
+    readers never see a partial file.
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target) or '.',
+                               prefix='.', suffix='.part')
+    os.close(fd)
+    try:
+        os.remove(tmp)
+        try:
+            os.link(source, tmp)
+        except OSError:
+            if not copy:
+                raise
+            shutil.copyfile(source, tmp)
+        os.replace(tmp, target)
+    except OSError:
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        raise
+
+
+class ResultCache(object):
+    """
+    Persistent cache of conversion results with a maximum size. The least
+    recently used results are removed when the cache grows too big.
+    """
+    def __init__(self, folder=None, max_size=None, content_hash=None,
+                 copy=None):
+        """
+        Keyword arguments:
+        folder       -- where results are stored, config.cache_dir by default
+        max_size     -- maximum size of all results in bytes,
+                        config.cache_max_size by default
+        content_hash -- if True, identify input files by a hash of their
+                        content, config.cache_hash by default
+        copy         -- if True, results that cannot be hard linked into
+                        folder are copied, config.cache_copy by default
+        """
+        self.folder = folder or config.cache_dir
+        self.max_size = max_size if max_size is not None else \
+                config.cache_max_size
+        self.content_hash = content_hash if content_hash is not None else \
+                config.cache_hash
+        self.copy = copy if copy is not None else config.cache_copy
+        self.index_file = os.path.join(self.folder, 'index.json')
+        self.lock_file = os.path.join(self.folder, 'index.lock')
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+        # key -> [size in bytes, time of last use]
+        self.entries = self.load_index()
+        self.total_size = sum(i[0] for i in self.entries.values())
+        # keys removed since the index was saved, which must not come back
+        # from the index on disk
+        self.removed = set()
+
+    def load_index(self):
+        """Return the entries of the index on disk."""
+        try:
+            with open(self.index_file, encoding='utf8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def key(self, source, settings):
+        """
+        Return the key of the result of converting source with settings,
+        a list of strings describing the conversion, or None if source
+        cannot be read.
+        """
+        try:
+            identity = file_identity(source, self.content_hash)
+        except OSError:
+            return None
+        data = json.dumps([identity, settings]).encode('utf8')
+        return hashlib.sha256(data).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.folder, key[:2], key)
+
+    def fetch(self, key, target):
+        """
+        Put the cached result of key to target.
+        Return True on success, False if there is no such result.
+        Results whose size has changed, e.g. because a program wrote to a
+        target that is linked to them, are removed.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                entry[1] = time.time()
+        path = self.path(key)
+        if entry is not None:
+            try:
+                if os.path.getsize(path) != entry[0]:
+                    raise OSError('{0} has changed'.format(path))
+                if not (os.path.exists(target) and
+                        os.path.samefile(path, target)):
+                    link_or_copy(path, target)
+                with self.lock:
+                    self.hits += 1
+                return True
+            except OSError:
+                with self.lock:
+                    self.forget(key)
+        with self.lock:
+            self.misses += 1
+        return False
+
+    def store(self, key, target):
+        """Save the converted file target as the result of key."""
+        try:
+            size = os.path.getsize(target)
+        except OSError:
+            return
+        if size > self.max_size:
+            return
+        path = self.path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            link_or_copy(target, path, self.copy)
+        except OSError:
+            return
+        with self.lock:
+            self.removed.discard(key)
+            if key in self.entries:
+                self.total_size -= self.entries[key][0]
+            self.entries[key] = [size, time.time()]
+            self.total_size += size
+            self.stores += 1
+            self.evict()
+
+    def forget(self, key):
+        """Remove the result of key. Must be called with self.lock held."""
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.total_size -= entry[0]
+        self.removed.add(key)
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+
+    def evict(self):
+        """
+        Remove the least recently used results until the cache fits in
+        self.max_size. Must be called with self.lock held.
+        """
+        if self.total_size <= self.max_size:
+            return
+        for key in sorted(self.entries, key=lambda i: self.entries[i][1]):
+            self.forget(key)
+            self.evictions += 1
+            if self.total_size <= self.max_size:
+                break
+
+    def save(self):
+        """
+        Write the index of the cache to disk. The index is locked while the
+        entries that other programs saved are merged into it, so that none
+        of them is lost, and the result files that it does not list are
+        removed.
+        """
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            with open(self.lock_file, 'a') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                with self.lock:
+                    self.merge(self.load_index())
+                    self.evict()
+                    self.removed.clear()
+                    data = json.dumps(self.entries)
+                    self.sweep()
+                tmp = self.index_file + '.tmp'
+                with open(tmp, 'w', encoding='utf8') as f:
+                    f.write(data)
+                os.replace(tmp, self.index_file)
+        except OSError:
+            pass
+
+    def merge(self, entries):
+        """
+        Add the entries of another index, keeping the latest time of use
+        of the common ones. Must be called with self.lock held.
+        """
+        for key, entry in entries.items():
+            if key in self.removed:
+                continue
+            if key in self.entries:
+                self.entries[key][1] = max(self.entries[key][1], entry[1])
+            else:
+                self.entries[key] = entry
+        self.total_size = sum(i[0] for i in self.entries.values())
+
+    def sweep(self):
+        """
+        Remove the result files that no entry refers to, e.g. those of a
+        program that was killed before it saved its index. Files younger
+        than config.cache_orphan_age are kept, they may belong to a program
+        that is still running. Must be called with self.lock held.
+        """
+        oldest = time.time() - config.cache_orphan_age
+        for prefix in os.listdir(self.folder):
+            folder = os.path.join(self.folder, prefix)
+            if len(prefix) != 2 or not os.path.isdir(folder):
+                continue
+            for name in os.listdir(folder):
+                if name in self.entries:
+                    continue
+                path = os.path.join(folder, name)
+                try:
+                    # linking a result changes its ctime but not its mtime
+                    if os.lstat(path).st_ctime < oldest:
+                        os.remove(path)
+                except OSError:
+                    pass
+
+    def stats(self):
+        """Return a dict with the statistics of the cache."""
+        with self.lock:
+            return {
+                    'hits' : self.hits,
+                    'misses' : self.misses,
+                    'stores' : self.stores,
+                    'evictions' : self.evictions,
+                    'entries' : len(self.entries),
+                    'size' : self.total_size
+                    }
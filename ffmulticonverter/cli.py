@@ -0,0 +1,244 @@
+# Copyright (C) 2011-2015 Ilias Stamatis <stamatis.iliass@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Batch mode: convert files without the graphical user interface.
+
+Progress is written to stdout as one JSON object per line, e.g.
+    {"event": "started", "slot": 0, "source": "/a.avi", "target": "/a.mp4"}
+    {"event": "progress", "slot": 0, "source": "/a.avi", "percent": 42,
+     "speed": 2.5, "fps": 61.0, "eta": 83.2, "total": 21, "total_eta": 310.4}
+    {"event": "finished", "slot": 0, "source": "/a.avi", "target": "/a.mp4",
+     "success": true, "total": 50, "total_eta": 151.0}
+    {"event": "done", "ok": 1, "error": 0,
+     "cache": {"hits": 0, "misses": 1, "stores": 1, ...}}
+"""
+
+import os
+import sys
+import glob
+import json
+import argparse
+
+from ffmulticonverter import cache
+from ffmulticonverter import config
+from ffmulticonverter import engine
+from ffmulticonverter import presets
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(
+            prog='ffmulticonverter --batch',
+            description='Convert files without the graphical interface.')
+    parser.add_argument(
+            'inputs', nargs='+', metavar='INPUT',
+            help='file or glob pattern of files to convert')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument(
+            '-f', '--format', help='extension to convert files to')
+    target.add_argument(
+            '-p', '--preset', help='name of the audio/video preset to use')
+    parser.add_argument(
+            '-t', '--type', choices=['video', 'image', 'document'],
+            help='converter to use, guessed from the extensions if not given')
+    parser.add_argument(
+            '-o', '--output',
+            help='output folder, each file is saved in the folder of its '
+                 'input if not given')
+    parser.add_argument(
+            '-j', '--jobs', type=int, default=config.max_jobs,
+            help='number of files converted at the same time '
+                 '(default: %(default)s)')
+    parser.add_argument(
+            '-s', '--segments', type=int, default=config.video_segments,
+            help='split long videos into this many parts and encode them in '
+                 'parallel (default: %(default)s)')
+    parser.add_argument(
+            '--no-stream-copy', action='store_true',
+            help='always encode, even streams that already have the '
+                 'requested codec')
+    parser.add_argument(
+            '-c', '--command', default='',
+            help='extra ffmpeg or ImageMagick parameters')
+    parser.add_argument('--prefix', default='', help='prefix of new files')
+    parser.add_argument('--suffix', default='', help='suffix of new files')
+    parser.add_argument(
+            '--overwrite', action='store_true',
+            help="overwrite existing files instead of adding a '~' (or "
+                 "'~2~' etc.) prefix")
+    parser.add_argument(
+            '--delete', action='store_true',
+            help='delete each input file after its successful conversion')
+    parser.add_argument(
+            '--scratch', metavar='FOLDER', default=config.scratch_dir or None,
+            help='write outputs to FOLDER on fast local storage and move '
+                 'them to their targets while the next files convert')
+    parser.add_argument(
+            '--cache', action='store_true', default=config.use_cache,
+            help='reuse the cached results of unchanged files converted '
+                 'with the same settings')
+    parser.add_argument(
+            '--no-cache', action='store_false', dest='cache',
+            help='convert unchanged files again instead of reusing cached '
+                 'results')
+    opts = parser.parse_args(args)
+    if opts.jobs < 1:
+        parser.error('argument -j/--jobs: must be at least 1')
+    return opts
+
+def expand_inputs(patterns):
+    """Return the list of existing files that match the glob patterns."""
+    files = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True))
+        if not matches:
+            print('ffmulticonverter: {0}: No such file'.format(pattern),
+                  file=sys.stderr)
+        for i in matches:
+            i = os.path.abspath(i)
+            if os.path.isfile(i):
+                files.append(i)
+    return files
+
+def guess_type(files, ext):
+    """Return the converter type suitable for converting files to ext."""
+    from_exts = set(os.path.splitext(i)[1][1:] for i in files)
+    if from_exts and all(
+            ext in config.document_formats.get(i, []) for i in from_exts):
+        return 'document'
+    if ext in config.image_formats + config.image_extra_formats:
+        return 'image'
+    return 'video'
+
+def create_converter(_type, command, preset_params, segments=None,
+                     stream_copy=None):
+    """Return the Converter for the given type or None if missing."""
+    if _type == 'video':
+        if engine.is_installed('ffmpeg'):
+            vidconverter = 'ffmpeg'
+        elif engine.is_installed('avconv'):
+            vidconverter = 'avconv'
+        else:
+            return None
+        if preset_params:
+            command = preset_params + ' ' + command
+        return engine.VideoConverter(
+                vidconverter, command, segments=segments,
+                stream_copy=stream_copy)
+    elif _type == 'image':
+        if not engine.is_installed('convert'):
+            return None
+        return engine.ImageConverter(imgcmd=command)
+    else:
+        if not engine.is_installed('unoconv'):
+            return None
+        return engine.DocumentConverter()
+
+def event_to_dict(event):
+    """Return a JSON serializable dict describing event."""
+    data = {'event' : event.kind}
+    if event.slot is not None:
+        data['slot'] = event.slot
+    if event.job is not None:
+        data['source'] = event.job.source
+    if event.kind in (engine.STARTED, engine.FINISHED):
+        data['target'] = event.job.target
+    if event.kind == engine.PROGRESS:
+        data['percent'] = event.percent
+        for key in ('speed', 'fps', 'eta'):
+            if getattr(event, key) is not None:
+                data[key] = getattr(event, key)
+    elif event.kind == engine.FINISHED:
+        data['success'] = event.result.success
+    if event.kind in (engine.PROGRESS, engine.FINISHED):
+        data['total'] = event.total_percent
+        if event.total_eta is not None:
+            data['total_eta'] = event.total_eta
+    return data
+
+def write_event(data):
+    sys.stdout.write(json.dumps(data) + '\n')
+    sys.stdout.flush()
+
+def main(args=None):
+    """
+    Run a batch conversion and return the exit status:
+    0 if all files converted, 1 if some conversions failed and 2 for
+    invalid arguments.
+    """
+    if args is None:
+        args = [i for i in sys.argv[1:] if i != '--batch']
+    opts = parse_args(args)
+
+    preset_params = ''
+    ext = opts.format
+    if opts.preset:
+        preset = presets.find_preset(opts.preset)
+        if preset is None:
+            print('ffmulticonverter: {0}: No such preset'.format(opts.preset),
+                  file=sys.stderr)
+            return 2
+        preset_params, ext = preset
+    ext = ext.lstrip('.')
+
+    if opts.output and not os.path.isdir(opts.output):
+        print('ffmulticonverter: {0}: Output folder does not exist'.format(
+              opts.output), file=sys.stderr)
+        return 2
+
+    files = expand_inputs(opts.inputs)
+    if not files:
+        print('ffmulticonverter: no files to convert', file=sys.stderr)
+        return 2
+    _type = opts.type or ('video' if opts.preset else guess_type(files, ext))
+    converter = create_converter(
+            _type, opts.command, preset_params, opts.segments,
+            not opts.no_stream_copy and config.stream_copy)
+    if converter is None:
+        print('ffmulticonverter: converter for {0} files is not '
+              'installed'.format(_type), file=sys.stderr)
+        return 2
+    if opts.jobs > converter.max_jobs:
+        print('ffmulticonverter: converting at most {0} {1} files at the '
+              'same time'.format(converter.max_jobs, _type), file=sys.stderr)
+
+    engine.setup_logging()
+
+    jobs = engine.create_paths_list(
+            files, '.' + ext, opts.prefix, opts.suffix, opts.output,
+            not opts.output, opts.overwrite)
+    results = None
+    if opts.cache:
+        results = cache.ResultCache()
+    eng = engine.Engine(converter, jobs, opts.jobs, opts.delete,
+                        cache=results, scratch_dir=opts.scratch or '')
+    try:
+        for event in eng.iter_events():
+            if event.kind == engine.OUTPUT:
+                continue
+            data = event_to_dict(event)
+            if event.kind == engine.DONE:
+                data.update({'ok' : eng.ok, 'error' : eng.error})
+                if results is not None:
+                    data['cache'] = results.stats()
+            write_event(data)
+    except KeyboardInterrupt:
+        eng.cancel()
+        eng.wait()
+        write_event({'event' : 'cancelled', 'ok' : eng.ok,
+                     'error' : eng.error})
+        return 1
+
+    return 0 if eng.error == 0 else 1
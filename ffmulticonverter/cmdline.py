@@ -0,0 +1,266 @@
+# Copyright (C) 2011-2015 Ilias Stamatis <stamatis.iliass@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Model of the ffmpeg options that users type or get from presets.
+
+Command parses the text once into words, which keep their original spelling
+and spacing, so that it is written back unchanged except for the options
+that are set or removed. The value of -vf is handled as an ordered chain
+of filters.
+
+Example:
+    command = cmdline.Command('-vcodec libx264 -vf "scale=640:-1, hflip"')
+    command.set('-b:v', '800k')
+    command.set_filter(['scale'], [])
+    command.text()  # '-vcodec libx264 -vf hflip -b:v 800k'
+"""
+
+import re
+import shlex
+
+from ffmulticonverter import streamcopy
+
+
+# spellings of the same option, the first one is used for new options
+ALIASES = [
+        ['-vcodec', '-c:v', '-codec:v'],
+        ['-acodec', '-c:a', '-codec:a'],
+        ['-b:v', '-b'],
+        ['-b:a', '-ab'],
+        ['-s', '-s:v'],
+        ['-vf', '-filter:v'],
+        ]
+CANONICAL = dict((alias, names[0]) for names in ALIASES for alias in names)
+
+# a word with its leading white space: unquoted characters, backslash
+# escapes and quoted strings, which may be left open at the end of the text
+WORD = re.compile(r'''(\s*)((?:[^\s"'\\]|\\.?|"(?:[^"\\]|\\.?)*"?|'[^']*'?)+)''',
+                  re.DOTALL)
+OPTION = re.compile(r'-[^\d.\W]')
+# words that need no quotes, as in shlex.quote()
+SAFE = re.compile(r'[\w@%+=:,./-]+$', re.ASCII)
+# a filter of a filter chain: unquoted characters, backslash escapes,
+# quoted strings and [link labels]
+FILTER = re.compile(r'''(?:[^,'\\\[]|\\.?|'[^']*'?|\[[^\]]*\]?)*''',
+                    re.DOTALL)
+FILTER_NAME = re.compile(r'\s*(?:\[[^\]]*\]\s*)*([\w.-]+)')
+
+
+def unquote(word):
+    """Return the value of a word as the shell would see it."""
+    try:
+        values = shlex.split(word)
+    except ValueError:
+        return word
+    return values[0] if len(values) == 1 else word
+
+def quote(value):
+    """Return value as a word, quoted if needed."""
+    if SAFE.match(value):
+        return value
+    if not re.search(r'["\\$`]', value):
+        return '"' + value + '"'
+    return shlex.quote(value)
+
+def is_option(value):
+    """Return True if value is an option name, e.g. '-r' but not '-1'."""
+    return OPTION.match(value) is not None
+
+def split_filters(chain):
+    """
+    Return the list of filters of a filter chain like 'scale=640:-1,hflip'.
+    Commas that are quoted, escaped or in [link labels] do not split.
+    ','.join() of the list is chain again.
+    """
+    if not chain:
+        return []
+    filters = []
+    start = 0
+    while True:
+        # FILTER stops only at a comma or at the end
+        end = FILTER.match(chain, start).end()
+        filters.append(chain[start:end])
+        if end == len(chain):
+            return filters
+        start = end + 1
+
+def filter_name(_filter):
+    """Return the name of a filter, e.g. 'scale' for 'scale=640:-1'."""
+    match = FILTER_NAME.match(_filter)
+    return match.group(1) if match else ''
+
+
+class Command(object):
+    """
+    ffmpeg options as a list of words, e.g. '-vcodec libx264 -b:v 800k'.
+    Options are found by any of their spellings in ALIASES.
+    """
+    def __init__(self, text=''):
+        self.original = text
+        # [leading white space, word as typed, value]
+        self.words = []
+        end = 0
+        for match in WORD.finditer(text):
+            space, word = match.groups()
+            self.words.append([space, word, unquote(word)])
+            end = match.end()
+        self.trailing = text[end:]
+        self.modified = False
+        self.parsed = None
+
+    def __str__(self):
+        return self.text()
+
+    def __contains__(self, option):
+        return bool(self.find(option))
+
+    def text(self):
+        """
+        Return the command as text. The text given to the constructor is
+        returned unchanged if no option has been set or removed.
+        """
+        if not self.modified:
+            return self.original
+        return ''.join(space + word for space, word, value in
+                       self.words).strip()
+
+    def options(self):
+        """
+        Return a list of (option, value) tuples, with value None for flags,
+        in the order they appear. Words that are not options are skipped.
+        """
+        return [(self.words[i][2], None if j is None else self.words[j][2])
+                for i, j in self.parse()]
+
+    def parse(self):
+        """
+        Return a list of (index of option, index of value or None) tuples
+        for the options of self.words.
+        """
+        if self.parsed is not None:
+            return self.parsed
+        self.parsed = []
+        i = 0
+        while i < len(self.words):
+            value = self.words[i][2]
+            if is_option(value):
+                if (value not in streamcopy.FLAGS and i + 1 < len(self.words)
+                        and not is_option(self.words[i+1][2])):
+                    self.parsed.append((i, i + 1))
+                    i += 2
+                    continue
+                self.parsed.append((i, None))
+            i += 1
+        return self.parsed
+
+    def find(self, option):
+        """
+        Return the list of (index of option, index of value or None) tuples
+        of all the spellings of option.
+        """
+        name = CANONICAL.get(option, option)
+        return [(i, j) for i, j in self.parse()
+                if CANONICAL.get(self.words[i][2], self.words[i][2]) == name]
+
+    def get(self, option):
+        """
+        Return the value of option, '' if it is a flag, or None if it is not
+        set. If option is given more than once, the last one counts, as in
+        ffmpeg.
+        """
+        found = self.find(option)
+        if not found:
+            return None
+        value = found[-1][1]
+        return '' if value is None else self.words[value][2]
+
+    def changed(self):
+        self.modified = True
+        self.parsed = None
+
+    def set(self, option, value):
+        """
+        Set option to value, keeping the spelling and the position of the
+        option if it is already set, else add it at the end.
+        """
+        found = self.find(option)
+        if not found:
+            self.words.append([' ', option, option])
+            self.words.append([' ', quote(value), value])
+            self.changed()
+            return
+        i, j = found[0]
+        self.remove_words([k for pair in found[1:] for k in pair
+                           if k is not None])
+        if j is None:
+            self.words.insert(i + 1, [' ', quote(value), value])
+        elif self.words[j][2] != value:
+            self.words[j][1:] = [quote(value), value]
+        self.changed()
+
+    def remove(self, option):
+        """Remove option, with all its spellings, and its value."""
+        found = self.find(option)
+        if found:
+            self.remove_words([k for pair in found for k in pair
+                               if k is not None])
+            self.changed()
+
+    def remove_words(self, indexes):
+        for i in sorted(indexes, reverse=True):
+            del self.words[i]
+
+    def filters(self):
+        """Return the list of filters of -vf."""
+        return split_filters(self.get('-vf') or '')
+
+    def find_filter(self, name):
+        """Return the first filter of -vf with the given name or None."""
+        for _filter in self.filters():
+            if filter_name(_filter) == name:
+                return _filter
+        return None
+
+    def set_filters(self, filters):
+        """Set -vf to filters, or remove it if filters is empty."""
+        if filters:
+            self.set('-vf', ','.join(filters))
+        else:
+            self.remove('-vf')
+
+    def set_filter(self, names, new_filters):
+        """
+        Replace the filters of -vf whose names are in names with the list
+        new_filters, at the position of the first of them, or add
+        new_filters at the end of the chain if there is none.
+        """
+        filters = self.filters()
+        kept = [i for i in filters if filter_name(i) not in names]
+        if len(kept) == len(filters):
+            if new_filters:
+                self.set_filters(filters + new_filters)
+            return
+        position = 0
+        while filter_name(filters[position]) not in names:
+            position += 1
+        # keep the space after the comma of the replaced filters
+        new_filters = [i.strip() for i in new_filters]
+        if new_filters and position and filters[position].startswith(' '):
+            new_filters[0] = ' ' + new_filters[0]
+        filters = kept[:position] + new_filters + kept[position:]
+        if filters:
+            filters[0] = filters[0].lstrip()
+        self.set_filters(filters)
@@ -8,6 +8,79 @@ config_dir = os.path.join(home, '.config/ffmulticonverter/')
 
 default_ffmpeg_cmd = ''
 
+#-----conversion data
+
+# maximum number of files converted at the same time
+max_jobs = os.cpu_count() or 1
+# per-converter caps, the effective number of jobs is the smallest of
+# max_jobs and the cap of the converter in use
+max_ffmpeg_jobs = max_jobs
+max_imagemagick_jobs = max_jobs
+# each document converted at the same time needs its own office listener
+max_unoconv_jobs = min(max_jobs, 4)
+# number of parts that long videos are split into and encoded in parallel,
+# 1 encodes each video as a whole
+video_segments = 1
+# seconds, videos are split only into parts at least this long
+segment_min_duration = 300
+# copy the video or audio stream instead of encoding it when it already has
+# the requested codec and settings, see streamcopy.py
+stream_copy = True
+# number of images converted by one ImageMagick process,
+# see test/bench_image_batch.py
+imagemagick_batch_size = 16
+# convert common image formats in-process with Pillow, if it is installed
+use_pillow = True
+# port of the first office listener, the others use the next ports
+office_base_port = 2002
+# seconds to wait for an office listener to accept connections
+office_start_timeout = 30
+# seconds after which a document conversion is considered hung
+unoconv_timeout = 300
+# journal of the state of each job, so that interrupted batches can be
+# resumed, see journal.py
+use_journal = True
+journal_file = os.path.join(config_dir, 'jobs.db')
+# check each output, e.g. that ffprobe can read a converted video, before
+# it replaces its target and before its source is deleted
+verify_outputs = True
+# flush outputs to disk before they replace their targets, so that a crash
+# cannot leave an empty target behind
+sync_outputs = True
+# folder on fast local storage, e.g. a tmpfs or an SSD, where outputs are
+# written and then moved to their targets while the next files convert;
+# empty to write outputs next to their targets
+scratch_dir = ''
+# bytes that are always left free in scratch_dir, outputs that might not
+# fit are written next to their targets instead
+scratch_min_free = 1024**3
+# outputs of documents, and of images when their dimensions cannot be
+# read, are assumed to be at most this many times as big as their sources
+scratch_size_factor = 10
+# ask the kernel to read the next input ahead while converting
+prefetch_inputs = True
+
+#-----cache data
+
+# reuse the results of files that have been converted with the same settings
+use_cache = False
+cache_dir = os.path.join(config_dir, 'cache/')
+# bytes, the least recently used results are removed beyond it
+cache_max_size = 2 * 1024**3
+# results are hard linked into cache_dir; if True, those on other file
+# systems are copied there instead of not being cached
+cache_copy = False
+# seconds after which result files that no index refers to are removed
+cache_orphan_age = 24 * 3600
+# identify input files by a hash of their content instead of their path,
+# size and modification time; slower, but survives renames and copies
+cache_hash = False
+# ffprobe results of media files, see probe.py
+probe_cache_file = os.path.join(cache_dir, 'probe.json')
+probe_cache_entries = 50000
+# number of files probed at the same time
+probe_jobs = max(4, max_jobs)
+
 #-----log data
 
 log_dir = os.path.join(config_dir, 'logs/')
@@ -16,6 +89,17 @@ log_format  = '%(asctime)s : %(levelname)s - %(type)s\n' +\
               'Command: %(command)s\n' +\
               'Return code: %(returncode)s\n%(message)s\n'
 log_dateformat = '%Y-%m-%d %H:%M:%S'
+# number of the last lines of ffmpeg's output kept for the log
+output_buffer_lines = 1000
+# number of the last lines shown in the details of the Progress dialog
+log_view_lines = 5000
+# milliseconds between updates of the details of the Progress dialog
+log_view_interval = 100
+# the whole output of the last conversions; each Progress dialog writes its
+# own file, named after this one, e.g. last_conversion-1234-1.log
+last_output_file = os.path.join(log_dir, 'last_conversion.log')
+# number of the newest output files that are kept
+output_files_kept = 10
 
 #-----presets data
 
@@ -25,6 +109,14 @@ presets_lookup_dirs = ["/usr/local/share/", "/usr/share/"]
 presets_lookup_virtenv = 'share'
 # prefix for old presets when synchronizing
 presets_old = '__OLD'
+# milliseconds without typing after which presets are searched
+presets_search_delay = 150
+# milliseconds after the last change of the presets after which they are
+# written, they are also written when the presets dialog is closed
+presets_save_delay = 2000
+# parsed presets, loaded instead of presets.xml while it does not change
+use_presets_cache = True
+presets_cache_file = os.path.join(cache_dir, 'presets.json')
 
 #-----audiovideo data
 
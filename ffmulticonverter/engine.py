@@ -0,0 +1,1645 @@
+# Copyright (C) 2011-2015 Ilias Stamatis <stamatis.iliass@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Conversion engine.
+
+This module does not depend on Qt, so conversions can be driven from
+scripts and servers as well as from the Progress dialog.
+
+Example:
+    converter = engine.ImageConverter(size='640x480', mntaspect=True)
+    jobs = [engine.Job('/foo/bar.png', '/foo/bar.jpg')]
+    for event in engine.Engine(converter, jobs).iter_events():
+        print(event.kind, event.job, event.percent)
+"""
+
+import os
+import io
+import re
+import errno
+import time
+import codecs
+import itertools
+import queue
+import shlex
+import shutil
+import signal
+import logging
+import threading
+import traceback
+import subprocess
+import collections
+import multiprocessing
+import concurrent.futures
+
+from ffmulticonverter import config
+from ffmulticonverter import probe
+from ffmulticonverter import imaging
+from ffmulticonverter import journal
+from ffmulticonverter import office
+from ffmulticonverter import streamcopy
+
+
+# kinds of events emitted by Engine
+STARTED = 'started'    # a job started in a slot
+PROGRESS = 'progress'  # the progress percentage of a job changed
+OUTPUT = 'output'      # a converter printed some text
+FINISHED = 'finished'  # a job finished, successfully or not
+DONE = 'done'          # all jobs finished or the conversion was cancelled
+
+DURATION_RE = re.compile(r'Duration: ([0-9:.]+)')
+# time can be of format 'time=hh:mm:ss.ts' or 'time=ss.ts'
+# depending on ffmpeg version
+TIME_RE = re.compile(r'time=([0-9:.]+)')
+
+
+def is_installed(program):
+    """Return True if program appears in user's PATH var, else False."""
+    for path in os.getenv('PATH').split(os.pathsep):
+        fpath = os.path.join(path, program)
+        if os.path.exists(fpath) and os.access(fpath, os.X_OK):
+            return True
+    return False
+
+def create_paths_list(
+        files_list, ext_to, prefix, suffix, output, orig_dir,
+        overwrite_existing
+        ):
+    """
+    Create and return a list with a Job for each file to be converted.
+    The target of each job is the name of the new converted file.
+
+    Example list:
+    [Job('/foo/bar.png', '/foo/bar.bmp'), Job('/f/bar2.png', '/f/bar2.bmp')]
+
+    Keyword arguments:
+    files_list -- list with files to be converted
+    ext_to     -- the extension to which each file must be converted to
+    prefix     -- string that will be added as a prefix to all filenames
+    suffix     -- string that will be added as a suffix to all filenames
+    output     -- the output folder
+    orig_dir   -- if True, each file will be saved at its original directory
+                  else, files will be saved at output
+    overwrite_existing -- if True, existing files are overwritten, else
+                          their names are avoided too
+    Filenames that are used by another job get a '~' prefix, or '~2~',
+    '~3~' etc. if that is taken too, so that no two jobs write the same
+    file.
+    """
+    assert ext_to.startswith('.'), 'ext_to must start with a dot (.)'
+
+    conversion_list = []
+    # folder -> names of its files, unless they are overwritten, and of the
+    # targets planned so far; each folder is listed once
+    taken = {}
+    # (folder, name) -> counter of the last target with that name
+    counters = {}
+
+    for _file in files_list:
+        _dir, name = os.path.split(_file)
+        name = prefix + os.path.splitext(name)[0] + suffix + ext_to
+        folder = _dir if orig_dir else output
+
+        if folder not in taken:
+            taken[folder] = set()
+            if not overwrite_existing:
+                try:
+                    taken[folder] = set(os.listdir(folder))
+                except OSError:
+                    pass
+        names = taken[folder]
+        # names with smaller counters have been taken by previous jobs
+        count = counters.get((folder, name), 0)
+        while tilde_name(name, count) in names:
+            count += 1
+        counters[(folder, name)] = count
+        name = tilde_name(name, count)
+        names.add(name)
+
+        conversion_list.append(Job(_file, folder + '/' + name))
+
+    return conversion_list
+
+def tilde_name(name, count):
+    """Return name with the count-th prefix used to avoid name collisions."""
+    if count == 0:
+        return name
+    elif count == 1:
+        return '~' + name
+    return '~{0}~{1}'.format(count, name)
+
+_versions = {}
+_versions_lock = threading.Lock()
+
+def program_version(program):
+    """
+    Return the first line that program prints with --version, or an empty
+    string if it cannot be run. The result is computed once per program.
+    """
+    with _versions_lock:
+        if program not in _versions:
+            try:
+                output = subprocess.check_output(
+                        [program, '--version'], stderr=subprocess.STDOUT,
+                        stdin=subprocess.DEVNULL)
+                lines = output.decode('utf8', 'replace').strip().splitlines()
+                _versions[program] = lines[0] if lines else ''
+            except (OSError, subprocess.CalledProcessError):
+                _versions[program] = ''
+        return _versions[program]
+
+def duration_in_seconds(duration):
+    """
+    Return the number of seconds of duration, an integer.
+    Duration is a string of type hh:mm:ss.ts
+    """
+    duration = duration.split('.')[0] # get rid of milliseconds
+    hours, mins, secs = [int(i) for i in duration.split(':')]
+    return secs + (hours * 3600) + (mins * 60)
+
+def time_in_seconds(_time):
+    """
+    Return the number of seconds of _time, an integer.
+    _time is a string of type hh:mm:ss.ts or ss.ts
+    """
+    if ':' in _time:
+        return duration_in_seconds(_time)
+    return int(float(_time))
+
+def read_lines(stream, chunk_size=65536):
+    """
+    Read a binary stream in chunks until EOF and decode it as utf8.
+    For each chunk, yield the list of complete lines read so far.
+    Lines end with '\r' or '\n' which are kept.
+    """
+    decoder = codecs.getincrementaldecoder('utf8')('replace')
+    pending = ''
+    after_cr = False
+    while True:
+        chunk = stream.read1(chunk_size)
+        if not chunk:
+            break
+        lines = (pending + decoder.decode(chunk)).splitlines(True)
+        if after_cr and lines and lines[0] == '\n':
+            # the rest of a '\r\n' that was split between two reads
+            lines.pop(0)
+        if not lines:
+            # an incomplete multibyte character
+            continue
+        if lines[-1][-1] in '\r\n':
+            pending = ''
+        else:
+            pending = lines.pop()
+        if lines:
+            after_cr = not pending and lines[-1][-1] == '\r'
+            yield lines
+    pending += decoder.decode(b'', True)
+    if pending:
+        yield [pending]
+
+def read_progress(stream):
+    """
+    Read the output of ffmpeg's -progress option from stream and yield
+    a dict with the key=value pairs of each progress block.
+    """
+    block = {}
+    for lines in read_lines(stream):
+        for line in lines:
+            key, sep, value = line.strip().partition('=')
+            if not sep:
+                continue
+            block[key] = value
+            # 'progress' is the last key of each block
+            if key == 'progress':
+                yield block
+                block = {}
+
+def progress_time(block):
+    """Return the encoded seconds of a -progress block or None if unknown."""
+    # out_time_ms is also in microseconds in spite of its name
+    for key in ('out_time_us', 'out_time_ms'):
+        try:
+            return int(block[key]) / 1000000
+        except (KeyError, ValueError):
+            pass
+    return None
+
+def progress_value(block, key):
+    """
+    Return the value of key in a -progress block as a float, or None if
+    unknown. A trailing 'x' (e.g. speed=1.5x) is ignored.
+    """
+    try:
+        return float(block[key].rstrip('x'))
+    except (KeyError, ValueError):
+        return None
+
+def split_points(duration, keyframes, segments, min_length):
+    """
+    Return the keyframe times where a video of duration seconds should be
+    cut to get at most segments parts of about the same length, none of
+    them shorter than min_length seconds.
+    """
+    segments = min(segments, int(duration // min_length))
+    points = []
+    for i in range(1, segments):
+        target = duration * i / segments
+        # the first keyframe at or after target
+        later = [t for t in keyframes if t >= target]
+        if not later:
+            break
+        point = later[0]
+        previous = points[-1] if points else 0
+        if point - previous >= min_length and duration - point >= min_length:
+            points.append(point)
+    return points
+
+def setup_logging():
+    """Save the log of all conversions in config.log_file."""
+    if not os.path.exists(config.log_dir):
+        os.makedirs(config.log_dir)
+
+    logging.basicConfig(
+            filename=config.log_file,
+            level=logging.DEBUG,
+            format=config.log_format,
+            datefmt=config.log_dateformat
+            )
+
+def cmdline(cmd):
+    """Return the argument list cmd as a string suitable for a shell."""
+    return ' '.join(shlex.quote(i) for i in cmd)
+
+def log_conversion(cmd, return_code, output, _type):
+    """Save log information about a finished conversion."""
+    log_data = {
+            'command' : cmdline(cmd),
+            'returncode' : return_code,
+            'type' : _type
+            }
+    log_lvl = logging.info if return_code == 0 else logging.error
+    log_lvl(output, extra=log_data)
+
+
+def temp_name(target):
+    """
+    Return the name of the hidden file next to target where target is
+    written before it is complete, e.g. /a/.b.part.mp4 for /a/b.mp4.
+    The extension is kept because converters choose the format by it.
+    """
+    folder, name = os.path.split(target)
+    root, ext = os.path.splitext(name)
+    return os.path.join(folder, '.' + root + '.part' + ext)
+
+
+def remove_file(path):
+    """Remove path if it exists."""
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def sync_file(path):
+    """Flush the data of file or folder path to disk."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def move_file(source, target, sync=True):
+    """
+    Replace target with source at once. If they are on different file
+    systems, source is copied to a temporary file next to target first.
+    If sync is True, the data is flushed to disk before it replaces target.
+    """
+    try:
+        if sync:
+            sync_file(source)
+        os.replace(source, target)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        tmp = temp_name(target)
+        try:
+            shutil.copyfile(source, tmp)
+            if sync:
+                sync_file(tmp)
+            os.replace(tmp, target)
+        except OSError:
+            remove_file(tmp)
+            raise
+        remove_file(source)
+    if sync:
+        sync_file(os.path.dirname(target) or '.')
+
+def readahead(path):
+    """Ask the kernel to start reading path into the page cache."""
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class Job(object):
+    """
+    A file to be converted: source will be converted to target.
+    weight is the expected amount of work, e.g. the duration of a video
+    or the size of an image, and is measured by the Engine if not given.
+    Converters write to output, which the Engine points to a temporary
+    file and renames to target once the conversion succeeds.
+    """
+    def __init__(self, source, target, weight=None):
+        self.source = source
+        self.target = target
+        self.weight = weight
+        self.output = target
+
+    def __repr__(self):
+        return 'Job({0!r}, {1!r})'.format(self.source, self.target)
+
+
+Result = collections.namedtuple('Result', ['job', 'success'])
+
+
+class Event(object):
+    """
+    Something that happened during a conversion.
+
+    Attributes:
+    kind    -- one of STARTED, PROGRESS, OUTPUT, FINISHED and DONE
+    slot    -- number of the worker that emitted the event
+    job     -- the Job that the event refers to
+    percent -- conversion progress of job (PROGRESS events)
+    speed   -- encoding speed relative to playback speed, e.g. 2.0 means
+               twice as fast as real time (PROGRESS events, ffmpeg only)
+    fps     -- frames encoded per second (PROGRESS events, ffmpeg only)
+    eta     -- estimated seconds until job finishes (PROGRESS events,
+               ffmpeg only)
+    text    -- converter's output (OUTPUT events)
+    result  -- the Result of job (FINISHED events)
+    total_percent -- progress of all jobs weighted by their expected
+                     work (PROGRESS and FINISHED events)
+    total_eta     -- estimated seconds until all jobs finish, None while
+                     unknown (PROGRESS and FINISHED events)
+    """
+    def __init__(self, kind, slot=None, job=None, percent=None, speed=None,
+                 fps=None, eta=None, text=None, result=None,
+                 total_percent=None, total_eta=None):
+        self.kind = kind
+        self.slot = slot
+        self.job = job
+        self.percent = percent
+        self.speed = speed
+        self.fps = fps
+        self.eta = eta
+        self.text = text
+        self.result = result
+        self.total_percent = total_percent
+        self.total_eta = total_eta
+
+    def __repr__(self):
+        return 'Event({0!r}, slot={1!r}, job={2!r})'.format(
+                self.kind, self.slot, self.job)
+
+
+class Converter(object):
+    """
+    Base class of converters.
+
+    Subclasses implement command() and may override convert() if they need
+    to parse the output of the conversion process while it runs.
+    Converters that can convert many files with one process set batch_size
+    and override convert_batch().
+    """
+    name = None
+    max_jobs = config.max_jobs
+    batch_size = 1
+
+    def __init__(self, max_jobs=None):
+        if max_jobs is not None:
+            self.max_jobs = max_jobs
+
+    def command(self, job):
+        """Return the argument list of the process that converts job."""
+        raise NotImplementedError
+
+    def settings(self):
+        """
+        Return a dict of the settings of the converter, from which
+        converter_from_settings() creates an equivalent converter, e.g. to
+        resume a batch.
+        """
+        return {'type' : self.name}
+
+    def cache_settings(self, job):
+        """
+        Return a list of strings that describes how job is converted,
+        whatever its file names are. Cached results of job are used only
+        for conversions with the same settings.
+        """
+        ext = os.path.splitext(job.target)[1]
+        cmd = self.command(Job('SOURCE', 'TARGET' + ext))
+        return [self.name, program_version(cmd[0])] + cmd
+
+    def verify(self, job):
+        """
+        Check the output of a conversion that reported success.
+        Return None if it is fine, else a message describing the problem.
+        """
+        try:
+            if os.path.getsize(job.output) == 0:
+                return 'Output is empty'
+        except OSError:
+            return 'Output is missing'
+        return None
+
+    def estimate_output_size(self, job):
+        """
+        Return the bytes that the output of job is expected to take at
+        most, including the temporary files of its conversion. Room is
+        reserved for them in the scratch folder. The output is assumed to be
+        at most as big as the source.
+        """
+        try:
+            return os.path.getsize(job.source)
+        except OSError:
+            return 0
+
+    def weight(self, job):
+        """
+        Return the expected amount of work needed to convert job, used to
+        weight its share of the total progress, or None if unknown.
+        The size of the source file is a fair estimation for most files.
+        """
+        try:
+            return os.path.getsize(job.source)
+        except OSError:
+            return None
+
+    def convert(self, engine, slot, job):
+        """
+        Execute the conversion command of job and wait for it to finish.
+        Report the output of the process through engine and save log
+        information.
+
+        Return True if conversion succeed, else False.
+        """
+        return self.run_command(engine, slot, job, self.command(job)) == 0
+
+    def convert_batch(self, engine, slot, jobs):
+        """
+        Convert all jobs, at most batch_size of them.
+        Return a list with True for each job that converted successfully,
+        else False.
+        """
+        return [self.convert(engine, slot, job) for job in jobs]
+
+    def close(self):
+        """Release the resources of the converter after a conversion."""
+        pass
+
+    def run_command(self, engine, slot, job, cmd, on_start=None):
+        """
+        Execute cmd and wait for it to finish. Report the output of the
+        process through engine and save log information.
+        on_start, if given, is called with the process once it starts.
+
+        Return the exit code of the process or None if it did not start.
+        """
+        engine.output(slot, job, cmdline(cmd) + '\n')
+        child = engine.start_process(slot, cmd)
+        if child is None:
+            return None
+        if on_start is not None:
+            on_start(child)
+
+        reader = io.TextIOWrapper(child.stdout, encoding='utf8')
+        final_output = reader.read()
+        engine.output(slot, job, final_output + '\n\n')
+
+        return_code = engine.finish_process(slot)
+        log_conversion(cmd, return_code, final_output, self.name)
+
+        return return_code
+
+
+class VideoConverter(Converter):
+    name = 'VIDEO'
+    max_jobs = config.max_ffmpeg_jobs
+
+    def __init__(self, converter='ffmpeg', command='', max_jobs=None,
+                 segments=None, stream_copy=None):
+        """
+        Keyword arguments:
+        converter   -- ffmpeg or avconv
+        command     -- extra ffmpeg parameters
+        max_jobs    -- number of files that may be converted in parallel
+        segments    -- number of parts that long videos are split into and
+                       encoded in parallel, 1 disables splitting
+        stream_copy -- if True, copy streams that already have the requested
+                       codec and settings, config.stream_copy by default
+        """
+        super(VideoConverter, self).__init__(max_jobs)
+        self.converter = converter
+        self.cmd = command
+        self.segments = segments or config.video_segments
+        self.stream_copy = stream_copy if stream_copy is not None else \
+                config.stream_copy
+        # avconv's progress is scraped from its statistics lines instead
+        self.progress_pipe = os.path.basename(converter) == 'ffmpeg'
+
+    def command(self, job, args=None):
+        """
+        Return the command that converts job. args are the ffmpeg output
+        parameters, self.cmd by default.
+        """
+        progress = []
+        if self.progress_pipe:
+            progress = ['-nostats', '-progress', 'pipe:1']
+        if args is None:
+            args = shlex.split(self.cmd)
+        return ([self.converter, '-y'] + progress + ['-i', job.source] +
+                args + [job.output])
+
+    def settings(self):
+        settings = super(VideoConverter, self).settings()
+        settings.update({
+                'converter' : self.converter,
+                'command' : self.cmd,
+                'segments' : self.segments,
+                'stream_copy' : self.stream_copy
+                })
+        return settings
+
+    def cache_settings(self, job):
+        settings = super(VideoConverter, self).cache_settings(job)
+        if self.stream_copy:
+            settings = ['stream copy'] + settings
+        return settings
+
+    def plan_stream_copy(self, engine, slot, job):
+        """
+        Return the ffmpeg output parameters for job, with '-c:v copy' or
+        '-c:a copy' for the streams of job's source that need no encoding,
+        or None if all streams are encoded. The decisions are reported
+        through engine.
+        """
+        if not self.stream_copy:
+            return None
+        args = shlex.split(self.cmd)
+        new_args, decisions = streamcopy.plan(args, probe.streams(job.source))
+        engine.output(slot, job, ''.join(
+                'Stream copy: {0}\n'.format(i) for i in decisions))
+        return new_args if new_args != args else None
+
+    def verify(self, job):
+        error = super(VideoConverter, self).verify(job)
+        if error is None and probe.prober is not None:
+            # the output is probed without caching, it is a temporary file
+            result = probe.run_prober(job.output)
+            if result is None or not result['streams']:
+                error = 'Output cannot be read by ' + probe.prober
+        return error
+
+    def weight(self, job):
+        """Return the duration of job's source in seconds."""
+        return probe.duration(job.source)
+
+    def estimate_output_size(self, job):
+        size = super(VideoConverter, self).estimate_output_size(job)
+        if self.segments > 1:
+            # the parts are joined next to the output
+            size *= 2
+        return size
+
+    def convert(self, engine, slot, job):
+        """
+        Execute the ffmpeg command. While the process is alive, parse ffmpeg
+        output and estimate conversion progress using video's duration.
+        Report the progress and ffmpeg's output through engine and finally,
+        save log information.
+
+        Return True if conversion succeed, else False.
+        """
+        args = self.plan_stream_copy(engine, slot, job)
+        # copying streams is fast enough without splitting
+        points = self.plan_segments(job) if args is None else []
+        if points:
+            return self.convert_segments(engine, slot, job, points)
+
+        cmd = self.command(job, args)
+        engine.output(slot, job, cmdline(cmd) + '\n')
+        state = {'total' : None}
+
+        if self.progress_pipe:
+            process = engine.start_process(slot, cmd, subprocess.PIPE)
+            if process is None:
+                return False
+            # the log comes from stderr and the progress from stdout
+            log = []
+            thread = threading.Thread(
+                    target=lambda: log.append(self.parse_output(
+                        engine, slot, job, process.stderr, state, False)))
+            thread.start()
+            self.parse_progress(engine, slot, job, process.stdout, state)
+            thread.join()
+            final_output = log[0]
+        else:
+            process = engine.start_process(slot, cmd)
+            if process is None:
+                return False
+            final_output = self.parse_output(
+                    engine, slot, job, process.stdout, state, True)
+        engine.output(slot, job, '\n\n')
+
+        return_code = engine.finish_process(slot)
+        log_conversion(cmd, return_code, ''.join(final_output), self.name)
+
+        return return_code == 0
+
+    def plan_segments(self, job):
+        """
+        Return the times where job's source will be cut to be encoded in
+        parallel, or an empty list if it will be encoded as a whole, e.g.
+        because its duration cannot be probed.
+        """
+        if self.segments < 2 or not self.progress_pipe:
+            return []
+        # the segments are cut with these options
+        if set(shlex.split(self.cmd)) & set(['-ss', '-t', '-to']):
+            return []
+        # job.weight may be the average of the batch, not a duration
+        duration = probe.duration(job.source)
+        if not duration or duration < 2 * config.segment_min_duration:
+            return []
+        keyframes = probe.keyframes(job.source)
+        if not keyframes:
+            return []
+        return split_points(duration, keyframes, self.segments,
+                            config.segment_min_duration)
+
+    def segment_command(self, job, start, end, target):
+        """Return the command that encodes job from start to end seconds."""
+        cut = []
+        if end is not None:
+            cut = ['-t', '{0:.6f}'.format(end - start)]
+        return ([self.converter, '-y', '-nostats', '-progress', 'pipe:1',
+                 '-ss', '{0:.6f}'.format(start), '-i', job.source] + cut +
+                shlex.split(self.cmd) + [target])
+
+    def convert_segments(self, engine, slot, job, points):
+        """
+        Encode the parts of job between points in parallel and join them
+        with ffmpeg's concat demuxer, without encoding them again.
+        The progress of all parts is reported as the progress of job.
+
+        Return True if conversion succeed, else False.
+        """
+        folder = job.output + '.parts'
+        os.makedirs(folder, exist_ok=True)
+        ext = os.path.splitext(job.target)[1]
+        starts = [0] + points
+        ends = points + [None]
+        parts = [os.path.join(folder, 'part{0:03d}{1}'.format(i, ext))
+                 for i in range(len(starts))]
+        # probed by plan_segments(), so it is cached
+        total = probe.duration(job.source)
+        # seconds, speed and fps of each part
+        done = [[0, None, None] for i in parts]
+        lock = threading.Lock()
+
+        def report(i, block):
+            now_sec = progress_time(block)
+            if now_sec is None:
+                return
+            with lock:
+                done[i] = [now_sec, progress_value(block, 'speed'),
+                           progress_value(block, 'fps')]
+                encoded = sum(i[0] for i in done)
+                speeds = [i[1] for i in done if i[1] is not None]
+                fps = [i[2] for i in done if i[2] is not None]
+                speed = sum(speeds) if speeds else None
+                eta = max(0, (total - encoded) / speed) if speed else None
+                engine.progress(slot, job, int(100 * encoded / total), speed,
+                                sum(fps) if fps else None, eta)
+
+        def encode(i):
+            cmd = self.segment_command(job, starts[i], ends[i], parts[i])
+            engine.output(slot, job, cmdline(cmd) + '\n')
+            # parts are registered under their own keys so that all of them
+            # are paused or killed together with the job
+            key = (slot, i)
+            process = engine.start_process(key, cmd, subprocess.PIPE)
+            if process is None:
+                return False
+            log = []
+            thread = threading.Thread(
+                    target=lambda: log.append(self.parse_output(
+                        engine, slot, job, process.stderr, {'total' : 0},
+                        False)))
+            thread.start()
+            for block in read_progress(process.stdout):
+                report(i, block)
+            thread.join()
+            return_code = engine.finish_process(key)
+            log_conversion(cmd, return_code, ''.join(log[0]), self.name)
+            return return_code == 0
+
+        try:
+            with concurrent.futures.ThreadPoolExecutor(len(parts)) as executor:
+                results = list(executor.map(encode, range(len(parts))))
+            if not all(results):
+                return False
+
+            concat_list = os.path.join(folder, 'parts.txt')
+            with open(concat_list, 'w', encoding='utf8') as f:
+                for part in parts:
+                    f.write("file '{0}'\n".format(part.replace("'", "'\\''")))
+            cmd = [self.converter, '-y', '-f', 'concat', '-safe', '0', '-i',
+                   concat_list, '-c', 'copy', job.output]
+            return self.run_command(engine, slot, job, cmd) == 0
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    def parse_output(self, engine, slot, job, stream, state, scrape_time):
+        """
+        Read ffmpeg's human readable output from stream, report it through
+        engine and store input's duration in state['total'].
+        If scrape_time is True, estimate conversion progress from the
+        statistics lines too.
+
+        Return a deque with the last lines of the output.
+        """
+        final_output = collections.deque(maxlen=config.output_buffer_lines)
+        for lines in read_lines(stream):
+            if state['total'] is None:
+                for line in lines:
+                    m = DURATION_RE.search(line)
+                    if m:
+                        state['total'] = duration_in_seconds(m.group(1))
+                        break
+            # only the most recent time is needed to estimate progress
+            for line in reversed(lines) if scrape_time else ():
+                n = TIME_RE.search(line)
+                if n:
+                    if state['total']:
+                        now_sec = time_in_seconds(n.group(1))
+                        engine.progress(
+                                slot, job, int(100 * now_sec / state['total']))
+                    break
+            final_output.extend(lines)
+            engine.output(slot, job, ''.join(lines))
+        return final_output
+
+    def parse_progress(self, engine, slot, job, stream, state):
+        """
+        Read the key=value blocks that ffmpeg writes to stream because of
+        the -progress option and report progress, speed, fps and estimated
+        remaining time through engine.
+        """
+        for block in read_progress(stream):
+            total = state['total']
+            now_sec = progress_time(block)
+            if not total or now_sec is None:
+                continue
+            speed = progress_value(block, 'speed')
+            fps = progress_value(block, 'fps')
+            eta = None
+            if speed:
+                eta = max(0, (total - now_sec) / speed)
+            engine.progress(slot, job, int(100 * now_sec / total), speed, fps,
+                            eta)
+
+
+class ImageConverter(Converter):
+    name = 'IMAGE'
+    max_jobs = config.max_imagemagick_jobs
+    batch_size = config.imagemagick_batch_size
+
+    def __init__(self, size='', mntaspect=False, imgcmd='', max_jobs=None,
+                 batch_size=None, use_pillow=None):
+        """
+        Keyword arguments:
+        size       -- new image size, string of type WIDTHxHEIGHT
+        mntaspect  -- if True, maintain the aspect ratio when resizing
+        imgcmd     -- extra ImageMagick parameters
+        max_jobs   -- number of files that may be converted in parallel
+        batch_size -- number of files converted by one convert process
+        use_pillow -- if True, convert common formats with Pillow when it
+                      is installed, defaults to config.use_pillow
+        """
+        super(ImageConverter, self).__init__(max_jobs)
+        self.size = size
+        self.mntaspect = mntaspect
+        self.imgcmd = imgcmd
+        if batch_size is not None:
+            self.batch_size = batch_size
+
+        if use_pillow is None:
+            use_pillow = config.use_pillow
+        self.use_pillow = use_pillow
+        # None if the conversion needs ImageMagick
+        self.pillow_operations = None
+        if use_pillow and imaging.available:
+            self.pillow_operations = imaging.parse_operations(
+                    size, mntaspect, imgcmd)
+        self.pool = None
+        self.pool_lock = threading.Lock()
+
+    def operations(self):
+        """Return the ImageMagick arguments applied to each image."""
+        resize = []
+        if self.size:
+            resize = ['-resize', self.size if self.mntaspect else
+                      self.size + '!']
+        return resize + shlex.split(self.imgcmd)
+
+    def command(self, job):
+        return ['convert', job.source] + self.operations() + [job.output]
+
+    def batch_command(self, jobs):
+        """
+        Return the argument list of one convert process that converts all
+        jobs. Each image is read, processed and written inside its own
+        parentheses and then removed from the image list, e.g.
+        convert ( a.png -flip -write a.jpg +delete ) b.png -flip b.jpg
+        """
+        operations = self.operations()
+        cmd = ['convert']
+        for job in jobs[:-1]:
+            cmd += (['(', job.source] + operations +
+                    ['-write', job.output, '+delete', ')'])
+        return cmd + self.command(jobs[-1])[1:]
+
+    def settings(self):
+        settings = super(ImageConverter, self).settings()
+        settings.update({
+                'size' : self.size,
+                'mntaspect' : self.mntaspect,
+                'imgcmd' : self.imgcmd,
+                'batch_size' : self.batch_size,
+                'use_pillow' : self.use_pillow
+                })
+        return settings
+
+    def cache_settings(self, job):
+        settings = super(ImageConverter, self).cache_settings(job)
+        if self.can_use_pillow(job):
+            settings = ['pillow', imaging.version] + settings
+        return settings
+
+    def estimate_output_size(self, job):
+        """
+        Return the size of the uncompressed pixels of job's source, which
+        formats like BMP or TIFF write as they are, or a multiple of the
+        size of the source if its dimensions cannot be read.
+        """
+        size = super(ImageConverter, self).estimate_output_size(job)
+        raw = imaging.raw_size(job.source)
+        if raw is None:
+            return size * config.scratch_size_factor
+        return max(size, raw)
+
+    def can_use_pillow(self, job):
+        """Return True if job can be converted with Pillow."""
+        return (self.pillow_operations is not None and
+                imaging.supported(job.source) and
+                imaging.supported(job.target))
+
+    def convert_batch(self, engine, slot, jobs):
+        """
+        Convert the jobs that Pillow can handle in the process pool and the
+        rest, as well as the ones that Pillow failed to convert, with
+        ImageMagick.
+        """
+        successes = [False] * len(jobs)
+        pillow = [i for i, job in enumerate(jobs) if self.can_use_pillow(job)]
+        if pillow:
+            converted = self.convert_with_pillow(
+                    engine, slot, [jobs[i] for i in pillow])
+            for i, success in zip(pillow, converted):
+                successes[i] = success
+
+        rest = [i for i in range(len(jobs)) if not successes[i]]
+        if rest and not engine.cancelled:
+            converted = self.convert_with_imagemagick(
+                    engine, slot, [jobs[i] for i in rest])
+            for i, success in zip(rest, converted):
+                successes[i] = success
+        return successes
+
+    def get_pool(self):
+        """Return the process pool of Pillow conversions, creating it once."""
+        with self.pool_lock:
+            if self.pool is None:
+                # forking a multithreaded program is not safe
+                self.pool = concurrent.futures.ProcessPoolExecutor(
+                        self.max_jobs,
+                        mp_context=multiprocessing.get_context('spawn'))
+            return self.pool
+
+    def close(self):
+        with self.pool_lock:
+            if self.pool is not None:
+                self.pool.shutdown()
+                self.pool = None
+
+    def convert_with_pillow(self, engine, slot, jobs):
+        """
+        Convert jobs in the processes of the pool.
+        Return a list with True for each job that converted successfully,
+        else False.
+        """
+        pool = self.get_pool()
+        futures = [pool.submit(imaging.convert, job.source, job.output,
+                               self.pillow_operations) for job in jobs]
+        successes = []
+        for job, future in zip(jobs, futures):
+            if engine.cancelled:
+                future.cancel()
+                successes.append(False)
+                continue
+            try:
+                error = future.result()
+            except Exception as e:
+                # e.g. a process of the pool was killed
+                error = str(e)
+            cmd = ['pillow'] + self.command(job)[1:]
+            engine.output(slot, job, cmdline(cmd) + '\n')
+            if error is not None:
+                engine.output(slot, job, error + '\n')
+            log_conversion(cmd, 0 if error is None else 1, error or '',
+                           self.name)
+            successes.append(error is None)
+        return successes
+
+    def convert_with_imagemagick(self, engine, slot, jobs):
+        """
+        Convert all jobs with one convert process. If it fails, the
+        successful conversions cannot be told apart, so every job is
+        converted again on its own.
+        """
+        if len(jobs) == 1:
+            return [self.convert(engine, slot, jobs[0])]
+        return_code = self.run_command(
+                engine, slot, jobs[0], self.batch_command(jobs))
+        if return_code == 0 and all(
+                os.path.exists(job.output) for job in jobs):
+            return [True] * len(jobs)
+        if return_code is not None:
+            engine.output(slot, jobs[0],
+                          'Batch failed, converting one file at a time\n')
+        return [self.convert(engine, slot, job) for job in jobs]
+
+
+class DocumentConverter(Converter):
+    """
+    Convert documents with unoconv. Each conversion uses its own office
+    listener from office.get_pool(), so that max_jobs documents can be
+    converted in parallel.
+    """
+    name = 'DOCUMENT'
+    max_jobs = config.max_unoconv_jobs
+
+    def estimate_output_size(self, job):
+        # e.g. exported images and PDFs of text documents are much bigger
+        return super(DocumentConverter, self).estimate_output_size(job) * \
+                config.scratch_size_factor
+
+    def command(self, job, port=None):
+        to_ext = os.path.splitext(job.target)[1]
+        server = []
+        if port is not None:
+            # never let unoconv start an office process of its own
+            server = ['-n', '-p', str(port)]
+        return (['unoconv'] + server +
+                ['-f', to_ext[1:], '-o', job.output, job.source])
+
+    def convert(self, engine, slot, job):
+        """
+        Convert job using a listener of the pool. A conversion that takes
+        longer than config.unoconv_timeout seconds is killed and its
+        listener is restarted before it is used again.
+
+        Return True if conversion succeed, else False.
+        """
+        pool = office.get_pool(self.max_jobs)
+        listener = pool.acquire()
+        if listener is None:
+            engine.output(slot, job, 'Office listener could not start\n')
+            return False
+
+        timers = []
+        def on_start(process):
+            timer = threading.Timer(config.unoconv_timeout, process.kill)
+            timer.daemon = True
+            timer.start()
+            timers.append(timer)
+
+        return_code = None
+        try:
+            return_code = self.run_command(
+                    engine, slot, job, self.command(job, listener.port),
+                    on_start)
+        finally:
+            hung = False
+            for timer in timers:
+                # a timer that has fired cannot be cancelled any more
+                hung = not timer.is_alive() and not engine.cancelled
+                timer.cancel()
+            pool.release(listener, not hung)
+        return return_code == 0
+
+
+def converter_from_settings(settings, max_jobs=None):
+    """
+    Return a new converter with the given settings, as returned by
+    Converter.settings(), that converts up to max_jobs files in parallel.
+    """
+    settings = dict(settings)
+    classes = dict((i.name, i) for i in
+                   (VideoConverter, ImageConverter, DocumentConverter))
+    return classes[settings.pop('type')](max_jobs=max_jobs, **settings)
+
+
+class Engine(object):
+    def __init__(self, converter, jobs, max_jobs=None, delete=False,
+                 callback=None, cache=None, journal=None, replaces=None,
+                 scratch_dir=None):
+        """
+        Keyword arguments:
+        converter -- a Converter instance used for all jobs
+        jobs      -- list of Job instances
+        max_jobs  -- maximum number of files converted at the same time,
+                     limited further by converter.max_jobs
+        delete    -- if True, remove each source file after its successful
+                     conversion
+        callback  -- function called with an Event for everything that
+                     happens during the conversion. It is called from the
+                     worker threads.
+        cache     -- a cache.ResultCache; unchanged files whose result is
+                     in the cache are not converted again
+        journal   -- a journal.Journal where the batch and the state of
+                     each job are recorded, so that it can be resumed
+        replaces  -- id of the journal batch that this one resumes
+        scratch_dir -- folder on fast storage where outputs are written
+                       and then moved to their targets in the background,
+                       config.scratch_dir by default
+        """
+        self.converter = converter
+        self.jobs = list(jobs)
+        self.delete = delete
+        self.cache = cache
+        self.journal = journal
+        self.replaces = replaces
+        self.batch = None
+        # id of job -> index of job in the journal batch
+        self.indexes = dict((id(job), i) for i, job in enumerate(self.jobs))
+
+        if scratch_dir is None:
+            scratch_dir = config.scratch_dir
+        self.scratch_dir = scratch_dir if scratch_dir and \
+                os.path.isdir(scratch_dir) else None
+        # moves outputs from the scratch folder, one at a time
+        self.mover = None
+        # bytes reserved in the scratch folder by staged batches
+        self.scratch_reserved = 0
+        self.staged = 0
+        self.scratch_free = threading.Condition()
+        self.scratch_names = itertools.count()
+        self.callbacks = [callback] if callback is not None else []
+
+        if max_jobs is None:
+            max_jobs = config.max_jobs
+        self.max_jobs = max(
+                1, min(max_jobs, converter.max_jobs, len(self.jobs)))
+
+        self.ok = 0
+        self.error = 0
+        self.results = []
+        # ids of the jobs whose FINISHED event has been emitted
+        self.reported = set()
+
+        self.queue = collections.deque(self.jobs)
+        self.lock = threading.Lock()
+        self.running = threading.Event()
+        self.running.set()
+        self.cancelled = False
+        self.threads = []
+        self.manager = None
+        self.processes = {}  # slot -> running child process
+
+        # weighted progress: the work of finished jobs and the fraction of
+        # the jobs running in each slot, slot -> (weight, fraction)
+        self.total_weight = 0
+        self.done_weight = 0
+        self.fractions = {}
+        self.start_time = None
+        self.paused_at = None
+        self.paused_time = 0
+
+    def emit(self, event):
+        """Pass event to all callbacks."""
+        for callback in self.callbacks:
+            callback(event)
+
+    def output(self, slot, job, text):
+        self.emit(Event(OUTPUT, slot, job, text=text))
+
+    def progress(self, slot, job, percent, speed=None, fps=None, eta=None):
+        with self.lock:
+            weight = self.fractions[slot][0]
+            self.fractions[slot] = (weight, min(max(percent, 0), 100) / 100)
+            total_percent, total_eta = self.total_progress()
+        self.emit(Event(PROGRESS, slot, job, percent=percent, speed=speed,
+                        fps=fps, eta=eta, total_percent=total_percent,
+                        total_eta=total_eta))
+
+    def measure(self):
+        """
+        Set the weight of all jobs that do not have one, probing their
+        files in parallel. Jobs whose weight cannot be measured count as
+        the average job.
+        """
+        unknown = [i for i in self.jobs if i.weight is None]
+        if unknown:
+            workers = max(4, self.max_jobs)
+            with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+                weights = executor.map(self.converter.weight, unknown)
+                for job, weight in zip(unknown, weights):
+                    job.weight = weight if weight and weight > 0 else None
+        known = [i.weight for i in self.jobs if i.weight is not None]
+        average = sum(known) / len(known) if known else 1
+        for job in self.jobs:
+            if job.weight is None:
+                job.weight = average
+        self.total_weight = sum(i.weight for i in self.jobs)
+
+    def total_progress(self):
+        """
+        Return the percentage of the total work that has been done and the
+        estimated seconds until all jobs finish, or None if not known yet.
+        The estimation assumes that the rest of the work will be done at
+        the throughput observed so far. Must be called with self.lock held.
+        """
+        if not self.total_weight:
+            return 0, None
+        done = self.done_weight + sum(
+                weight * fraction for weight, fraction in
+                self.fractions.values())
+        percent = min(int(100 * done / self.total_weight), 100)
+        eta = None
+        if done > 0 and self.start_time is not None:
+            elapsed = time.time() - self.start_time - self.paused_time
+            if elapsed > 0:
+                eta = max(0, elapsed * (self.total_weight - done) / done)
+        return percent, eta
+
+    def start(self):
+        """
+        Start the conversion in the background and return immediately.
+        Jobs are measured first and then a worker thread is started for
+        each slot.
+        """
+        self.manager = threading.Thread(target=self.manage)
+        self.manager.daemon = True
+        self.manager.start()
+
+    def manage(self):
+        """
+        Measure the jobs, run the workers and emit DONE at the end.
+        If something fails unexpectedly, the jobs that have not finished
+        are reported as failed, so that DONE is always emitted.
+        """
+        try:
+            if self.jobs:
+                self.run_workers()
+        except Exception:
+            self.fail_jobs(None, self.jobs, traceback.format_exc())
+        if self.batch is not None:
+            self.journal.release_batch(self.batch)
+        self.emit(Event(DONE))
+
+    def run_workers(self):
+        if self.journal is not None:
+            self.batch = self.journal.create_batch(
+                    self.converter.settings(), self.delete, self.jobs,
+                    self.replaces)
+        self.measure()
+        if self.scratch_dir is not None:
+            self.mover = concurrent.futures.ThreadPoolExecutor(1)
+        self.start_time = time.time()
+        for slot in range(self.max_jobs):
+            thread = threading.Thread(target=self.worker, args=(slot,))
+            thread.daemon = True
+            self.threads.append(thread)
+            thread.start()
+        for thread in self.threads:
+            thread.join()
+        if self.mover is not None:
+            self.mover.shutdown()
+        self.converter.close()
+        probe.save()
+        if self.cache is not None:
+            self.cache.save()
+        # cancelled batches can be resumed
+        if self.journal is not None and not self.cancelled:
+            self.journal.finish_batch(self.batch)
+
+    def wait(self):
+        """Block until the conversion ends."""
+        if self.manager is not None:
+            self.manager.join()
+
+    def run(self):
+        """Convert all jobs, block until finished and return the results."""
+        self.start()
+        self.wait()
+        return self.results
+
+    def iter_events(self):
+        """Start the conversion and yield its events, DONE being the last."""
+        events = queue.Queue()
+        self.callbacks.append(events.put)
+        self.start()
+        while True:
+            event = events.get()
+            yield event
+            if event.kind == DONE:
+                break
+
+    def finished(self):
+        """Return True if all jobs have been processed."""
+        return self.ok + self.error >= len(self.jobs)
+
+    def send_signal_to_children(self, sig):
+        """Send sig to all running conversion processes."""
+        with self.lock:
+            for process in self.processes.values():
+                try:
+                    process.send_signal(sig)
+                except OSError:
+                    pass
+
+    def pause(self):
+        """Stop running processes and do not start new jobs until resumed."""
+        with self.lock:
+            if self.paused_at is None:
+                self.paused_at = time.time()
+        self.running.clear()
+        self.send_signal_to_children(signal.SIGSTOP)
+
+    def resume(self):
+        """Continue a paused conversion."""
+        self.send_signal_to_children(signal.SIGCONT)
+        with self.lock:
+            if self.paused_at is not None:
+                self.paused_time += time.time() - self.paused_at
+                self.paused_at = None
+        self.running.set()
+
+    def cancel(self):
+        """Kill all running processes and drop the remaining jobs."""
+        with self.lock:
+            self.cancelled = True
+            for process in self.processes.values():
+                process.kill()
+        self.running.set()
+
+    def worker(self, slot):
+        """
+        Convert jobs from the queue, one batch after the other, until it is
+        empty or the conversion is cancelled. Runs in its own thread.
+        """
+        while True:
+            self.running.wait()
+            with self.lock:
+                if self.cancelled or not self.queue:
+                    break
+                jobs = self.take_jobs()
+                self.fractions[slot] = (sum(i.weight for i in jobs), 0)
+                upcoming = self.queue[0].source if self.queue else None
+
+            try:
+                for job in jobs:
+                    self.emit(Event(STARTED, slot, job))
+                self.journal_state(jobs, journal.RUNNING)
+                if upcoming is not None and config.prefetch_inputs:
+                    readahead(upcoming)
+                converted = self.convert_jobs(slot, jobs)
+            except Exception:
+                converted = None
+                error = traceback.format_exc()
+            with self.lock:
+                del self.fractions[slot]
+                self.done_weight += sum(i.weight for i in jobs)
+            if converted is None:
+                self.fail_jobs(slot, jobs, error)
+            elif converted[3] is None:
+                try:
+                    self.complete_jobs(slot, jobs, *converted)
+                except Exception:
+                    self.fail_jobs(slot, jobs, traceback.format_exc())
+            else:
+                # the next batch converts while this one is moved
+                future = self.mover.submit(self.complete_jobs, slot, jobs,
+                                           *converted)
+                future.add_done_callback(
+                        lambda future, slot=slot, jobs=jobs:
+                        self.check_completion(future, slot, jobs))
+
+    def check_completion(self, future, slot, jobs):
+        """Report jobs as failed if complete_jobs() raised in the mover."""
+        e = future.exception()
+        if e is not None:
+            self.fail_jobs(slot, jobs, ''.join(traceback.format_exception(
+                    type(e), e, e.__traceback__)))
+
+    def fail_jobs(self, slot, jobs, error):
+        """
+        Report the jobs that an unexpected exception interrupted as failed,
+        unless they have been reported already, and remove their temporary
+        outputs. error is the traceback, which is logged and reported as
+        the output of the first of them.
+        """
+        logging.error(error, extra={
+                'command' : None,
+                'returncode' : None,
+                'type' : self.converter.name
+                })
+        with self.lock:
+            jobs = [i for i in jobs if id(i) not in self.reported]
+        for job in jobs:
+            if job.output != job.target:
+                remove_file(job.output)
+                job.output = job.target
+        try:
+            self.journal_state(jobs, journal.FAILED)
+        except Exception:
+            # e.g. the journal is locked, the jobs are left RUNNING and
+            # converted again if the batch is resumed
+            pass
+        if jobs:
+            self.output(slot, jobs[0], error)
+        self.report(slot, jobs, [False] * len(jobs))
+
+    def journal_state(self, jobs, state):
+        """Record the state of jobs in the journal, if any."""
+        if self.journal is not None:
+            self.journal.set_state(
+                    self.batch, [self.indexes[id(i)] for i in jobs], state)
+
+    def take_jobs(self):
+        """
+        Remove the next batch of jobs from the queue and return it.
+        Batches are made smaller near the end of the queue so that all slots
+        keep working. Must be called with self.lock held.
+        """
+        per_slot = -(-len(self.queue) // self.max_jobs)
+        size = max(1, min(self.converter.batch_size, per_slot))
+        return [self.queue.popleft() for i in range(size)]
+
+    def convert_jobs(self, slot, jobs):
+        """
+        Convert jobs or take their results from the cache.
+
+        Return a tuple of:
+        - a list with True for each job that converted successfully or was
+          taken from the cache, else False
+        - a list with the cache key of each job or None
+        - the indexes of the jobs that were converted, their outputs must
+          be passed to finish_output()
+        - the bytes reserved in the scratch folder for the outputs, or None
+          if they were written next to their targets
+        """
+        successes = [False] * len(jobs)
+        keys = [None] * len(jobs)
+        todo = []
+        for i, job in enumerate(jobs):
+            if not os.path.exists(job.source):
+                continue
+            if self.cache is not None:
+                keys[i] = self.cache.key(
+                        job.source, self.converter.cache_settings(job))
+                if keys[i] is not None and self.cache.fetch(keys[i],
+                                                            job.target):
+                    self.output(slot, job, 'Unchanged, using cached result '
+                                'for ' + job.target + '\n\n')
+                    successes[i] = True
+                    continue
+            todo.append(i)
+
+        reserved = None
+        if todo:
+            reserved = self.reserve_scratch([jobs[i] for i in todo])
+            for i in todo:
+                if reserved is None:
+                    jobs[i].output = temp_name(jobs[i].target)
+                else:
+                    jobs[i].output = os.path.join(
+                            self.scratch_dir, '{0}-{1}-{2}'.format(
+                            os.getpid(), next(self.scratch_names),
+                            os.path.basename(jobs[i].target)))
+                # left over by an interrupted conversion
+                remove_file(jobs[i].output)
+            try:
+                converted = self.converter.convert_batch(
+                        self, slot, [jobs[i] for i in todo])
+                for i, success in zip(todo, converted):
+                    successes[i] = success
+                failed = [i for i in todo if not successes[i]]
+                if failed and reserved is not None and not self.cancelled \
+                        and self.scratch_full():
+                    # the outputs were bigger than expected
+                    self.output(slot, jobs[failed[0]], 'Scratch folder is '
+                                'full, converting next to the target\n')
+                    for i in failed:
+                        remove_file(jobs[i].output)
+                        jobs[i].output = temp_name(jobs[i].target)
+                    converted = self.converter.convert_batch(
+                            self, slot, [jobs[i] for i in failed])
+                    for i, success in zip(failed, converted):
+                        successes[i] = success
+            except Exception:
+                self.release_scratch(reserved)
+                raise
+        return successes, keys, todo, reserved
+
+    def complete_jobs(self, slot, jobs, successes, keys, converted, reserved):
+        """
+        Move the outputs of the converted jobs to their targets, cache them,
+        delete the sources if needed and report the results. Runs in the
+        mover thread when the outputs are in the scratch folder.
+        """
+        try:
+            for i in converted:
+                successes[i] = self.finish_output(slot, jobs[i],
+                                                  successes[i])
+                if successes[i] and keys[i] is not None:
+                    self.cache.store(keys[i], jobs[i].target)
+        finally:
+            self.release_scratch(reserved)
+
+        for job, success in zip(jobs, successes):
+            if success:
+                if self.delete:
+                    remove_file(job.source)
+                self.journal_state([job], journal.DONE)
+            else:
+                # jobs interrupted by cancellation are done on resume
+                self.journal_state([job], journal.PENDING
+                                   if self.cancelled else journal.FAILED)
+        self.report(slot, jobs, successes)
+
+    def report(self, slot, jobs, successes):
+        """Count the results of jobs and emit their FINISHED events."""
+        for job, success in zip(jobs, successes):
+            result = Result(job, success)
+            with self.lock:
+                if result.success:
+                    self.ok += 1
+                else:
+                    self.error += 1
+                self.results.append(result)
+                self.reported.add(id(job))
+                total_percent, total_eta = self.total_progress()
+            self.emit(Event(FINISHED, slot, job, result=result,
+                            total_percent=total_percent,
+                            total_eta=total_eta))
+
+    def reserve_scratch(self, jobs):
+        """
+        Reserve room for the outputs of jobs in the scratch folder, as
+        estimated by the converter. While the folder is too full, wait for
+        staged outputs to be moved away.
+
+        Return the bytes reserved, or None if the outputs must be written
+        next to their targets.
+        """
+        if self.scratch_dir is None:
+            return None
+        size = sum(self.converter.estimate_output_size(i) for i in jobs)
+        with self.scratch_free:
+            while True:
+                try:
+                    free = shutil.disk_usage(self.scratch_dir).free
+                except OSError:
+                    return None
+                if free - self.scratch_reserved - size >= \
+                        config.scratch_min_free:
+                    self.scratch_reserved += size
+                    self.staged += 1
+                    return size
+                if not self.staged or self.cancelled:
+                    # nothing will free space soon
+                    return None
+                self.scratch_free.wait(1)
+
+    def scratch_full(self):
+        """Return True if the scratch folder has run out of room."""
+        try:
+            free = shutil.disk_usage(self.scratch_dir).free
+        except OSError:
+            return True
+        return free < config.scratch_min_free
+
+    def release_scratch(self, reserved):
+        """Release the bytes that reserve_scratch() returned, if any."""
+        if reserved is not None:
+            with self.scratch_free:
+                self.scratch_reserved -= reserved
+                self.staged -= 1
+                self.scratch_free.notify_all()
+
+    def finish_output(self, slot, job, success):
+        """
+        If the conversion succeeded and its output passes verification,
+        flush the temporary output of job to disk and move it to its
+        target, else remove it. So target is never left incomplete and
+        sources are deleted only when their target is fine. Replacing
+        target, rather than writing over it, also leaves other hard links
+        to it, e.g. cached results, intact.
+
+        Return True if target has been written.
+        """
+        if success and config.verify_outputs:
+            error = self.converter.verify(job)
+            if error is not None:
+                self.output(slot, job, error + ', ' + job.target +
+                            ' is not written\n\n')
+                success = False
+        output, job.output = job.output, job.target
+        if success:
+            try:
+                move_file(output, job.target, config.sync_outputs)
+                return True
+            except OSError as e:
+                logging.error(str(e), extra={
+                        'command' : 'move {0} {1}'.format(output, job.target),
+                        'returncode' : None,
+                        'type' : self.converter.name
+                        })
+        remove_file(output)
+        return False
+
+    def start_process(self, slot, cmd, stderr=subprocess.STDOUT):
+        """
+        Start cmd in a new process and register it to slot so that it can be
+        paused or killed on cancellation. The output of the process can be
+        read from its stdout, stderr is merged into it unless another stderr
+        is given. Converters that run several processes for one job register
+        each of them under its own key instead of slot, e.g. (slot, i).
+
+        Return the process or None if the conversion has been cancelled or
+        the process could not be started.
+        """
+        with self.lock:
+            if self.cancelled:
+                return None
+            try:
+                process = subprocess.Popen(
+                        cmd,
+                        stderr=stderr,
+                        stdout=subprocess.PIPE
+                        )
+            except OSError as e:
+                logging.error(str(e), extra={
+                        'command' : cmdline(cmd),
+                        'returncode' : None,
+                        'type' : self.converter.name
+                        })
+                return None
+            self.processes[slot] = process
+        return process
+
+    def finish_process(self, slot):
+        """Wait for slot's process, unregister it and return its exit code."""
+        process = self.processes[slot]
+        return_code = process.wait()
+        with self.lock:
+            del self.processes[slot]
+        return return_code
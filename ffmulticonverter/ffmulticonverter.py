@@ -17,7 +17,6 @@ import os
 import sys
 import platform
 import textwrap
-import logging
 import webbrowser
 
 from PyQt4.QtCore import (
@@ -33,6 +32,9 @@ from PyQt4.QtGui import (
 import ffmulticonverter as ffmc
 from ffmulticonverter import utils
 from ffmulticonverter import config
+from ffmulticonverter import engine
+from ffmulticonverter import fileset
+from ffmulticonverter import journal
 from ffmulticonverter import about_dlg
 from ffmulticonverter import preferences_dlg
 from ffmulticonverter import presets_dlgs
@@ -51,8 +53,7 @@ class MainWindow(QMainWindow):
     def __init__(self, parent=None):
         super(MainWindow, self).__init__(parent)
 
-        self.fnames = []  # list of file names to be converted
-        self.office_listener_started = False
+        self.fnames = fileset.FileSet()  # file names to be converted
 
         self.parse_cla()
 
@@ -61,8 +62,12 @@ class MainWindow(QMainWindow):
         clearQPB = QPushButton(self.tr('Clear'))
         vlayout1 = utils.add_to_layout('v', addQPB, delQPB, clearQPB, None)
 
+        self.filesModel = utils.FilesListModel(self.fnames, self)
         self.filesList = utils.FilesList()
+        self.filesList.setModel(self.filesModel)
         self.filesList.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.scanner = utils.FolderScanner(self)
+        self.prober = utils.MediaProber(self)
         hlayout1 = utils.add_to_layout('h', self.filesList, vlayout1)
 
         outputQL = QLabel(self.tr('Output folder:'))
@@ -110,6 +115,11 @@ class MainWindow(QMainWindow):
                 self, self.tr('Convert'), 'Ctrl+C', None,
                 self.tr('Convert files'), self.start_conversion
                 )
+        resumeAction = utils.create_action(
+                self, self.tr('Resume Previous Batch'), None, None,
+                self.tr('Convert the files of an interrupted batch'),
+                self.resume_batch
+                )
         quitAction = utils.create_action(
                 self, self.tr('Quit'), 'Ctrl+Q', None,
                 self.tr('Quit'), self.close
@@ -177,7 +187,8 @@ class MainWindow(QMainWindow):
         helpMenu = self.menuBar().addMenu(self.tr('Help'))
 
         utils.add_actions(
-                fileMenu, [openAction, convertAction, None, quitAction])
+                fileMenu,
+                [openAction, convertAction, resumeAction, None, quitAction])
         utils.add_actions(
                 presetsMenu,
                 [edit_presetsAction, importAction, exportAction, resetAction,
@@ -191,6 +202,9 @@ class MainWindow(QMainWindow):
                 )
 
         self.filesList.dropped.connect(self.add_files_dropped)
+        self.scanner.found.connect(self.filesModel.add_files)
+        self.filesModel.rowsInserted.connect(self.probe_new_files)
+        self.prober.idle.connect(self.files_probed)
         addQPB.clicked.connect(self.add_files)
         delQPB.clicked.connect(self.delete_files)
         clearQPB.clicked.connect(self.clear_fileslist)
@@ -210,16 +224,23 @@ class MainWindow(QMainWindow):
         QTimer.singleShot(0, self.check_for_dependencies)
         QTimer.singleShot(0, self.load_settings)
         QTimer.singleShot(0, self.audiovideo_tab.set_default_command)
-        QTimer.singleShot(0, self.update_filesList)
+        if self.cla_folders:
+            QTimer.singleShot(0, lambda: self.add_folders(self.cla_folders))
 
     def parse_cla(self):
-        """Parse command line arguments."""
+        """
+        Parse command line arguments.
+        Folders are scanned for files once the main window is ready.
+        """
+        self.cla_folders = []
         for i in QCoreApplication.argv()[1:]:
             i = os.path.abspath(i)
             if os.path.isfile(i):
-                self.fnames.append(i)
+                self.fnames.extend([i])
+            elif os.path.isdir(i):
+                self.cla_folders.append(i)
             else:
-                print("ffmulticonverter: {0}: Not a file".format(i))
+                print("ffmulticonverter: {0}: Not a file or folder".format(i))
 
     def check_for_dependencies(self):
         """
@@ -227,12 +248,12 @@ class MainWindow(QMainWindow):
         update self.dependenciesQL with the appropriate message.
         """
         self.vidconverter = None
-        if utils.is_installed('ffmpeg'):
+        if engine.is_installed('ffmpeg'):
             self.vidconverter = 'ffmpeg'
-        elif utils.is_installed('avconv'):
+        elif engine.is_installed('avconv'):
             self.vidconverter = 'avconv'
-        self.unoconv = utils.is_installed('unoconv')
-        self.imagemagick = utils.is_installed('convert')
+        self.unoconv = engine.is_installed('unoconv')
+        self.imagemagick = engine.is_installed('convert')
 
         missing = []
         if self.vidconverter is None:
@@ -260,6 +281,12 @@ class MainWindow(QMainWindow):
                 return value
             return ''
 
+        def get_int_value(settings, name, default):
+            value = settings.value(name)
+            if value:
+                return int(value)
+            return default
+
         settings = QSettings()
         self.overwrite_existing = utils.str_to_bool(
                 get_str_value(settings, 'overwrite_existing'))
@@ -270,6 +297,15 @@ class MainWindow(QMainWindow):
         extraformats = get_str_value(settings, 'extraformats')
         videocodecs = settings.value('videocodecs')
         audiocodecs = settings.value('audiocodecs')
+        self.max_jobs = get_int_value(settings, 'max_jobs', config.max_jobs)
+        self.max_ffmpeg_jobs = get_int_value(
+                settings, 'max_ffmpeg_jobs', config.max_ffmpeg_jobs)
+        self.max_imagemagick_jobs = get_int_value(
+                settings, 'max_imagemagick_jobs', config.max_imagemagick_jobs)
+        self.max_unoconv_jobs = get_int_value(
+                settings, 'max_unoconv_jobs', config.max_unoconv_jobs)
+        self.video_segments = get_int_value(
+                settings, 'video_segments', config.video_segments)
 
         if videocodecs is None:
             videocodecs = "\n".join(config.video_codecs)
@@ -295,17 +331,10 @@ class MainWindow(QMainWindow):
             if self.tabs.index(i) == self.tabWidget.currentIndex():
                 return i
 
-    def update_filesList(self):
-        """Clear self.filesList and add to it all items of self.fname."""
-        self.filesList.clear()
-        for i in self.fnames:
-            self.filesList.addItem(i)
-
     def add_files(self):
         """
         Get file names using a standard Qt dialog.
-        Append to self.fnames each file name that not already exists
-        and update self.filesList.
+        Append to self.fnames each file name that not already exists.
         """
         # Create lists holding file formats extension.
         # To be passed in QFileDialog.getOpenFileNames().
@@ -329,36 +358,65 @@ class MainWindow(QMainWindow):
                 self.tr('Choose File'), config.home, filters)
 
         if fnames:
-            for i in fnames:
-                if not i in self.fnames:
-                    self.fnames.append(i)
-            self.update_filesList()
+            self.filesModel.add_files(fnames)
 
     def add_files_dropped(self, links):
         """
-        Append to self.fnames each file name that not already exists
-        and update self.filesList.
+        Append to self.fnames each file name that not already exists.
+        Dropped folders are scanned for files in the background.
         """
-        for path in links:
-            if os.path.isfile(path) and not path in self.fnames:
-                self.fnames.append(path)
-        self.update_filesList()
+        self.filesModel.add_files(
+                [i for i in links if i not in self.fnames and os.path.isfile(i)])
+        folders = [i for i in links if os.path.isdir(i)]
+        if folders:
+            self.add_folders(folders)
+
+    def current_extensions(self):
+        """Return the extensions of the files that the current tab converts."""
+        tab = self.current_tab()
+        if tab.name == 'AudioVideo':
+            return tab.formats
+        elif tab.name == 'Images':
+            return tab.formats + tab.extra_img
+        else:
+            return list(tab.formats)
+
+    def add_folders(self, folders):
+        """
+        Scan the trees of folders in the background and append the files
+        that the current tab can convert to self.fnames as they are found.
+        """
+        self.scanner.scan(folders, self.current_extensions())
+
+    def probe_new_files(self, parent, first, last):
+        """
+        Probe the media files that were just added in the background, so
+        that their information is ready when needed.
+        """
+        if self.current_tab().name == 'AudioVideo':
+            self.prober.probe(self.fnames[i] for i in range(first, last + 1))
+
+    def files_probed(self):
+        """
+        Show the information of the first file in the audio/video tab once
+        all the added files have been probed.
+        """
+        if self.fnames:
+            self.audiovideo_tab.show_source_info(self.fnames[0])
 
     def delete_files(self):
         """
-        Get selectedItems of self.filesList, remove them from self.fnames and
-        update the filesList.
+        Remove the selected files of self.filesList from self.fnames.
         """
-        items = self.filesList.selectedItems()
-        if items:
-            for i in items:
-                self.fnames.remove(i.text())
-            self.update_filesList()
+        rows = self.filesList.selected_rows()
+        if rows:
+            self.filesModel.remove_rows(rows)
 
     def clear_fileslist(self):
-        """Make self.fnames empty and update self.filesList."""
-        self.fnames = []
-        self.update_filesList()
+        """Make self.fnames empty, stopping the folder scans."""
+        self.scanner.cancel()
+        self.filesModel.clear()
+        self.audiovideo_tab.show_source_info(None)
 
     def clear_all(self):
         """Clear all values of graphical widgets."""
@@ -449,12 +507,8 @@ class MainWindow(QMainWindow):
             return
 
         tab = self.current_tab()
-        if tab.name == 'Documents' and not self.office_listener_started:
-            utils.start_office_listener()
-            self.office_listener_started = True
-
         ext_to = self.get_output_extension()
-        _list = utils.create_paths_list(
+        _list = engine.create_paths_list(
                 self.fnames, ext_to, self.prefix, self.suffix,
                 self.toQLE.text(), self.origQCB.isChecked(),
                 self.overwrite_existing
@@ -464,6 +518,34 @@ class MainWindow(QMainWindow):
                 _list, tab, self.deleteQCB.isChecked(), self)
         dialog.show()
 
+    def resume_batch(self):
+        """
+        Convert the remaining files of the last batch that did not finish,
+        e.g. because the program crashed, with the settings it had.
+        """
+        jobs_journal = journal.get_journal()
+        batch = jobs_journal.unfinished_batch() if jobs_journal else None
+        remaining = batch.remaining() if batch is not None else []
+        if not remaining:
+            QMessageBox.information(
+                    self, 'FF Multi Converter - ' + self.tr('Resume'),
+                    self.tr('There is no interrupted batch to resume.'))
+            return
+
+        tabs = {'VIDEO' : self.audiovideo_tab, 'IMAGE' : self.image_tab,
+                'DOCUMENT' : self.document_tab}
+        _type = batch.settings['type']
+        max_jobs = {'VIDEO' : self.max_ffmpeg_jobs,
+                    'IMAGE' : self.max_imagemagick_jobs,
+                    'DOCUMENT' : self.max_unoconv_jobs}[_type]
+        converter = engine.converter_from_settings(batch.settings, max_jobs)
+        jobs = [engine.Job(source, target) for source, target in remaining]
+
+        dialog = progress.Progress(
+                jobs, tabs[_type], batch.delete, self, converter=converter,
+                replaces=batch.id)
+        dialog.show()
+
     def open_dialog_preferences(self):
         """Open the preferences dialog."""
         dialog = preferences_dlg.Preferences(self)
@@ -515,15 +597,7 @@ def main():
     if appTranslator.load('ffmulticonverter_' + locale, ':/'):
         app.installTranslator(appTranslator)
 
-    if not os.path.exists(config.log_dir):
-        os.makedirs(config.log_dir)
-
-    logging.basicConfig(
-            filename=config.log_file,
-            level=logging.DEBUG,
-            format=config.log_format,
-            datefmt=config.log_dateformat
-            )
+    engine.setup_logging()
 
     converter = MainWindow()
     converter.show()
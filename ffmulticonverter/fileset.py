@@ -0,0 +1,144 @@
+# Copyright (C) 2011-2015 Ilias Stamatis <stamatis.iliass@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Ordered collection of the file names to be converted and a scanner
+that collects files from folder trees.
+"""
+
+import os
+
+
+class FileSet(object):
+    """
+    Ordered set of file names.
+
+    Membership tests and lookups of the row of a file take constant time.
+    Files are added and removed in batches, so that views can be updated
+    once per batch.
+    """
+    def __init__(self, paths=()):
+        self.paths = []
+        self.rows = {}  # path -> row
+        self.extend(paths)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __iter__(self):
+        return iter(self.paths)
+
+    def __contains__(self, path):
+        return path in self.rows
+
+    def __getitem__(self, row):
+        return self.paths[row]
+
+    def __repr__(self):
+        return 'FileSet({0!r})'.format(self.paths)
+
+    def row(self, path):
+        """Return the row of path or None if it is not in the set."""
+        return self.rows.get(path)
+
+    def extend(self, paths):
+        """
+        Append each path that is not already in the set.
+        Return the list of appended paths.
+        """
+        added = []
+        for path in paths:
+            if path not in self.rows:
+                self.rows[path] = len(self.paths)
+                self.paths.append(path)
+                added.append(path)
+        return added
+
+    def remove_rows(self, rows):
+        """Remove the paths of the given rows."""
+        rows = set(rows)
+        if not rows:
+            return
+        self.paths = [path for row, path in enumerate(self.paths)
+                      if row not in rows]
+        self.rows = dict((path, row) for row, path in enumerate(self.paths))
+
+    def remove(self, paths):
+        """Remove the given paths, ignoring the ones that are not in the set."""
+        self.remove_rows(self.rows[i] for i in paths if i in self.rows)
+
+    def clear(self):
+        self.paths = []
+        self.rows = {}
+
+
+def ranges(rows):
+    """
+    Return the sorted rows as a list of (first, last) tuples of consecutive
+    rows, e.g. [1, 2, 3, 7] gives [(1, 3), (7, 7)].
+    """
+    result = []
+    for row in sorted(set(rows)):
+        if result and result[-1][1] == row - 1:
+            result[-1] = (result[-1][0], row)
+        else:
+            result.append((row, row))
+    return result
+
+def scan(folders, extensions=None, chunk_size=1000):
+    """
+    Walk the trees of folders and yield lists of at most chunk_size files,
+    sorted inside each folder. Symbolic links to folders are not followed
+    and folders that cannot be read are skipped.
+
+    Keyword arguments:
+    folders    -- list of folders to scan
+    extensions -- if given, only files with one of these extensions
+                  (without the dot, in any case) are yielded
+    chunk_size -- maximum number of files in each list
+    """
+    if extensions is not None:
+        extensions = set(i.lower() for i in extensions)
+    chunk = []
+    stack = list(reversed(folders))
+    while stack:
+        folder = stack.pop()
+        try:
+            with os.scandir(folder) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError:
+            continue
+        subfolders = []
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subfolders.append(entry.path)
+                    continue
+                if not entry.is_file():
+                    continue
+            except OSError:
+                continue
+            if extensions is not None:
+                ext = os.path.splitext(entry.name)[1][1:].lower()
+                if ext not in extensions:
+                    continue
+            chunk.append(entry.path)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        # visit subfolders depth first, in order
+        stack.extend(reversed(subfolders))
+    if chunk:
+        yield chunk
@@ -0,0 +1,211 @@
+# Copyright (C) 2011-2015 Ilias Stamatis <stamatis.iliass@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+In-process image conversions using Pillow, if it is installed.
+
+Only the common formats and the operations of the Images tab are handled:
+resize, trim, rotate, flip and flop. Everything else, including images with
+several frames, is left to ImageMagick. The results follow the meaning of
+the respective ImageMagick options, e.g. -rotate turns images clockwise.
+"""
+
+import os
+import re
+import shlex
+
+try:
+    import PIL
+    from PIL import Image, ImageChops
+except ImportError:
+    Image = None
+
+available = Image is not None
+version = PIL.__version__ if available else None
+
+# file extension -> Pillow format name
+FORMATS = {
+        'bmp' : 'BMP',
+        'jpe' : 'JPEG',
+        'jpeg' : 'JPEG',
+        'jpg' : 'JPEG',
+        'png' : 'PNG',
+        'tif' : 'TIFF',
+        'tiff' : 'TIFF',
+        'webp' : 'WEBP'
+        }
+
+# ImageMagick's default quality
+JPEG_QUALITY = 92
+
+SIZE_RE = re.compile(r'^(\d*)x(\d*)$')
+
+
+def supported(path):
+    """Return True if the format of path can be handled by Pillow."""
+    return os.path.splitext(path)[1][1:].lower() in FORMATS
+
+def parse_operations(size, mntaspect, imgcmd):
+    """
+    Translate the ImageMagick parameters of ImageConverter to a list of
+    operations for convert().
+
+    Return the list or None if some parameter cannot be handled by Pillow.
+
+    Keyword arguments:
+    size      -- new image size, string of type WIDTHxHEIGHT
+    mntaspect -- if True, maintain the aspect ratio when resizing
+    imgcmd    -- extra ImageMagick parameters
+    """
+    operations = []
+    if size:
+        m = SIZE_RE.match(size)
+        if m is None:
+            return None
+        width = int(m.group(1)) if m.group(1) else None
+        height = int(m.group(2)) if m.group(2) else None
+        if not width and not height:
+            return None
+        if not mntaspect and not (width and height):
+            return None
+        operations.append(('resize', width, height, mntaspect))
+
+    try:
+        args = shlex.split(imgcmd)
+    except ValueError:
+        return None
+    while args:
+        arg = args.pop(0)
+        if arg == '-trim':
+            operations.append(('trim',))
+        elif arg == '+repage':
+            # Pillow images have no virtual canvas
+            pass
+        elif arg == '-rotate' and args:
+            try:
+                operations.append(('rotate', float(args.pop(0))))
+            except ValueError:
+                return None
+        elif arg == '-flip':
+            operations.append(('flip',))
+        elif arg == '-flop':
+            operations.append(('flop',))
+        else:
+            return None
+    return operations
+
+def resize(image, width, height, mntaspect):
+    """Resize image like ImageMagick's -resize option."""
+    if mntaspect:
+        ratios = []
+        if width:
+            ratios.append(width / image.width)
+        if height:
+            ratios.append(height / image.height)
+        ratio = min(ratios)
+        width = max(1, round(image.width * ratio))
+        height = max(1, round(image.height * ratio))
+    return image.resize((width, height), Image.LANCZOS)
+
+def trim(image):
+    """Remove the edges that have the color of the top left corner."""
+    background = Image.new(image.mode, image.size, image.getpixel((0, 0)))
+    box = ImageChops.difference(image, background).getbbox()
+    return image.crop(box) if box else image
+
+def rotate(image, degrees):
+    """
+    Turn image clockwise like ImageMagick's -rotate option. Right angles are
+    exact. Other angles uncover corners, which are white like ImageMagick's
+    default background, or transparent if image has an alpha channel.
+    """
+    degrees %= 360
+    if degrees == 0:
+        return image
+    transpositions = {
+            90 : Image.ROTATE_270,
+            180 : Image.ROTATE_180,
+            270 : Image.ROTATE_90
+            }
+    if degrees in transpositions:
+        return image.transpose(transpositions[degrees])
+    if image.mode in ('RGBA', 'LA') or 'transparency' in image.info:
+        image = image.convert('RGBA')
+        fill = (255, 255, 255, 0)
+    elif image.mode == 'L':
+        fill = 255
+    else:
+        image = image.convert('RGB')
+        fill = (255, 255, 255)
+    return image.rotate(-degrees, Image.BICUBIC, expand=True, fillcolor=fill)
+
+def raw_size(path):
+    """
+    Return the bytes that the pixels of image path take uncompressed, as
+    RGBA, or None if its dimensions cannot be read. Only the header of the
+    file is read.
+    """
+    if not available:
+        return None
+    try:
+        with Image.open(path) as image:
+            width, height = image.size
+            frames = getattr(image, 'n_frames', 1)
+    except Exception:
+        return None
+    return width * height * 4 * frames
+
+def convert(source, target, operations):
+    """
+    Convert source to target applying operations.
+    This function runs in the processes of a process pool.
+
+    Return None if conversion succeed, else an error message.
+    """
+    try:
+        # closes the source file, whatever image is bound to at the end
+        with Image.open(source) as image:
+            frames = getattr(image, 'n_frames', 1)
+            if frames > 1:
+                # Pillow would keep only the first one
+                return 'Image has {0} frames'.format(frames)
+            image.load()
+            for operation in operations:
+                name = operation[0]
+                if name == 'resize':
+                    image = resize(image, *operation[1:])
+                elif name == 'trim':
+                    image = trim(image)
+                elif name == 'rotate':
+                    image = rotate(image, operation[1])
+                elif name == 'flip':
+                    image = image.transpose(Image.FLIP_TOP_BOTTOM)
+                elif name == 'flop':
+                    image = image.transpose(Image.FLIP_LEFT_RIGHT)
+
+            _format = FORMATS[os.path.splitext(target)[1][1:].lower()]
+            options = {}
+            if _format == 'JPEG':
+                options['quality'] = JPEG_QUALITY
+                if image.mode not in ('RGB', 'L', 'CMYK'):
+                    image = image.convert('RGB')
+            elif _format == 'BMP' and \
+                    image.mode not in ('1', 'L', 'P', 'RGB'):
+                image = image.convert('RGB')
+            image.save(target, _format, **options)
+    # Pillow raises various exceptions for broken or unusual files
+    except Exception as e:
+        return '{0}: {1}'.format(type(e).__name__, e)
+    return None
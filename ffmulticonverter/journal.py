@@ -0,0 +1,212 @@
+# Copyright (C) 2011-2015 Ilias Stamatis <stamatis.iliass@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Persistent journal of conversion batches.
+
+The state of each job of a batch, pending, running, done or failed, is
+saved in an SQLite database as soon as it changes, so that a batch that
+was interrupted by a crash or a reboot can be resumed where it stopped.
+
+Example:
+    jobs_journal = journal.Journal()
+    batch = jobs_journal.create_batch(converter.settings(), False, jobs)
+    jobs_journal.set_state(batch, [0], journal.RUNNING)
+    jobs_journal.set_state(batch, [0], journal.DONE)
+    jobs_journal.finish_batch(batch)
+    jobs_journal.release_batch(batch)
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+
+from ffmulticonverter import config
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS batches (
+    id INTEGER PRIMARY KEY,
+    created REAL NOT NULL,
+    settings TEXT NOT NULL,
+    remove_sources INTEGER NOT NULL,
+    finished INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    batch INTEGER NOT NULL REFERENCES batches(id) ON DELETE CASCADE,
+    idx INTEGER NOT NULL,
+    source TEXT NOT NULL,
+    target TEXT NOT NULL,
+    state TEXT NOT NULL,
+    PRIMARY KEY (batch, idx)
+);
+"""
+
+
+class Batch(object):
+    """An unfinished batch of the journal."""
+    def __init__(self, batch_id, created, settings, delete, jobs):
+        """
+        Keyword arguments:
+        batch_id -- id of the batch in the journal
+        created  -- time the batch was created
+        settings -- dict of converter settings, see engine.Converter.settings
+        delete   -- True if source files are deleted after conversion
+        jobs     -- list of (source, target, state) tuples
+        """
+        self.id = batch_id
+        self.created = created
+        self.settings = settings
+        self.delete = delete
+        self.jobs = jobs
+
+    def remaining(self):
+        """
+        Return the (source, target) tuples of the jobs that did not finish,
+        including the ones that were interrupted while running. Jobs whose
+        source has been removed or modified since the batch was created are
+        skipped, it is not the file that the batch was about any more.
+        """
+        remaining = []
+        for source, target, state in self.jobs:
+            if state not in (PENDING, RUNNING):
+                continue
+            try:
+                if os.stat(source).st_mtime > self.created:
+                    continue
+            except OSError:
+                continue
+            remaining.append((source, target))
+        return remaining
+
+
+class Journal(object):
+    """SQLite journal of batches, safe to use from several threads."""
+    def __init__(self, path=None):
+        """
+        Keyword arguments:
+        path -- the database file, config.journal_file by default
+        """
+        self.path = path or config.journal_file
+        self.lock = threading.Lock()
+        # ids of the batches that are converting in this program
+        self.active = set()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        # every state change is committed, WAL makes commits cheap
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('PRAGMA foreign_keys=ON')
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def create_batch(self, settings, delete, jobs, replaces=None):
+        """
+        Record a new batch with all its jobs pending and return its id.
+        The batch is active until release_batch() is called. Older batches
+        are removed unless they are active: finished ones are not needed any
+        more and only the newest unfinished batch can be resumed.
+
+        Keyword arguments:
+        settings -- dict of converter settings
+        delete   -- True if source files are deleted after conversion
+        jobs     -- list of engine.Job
+        replaces -- id of the batch that this one resumes, which is removed
+                    like the other older batches
+        """
+        with self.lock, self.connection:
+            active = sorted(self.active)
+            self.connection.execute(
+                    'DELETE FROM batches WHERE id NOT IN ({0})'.format(
+                    ', '.join('?' * len(active))), active)
+            cursor = self.connection.execute(
+                    'INSERT INTO batches (created, settings, remove_sources) '
+                    'VALUES (?, ?, ?)',
+                    (time.time(), json.dumps(settings), int(bool(delete))))
+            batch = cursor.lastrowid
+            self.active.add(batch)
+            self.connection.executemany(
+                    'INSERT INTO jobs VALUES (?, ?, ?, ?, ?)',
+                    ((batch, i, job.source, job.target, PENDING)
+                     for i, job in enumerate(jobs)))
+        return batch
+
+    def set_state(self, batch, indexes, state):
+        """Set the state of the jobs of batch with the given indexes."""
+        with self.lock, self.connection:
+            self.connection.executemany(
+                    'UPDATE jobs SET state = ? WHERE batch = ? AND idx = ?',
+                    ((state, batch, i) for i in indexes))
+
+    def finish_batch(self, batch):
+        """Mark batch as finished, it will not be resumed."""
+        with self.lock, self.connection:
+            self.connection.execute(
+                    'UPDATE batches SET finished = 1 WHERE id = ?', (batch,))
+
+    def release_batch(self, batch):
+        """
+        Mark batch as no longer converting in this program, so that it can
+        be resumed if it did not finish, or removed.
+        """
+        with self.lock:
+            self.active.discard(batch)
+
+    def unfinished_batch(self):
+        """
+        Return the most recent unfinished Batch that is not active, or None.
+        """
+        with self.lock:
+            active = sorted(self.active)
+            row = self.connection.execute(
+                    'SELECT id, created, settings, remove_sources FROM batches '
+                    'WHERE finished = 0 AND id NOT IN ({0}) '
+                    'ORDER BY id DESC LIMIT 1'.format(
+                    ', '.join('?' * len(active))), active).fetchone()
+            if row is None:
+                return None
+            jobs = self.connection.execute(
+                    'SELECT source, target, state FROM jobs WHERE batch = ? '
+                    'ORDER BY idx', (row[0],)).fetchall()
+        return Batch(row[0], row[1], json.loads(row[2]), bool(row[3]), jobs)
+
+
+_journal = None
+_journal_lock = threading.Lock()
+
+def get_journal():
+    """
+    Return the journal of the program, or None if it is disabled or its
+    database cannot be opened.
+    """
+    global _journal
+    if not config.use_journal:
+        return None
+    with _journal_lock:
+        if _journal is None:
+            try:
+                _journal = Journal()
+            except (OSError, sqlite3.Error):
+                return None
+        return _journal
@@ -0,0 +1,209 @@
+# Copyright (C) 2011-2015 Ilias Stamatis <stamatis.iliass@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Pool of openoffice/libreoffice listeners used by unoconv.
+
+Each listener runs on its own port with its own user profile, so that
+documents can be converted in parallel. Listeners are started on demand,
+restarted when they stop responding and stopped when the program exits.
+
+Example:
+    listener = office.get_pool(2).acquire()
+    try:
+        cmd = ['unoconv', '-n', '-p', str(listener.port), 'a.odt']
+        ...
+    finally:
+        office.get_pool().release(listener, healthy)
+"""
+
+import os
+import time
+import queue
+import atexit
+import shutil
+import signal
+import socket
+import logging
+import tempfile
+import threading
+import subprocess
+
+from ffmulticonverter import config
+
+
+def port_open(port):
+    """Return True if something accepts connections on port."""
+    try:
+        connection = socket.create_connection(('127.0.0.1', port), 1)
+    except OSError:
+        return False
+    connection.close()
+    return True
+
+
+class Listener(object):
+    """An office listener on a port."""
+    def __init__(self, port):
+        self.port = port
+        self.process = None
+        self.profile = None
+
+    def __repr__(self):
+        return 'Listener({0})'.format(self.port)
+
+    def start(self):
+        """
+        Start the listener, unless one already runs on self.port, and wait
+        until it accepts connections.
+
+        Return True if the listener is ready, else False.
+        """
+        if port_open(self.port):
+            return True
+        self.profile = tempfile.mkdtemp(prefix='ffmulticonverter-office-')
+        cmd = ['unoconv', '--listener', '--port', str(self.port),
+               '--user-profile', self.profile]
+        try:
+            # a new session lets stop() kill the office process as well
+            self.process = subprocess.Popen(
+                    cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                    start_new_session=True)
+        except OSError as e:
+            logging.error(str(e), extra={
+                    'command' : ' '.join(cmd),
+                    'returncode' : None,
+                    'type' : 'DOCUMENT'
+                    })
+            return False
+        return self.wait_ready()
+
+    def wait_ready(self):
+        """
+        Wait until the listener accepts connections. Give up when time runs
+        out, or at once if the listener process exits, e.g. because office
+        is not installed.
+
+        Return True if the listener is ready, else False.
+        """
+        deadline = time.time() + config.office_start_timeout
+        while time.time() < deadline:
+            if port_open(self.port):
+                return True
+            if self.process is not None and self.process.poll() is not None:
+                logging.error('Office listener exited', extra={
+                        'command' : ' '.join(self.process.args),
+                        'returncode' : self.process.returncode,
+                        'type' : 'DOCUMENT'
+                        })
+                self.stop()
+                return False
+            time.sleep(0.1)
+        return False
+
+    def healthy(self):
+        """Return True if the listener accepts connections."""
+        return port_open(self.port)
+
+    def stop(self):
+        """
+        Kill the listener if it was started by us. Listeners that were
+        already running, e.g. by an older version of the program, are left
+        alone.
+        """
+        if self.process is not None:
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except OSError:
+                pass
+            self.process.wait()
+            self.process = None
+        if self.profile is not None:
+            shutil.rmtree(self.profile, ignore_errors=True)
+            self.profile = None
+
+    def restart(self):
+        """Kill the listener, if any, and start it again."""
+        self.stop()
+        return self.start()
+
+
+class ListenerPool(object):
+    """
+    Hand out listeners to conversions, one conversion per listener at a
+    time, in round-robin order.
+    """
+    def __init__(self, size):
+        self.listeners = []
+        self.free = queue.Queue()
+        self.lock = threading.Lock()
+        self.grow(size)
+
+    def grow(self, size):
+        """Make sure that the pool has at least size listeners."""
+        with self.lock:
+            while len(self.listeners) < size:
+                listener = Listener(
+                        config.office_base_port + len(self.listeners))
+                self.listeners.append(listener)
+                self.free.put(listener)
+
+    def acquire(self):
+        """
+        Wait for a free listener, start or restart it if needed and return
+        it, or None if it cannot be started.
+        """
+        listener = self.free.get()
+        if not listener.healthy() and not listener.restart():
+            self.free.put(listener)
+            return None
+        return listener
+
+    def release(self, listener, healthy=True):
+        """
+        Give listener back to the pool. If it is not healthy, e.g. it hung
+        during a conversion, it is killed and will be restarted before its
+        next use.
+        """
+        if not healthy:
+            listener.stop()
+        self.free.put(listener)
+
+    def shutdown(self):
+        """Stop all listeners started by the pool."""
+        with self.lock:
+            for listener in self.listeners:
+                listener.stop()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool(size=1):
+    """Return the listener pool of the program, with at least size listeners."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ListenerPool(size)
+            atexit.register(shutdown)
+        else:
+            _pool.grow(size)
+        return _pool
+
+def shutdown():
+    """Stop the listeners of the program."""
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
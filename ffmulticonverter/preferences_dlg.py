@@ -13,11 +13,11 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
-from PyQt4.QtCore import QSettings, QTimer
+from PyQt4.QtCore import QRegExp, QSettings, QTimer
 from PyQt4.QtGui import (
         QDialog, QDialogButtonBox, QFileDialog, QLabel, QLineEdit,
         QRadioButton, QSpacerItem, QTabWidget, QToolButton, QWidget,
-        QPlainTextEdit, QPushButton
+        QPlainTextEdit, QPushButton, QRegExpValidator
         )
 
 from ffmulticonverter import utils
@@ -62,12 +62,42 @@ class Preferences(QDialog):
                 [prefixQL, self.prefixQLE], [suffixQL, self.suffixQLE])
         prefix_layout = utils.add_to_layout('h', grid, None)
 
+        digits_validator = QRegExpValidator(QRegExp(r'[1-9]\d*'), self)
+        convQL = QLabel(
+                '<html><b>' + self.tr('Parallel conversions') + '</b></html>')
+        jobsQL = QLabel(self.tr('Maximum:'))
+        ffmpegjobsQL = QLabel('FFmpeg:')
+        imagemagickjobsQL = QLabel('ImageMagick:')
+        unoconvjobsQL = QLabel('unoconv:')
+        segmentsQL = QLabel(self.tr('Parts per video:'))
+        segmentsQL.setToolTip(self.tr(
+                'Split long videos into this many parts and encode them in '
+                'parallel'))
+        self.jobsQLE = utils.create_LineEdit(
+                (50, 16777215), digits_validator, 3)
+        self.ffmpegjobsQLE = utils.create_LineEdit(
+                (50, 16777215), digits_validator, 3)
+        self.imagemagickjobsQLE = utils.create_LineEdit(
+                (50, 16777215), digits_validator, 3)
+        self.unoconvjobsQLE = utils.create_LineEdit(
+                (50, 16777215), digits_validator, 3)
+        self.segmentsQLE = utils.create_LineEdit(
+                (50, 16777215), digits_validator, 3)
+        grid2 = utils.add_to_grid(
+                [jobsQL, self.jobsQLE, ffmpegjobsQL, self.ffmpegjobsQLE],
+                [segmentsQL, self.segmentsQLE, imagemagickjobsQL,
+                 self.imagemagickjobsQLE],
+                [None, None, unoconvjobsQL, self.unoconvjobsQLE]
+                )
+        jobs_layout = utils.add_to_layout('h', grid2, None)
+
         tabwidget1_layout = utils.add_to_layout(
                 'v', saveQL,
                 QSpacerItem(14, 13), existQL, exist_layout,
                 QSpacerItem(14, 13), defaultQL, deafult_fol_layout,
                 QSpacerItem(13, 13), nameQL, QSpacerItem(14, 13),
-                prefix_layout, None
+                prefix_layout, QSpacerItem(13, 13), convQL,
+                QSpacerItem(14, 13), jobs_layout, None
                 )
 
         ffmpegQL = QLabel('<html><b>' + self.tr('FFmpeg') +'</b></html>')
@@ -137,6 +167,11 @@ class Preferences(QDialog):
         videocodecs = settings.value('videocodecs')
         audiocodecs = settings.value('audiocodecs')
         extraformats = settings.value('extraformats')
+        max_jobs = settings.value('max_jobs')
+        max_ffmpeg_jobs = settings.value('max_ffmpeg_jobs')
+        max_imagemagick_jobs = settings.value('max_imagemagick_jobs')
+        max_unoconv_jobs = settings.value('max_unoconv_jobs')
+        video_segments = settings.value('video_segments')
 
         # QSettings.value() returns str() in python3, not QVariant() as in p2
         if overwrite_existing:
@@ -164,6 +199,15 @@ class Preferences(QDialog):
             self.audcodecsQPTE.setPlainText(audiocodecs)
         self.extraformatsQPTE.setPlainText(extraformats)
 
+        self.jobsQLE.setText(max_jobs or str(config.max_jobs))
+        self.ffmpegjobsQLE.setText(
+                max_ffmpeg_jobs or str(config.max_ffmpeg_jobs))
+        self.imagemagickjobsQLE.setText(
+                max_imagemagick_jobs or str(config.max_imagemagick_jobs))
+        self.unoconvjobsQLE.setText(
+                max_unoconv_jobs or str(config.max_unoconv_jobs))
+        self.segmentsQLE.setText(video_segments or str(config.video_segments))
+
     def set_default_videocodecs(self):
         self.vidcodecsQPTE.setPlainText("\n".join(config.video_codecs))
 
@@ -226,5 +270,15 @@ class Preferences(QDialog):
                 'audiocodecs', audiocodecs)
         settings.setValue(
                 'extraformats', extraformats)
+        settings.setValue(
+                'max_jobs', self.jobsQLE.text())
+        settings.setValue(
+                'max_ffmpeg_jobs', self.ffmpegjobsQLE.text())
+        settings.setValue(
+                'max_imagemagick_jobs', self.imagemagickjobsQLE.text())
+        settings.setValue(
+                'max_unoconv_jobs', self.unoconvjobsQLE.text())
+        settings.setValue(
+                'video_segments', self.segmentsQLE.text())
 
         self.accept()
@@ -0,0 +1,573 @@
+# Copyright (C) 2011-2015 Ilias Stamatis <stamatis.iliass@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Loading of the ffmpeg presets, independent of the graphical user interface.
+
+presets.xml is parsed once into a PresetStore, which keeps the presets in
+dicts indexed by name, category and extension, so that sorted views,
+searches and lookups never scan the xml tree again. Searches use an inverted
+index from the words of each preset to the presets that contain them.
+
+PresetsFile writes the changes of user's presets together and atomically,
+and keeps a json cache of the parsed presets that loads faster than xml.
+The whole program shares one PresetsFile, see get_presets_file(), which
+parses presets.xml again only when its size or modification time changes.
+"""
+
+import os
+import re
+import sys
+import json
+import stat
+import bisect
+import tempfile
+import threading
+import xml.etree.ElementTree as etree
+
+from ffmulticonverter import config
+
+
+# how much a word found in each field of a preset counts in search results;
+# words that match a whole indexed token count twice
+FIELD_WEIGHTS = [('name', 8), ('label', 4), ('extension', 2), ('params', 1)]
+
+WORD = re.compile(r'[^\W_]+')
+# parts of camel case or alphanumeric words, e.g. 'Blackberry', 'Curve',
+# 'libx', '264'
+WORD_PART = re.compile('[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+')
+# sorts after any token that starts with the same characters
+LAST_CHAR = chr(sys.maxunicode)
+
+
+def find_presets_file(fname, lookup_dirs, lookup_virtenv):
+    """
+    The default presets.xml could be stored in different locations during
+    the installation depending on different Linux distributions.
+    Search for this file on each possible directory to which user
+    specific data files could be stored.
+
+    Keyword arguments:
+    fname          -- file name
+    lookup_dirs    -- list of the directories to search for fname
+    lookup_virtent -- directory to search for fname in virtualenv
+
+    Return the path of the file if found, else an empty string.
+    """
+    possible_dirs = os.environ.get(
+            "XDG_DATA_DIRS", ":".join(lookup_dirs)
+            ).split(":")
+    # for virtualenv installations
+    posdir = os.path.realpath(
+            os.path.join(os.path.dirname(sys.argv[0]), '..', lookup_virtenv))
+    if not posdir in possible_dirs:
+        possible_dirs.append(posdir)
+
+    for _dir in possible_dirs:
+        _file = os.path.join(_dir, 'ffmulticonverter/' + fname)
+        if os.path.exists(_file):
+            return _file
+    return ''
+
+_original_presets_file = None
+
+def original_presets_file():
+    """
+    Return the path of the default presets file or an empty string.
+    The lookup directories are searched only the first time.
+    """
+    global _original_presets_file
+    if _original_presets_file is None:
+        _original_presets_file = find_presets_file(
+                config.presets_file_name,
+                config.presets_lookup_dirs,
+                config.presets_lookup_virtenv
+                )
+    return _original_presets_file
+
+def load_tree():
+    """
+    Parse and return the xml tree of user's presets.
+    If user has no valid presets file, return the default presets.
+    """
+    try:
+        return etree.parse(config.presets_file)
+    except (etree.ParseError, IOError):
+        return load_default_tree()
+
+def load_default_tree():
+    """Parse and return the xml tree of the default presets."""
+    try:
+        return etree.parse(original_presets_file())
+    except IOError:
+        pass
+    try:
+        # when program is not installed
+        return etree.parse('share/' + config.presets_file_name)
+    except IOError:
+        # when running from test_dialogs.py
+        return etree.parse('../share/' + config.presets_file_name)
+
+def load_store():
+    """
+    Return the PresetStore with user's presets, or the default presets if
+    user has no valid presets file. The store is shared by the program.
+    """
+    return get_presets_file().current()
+
+def file_stamp(path):
+    """Return the (size, mtime) of path, or None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+def file_mode(path):
+    """
+    Return the permissions of file path, or the ones that a new file gets
+    if it does not exist.
+    """
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except OSError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+def write_tree(tree, path):
+    """
+    Write an xml tree to path atomically: path is replaced by a complete
+    file or left as it was. The permissions of path are kept. Raise OSError
+    on failure.
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.',
+                               prefix='.presets-', suffix='.xml')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            tree.write(f, encoding='utf-8', xml_declaration=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp, file_mode(path))
+        os.replace(tmp, path)
+    except OSError:
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        raise
+
+def tokenize(text):
+    """
+    Return the set of lowercase tokens of text: its words and, for words
+    that mix cases or letters and digits, their parts.
+    """
+    tokens = set()
+    for word in WORD.findall(text):
+        tokens.add(word.lower())
+        parts = WORD_PART.findall(word)
+        if len(parts) > 1:
+            tokens.update(i.lower() for i in parts)
+    return tokens
+
+def find_preset(name):
+    """
+    Return a (params, extension) tuple for the preset with the given name
+    or None if no such preset exists.
+    """
+    preset = load_store().get(name)
+    if preset is None:
+        return None
+    return preset.params, preset.extension
+
+
+class ConflictError(Exception):
+    """The presets file was changed by another program since it was read."""
+
+
+class Preset(object):
+    """An ffmpeg preset."""
+    def __init__(self, name, label, params, extension, category=None):
+        """
+        Keyword arguments:
+        name      -- unique name, used as the tag of the xml element
+        label     -- description shown to the user
+        params    -- ffmpeg command line parameters
+        extension -- extension of the output files, without a dot
+        category  -- e.g. 'Audio', or None
+        """
+        self.name = name
+        self.label = label
+        self.params = params
+        self.extension = extension
+        self.category = category
+
+    def __repr__(self):
+        return 'Preset({0!r})'.format(self.name)
+
+    def values(self):
+        """Return what the preset does, everything but its name."""
+        return self.label, self.params, self.extension
+
+    def renamed(self, name):
+        """Return a copy of the preset with another name."""
+        return Preset(name, self.label, self.params, self.extension,
+                      self.category)
+
+    @staticmethod
+    def from_element(elem):
+        """Return the Preset of an xml element of presets.xml."""
+        return Preset(elem.tag, elem.findtext('label', ''),
+                      elem.findtext('params', ''),
+                      elem.findtext('extension', ''),
+                      elem.findtext('category'))
+
+    def to_element(self):
+        """Return the xml element of the preset."""
+        elem = etree.Element(self.name)
+        fields = [('label', self.label), ('params', self.params),
+                  ('extension', self.extension)]
+        if self.category is not None:
+            fields.append(('category', self.category))
+        for tag, text in fields:
+            etree.SubElement(elem, tag).text = text
+        return elem
+
+
+class PresetStore(object):
+    """
+    Presets indexed by name, category and extension.
+    Iterating yields the presets sorted by name.
+    """
+    def __init__(self, presets=()):
+        self.presets = {}     # name -> Preset
+        self.categories = {}  # category -> set of names
+        self.extensions = {}  # extension -> set of names
+        # token -> {weight: set of names}, built by the first search
+        self.tokens = None
+        self.sorted_names = None  # computed when first needed
+        self.sorted_tokens = None
+        for preset in presets:
+            self.add(preset)
+
+    @staticmethod
+    def from_tree(tree):
+        """Return a PresetStore with the presets of an xml tree."""
+        return PresetStore(Preset.from_element(i) for i in tree.getroot())
+
+    def to_tree(self):
+        """Return the xml tree of the presets, sorted by name."""
+        root = etree.Element('presets')
+        for preset in self:
+            root.append(preset.to_element())
+        return etree.ElementTree(root)
+
+    def __len__(self):
+        return len(self.presets)
+
+    def __iter__(self):
+        return iter([self.presets[i] for i in self.names()])
+
+    def __contains__(self, name):
+        return name in self.presets
+
+    def get(self, name):
+        """Return the preset with the given name or None."""
+        return self.presets.get(name)
+
+    def names(self):
+        """Return the sorted names of the presets."""
+        if self.sorted_names is None:
+            self.sorted_names = sorted(self.presets)
+        return self.sorted_names
+
+    def add(self, preset):
+        """Add preset, replacing any preset with the same name."""
+        self.remove(preset.name)
+        self.presets[preset.name] = preset
+        self.categories.setdefault(preset.category, set()).add(preset.name)
+        self.extensions.setdefault(preset.extension, set()).add(preset.name)
+        if self.tokens is not None:
+            self.index_tokens(preset)
+        self.sorted_names = None
+
+    def remove(self, name):
+        """Remove the preset with the given name, if any."""
+        preset = self.presets.pop(name, None)
+        if preset is None:
+            return
+        for index, key in [(self.categories, preset.category),
+                           (self.extensions, preset.extension)]:
+            index[key].discard(name)
+            if not index[key]:
+                del index[key]
+        if self.tokens is not None:
+            for token, weight in self.preset_tokens(preset).items():
+                weights = self.tokens[token]
+                weights[weight].discard(name)
+                if not weights[weight]:
+                    del weights[weight]
+                if not weights:
+                    del self.tokens[token]
+            self.sorted_tokens = None
+        self.sorted_names = None
+
+    def clear(self):
+        self.presets = {}
+        self.categories = {}
+        self.extensions = {}
+        self.tokens = None
+        self.sorted_names = None
+        self.sorted_tokens = None
+
+    def index_tokens(self, preset):
+        """Add the tokens of preset to self.tokens."""
+        for token, weight in self.preset_tokens(preset).items():
+            self.tokens.setdefault(token, {}).setdefault(
+                    weight, set()).add(preset.name)
+        self.sorted_tokens = None
+
+    @staticmethod
+    def preset_tokens(preset):
+        """
+        Return a {token: weight} dict with the tokens of preset's fields,
+        weighted by the most important field that contains them.
+        """
+        tokens = {}
+        for field, weight in reversed(FIELD_WEIGHTS):
+            for token in tokenize(getattr(preset, field) or ''):
+                tokens[token] = weight
+        return tokens
+
+    def in_category(self, category):
+        """Return the presets of category sorted by name."""
+        return [self.presets[i] for i in
+                sorted(self.categories.get(category, ()))]
+
+    def with_extension(self, extension):
+        """Return the presets that produce extension sorted by name."""
+        return [self.presets[i] for i in
+                sorted(self.extensions.get(extension, ()))]
+
+    def matching(self, word):
+        """
+        Find the presets that have a token starting with the lowercase word.
+
+        Return a list of (score, set of names) tuples, from the highest score
+        to the lowest, where each name is in the set of its best score only.
+        """
+        if self.tokens is None:
+            self.tokens = {}
+            for preset in self.presets.values():
+                self.index_tokens(preset)
+        if self.sorted_tokens is None:
+            self.sorted_tokens = sorted(self.tokens)
+        tokens = self.sorted_tokens
+        start = bisect.bisect_left(tokens, word)
+        end = bisect.bisect_left(tokens, word + LAST_CHAR, start)
+        levels = {}  # score -> list of sets of names
+        for token in tokens[start:end]:
+            bonus = 2 if token == word else 1
+            for weight, names in self.tokens[token].items():
+                levels.setdefault(weight * bonus, []).append(names)
+
+        found = []
+        seen = set()
+        for score in sorted(levels, reverse=True):
+            names = set().union(*levels[score])
+            names.difference_update(seen)
+            if names:
+                seen.update(names)
+                found.append((score, names))
+        return found
+
+    def search(self, text):
+        """
+        Return the presets that have a word starting with any of the words
+        of text in their name, label, extension or params, ignoring case.
+
+        Presets are ranked by the sum of the scores of the words they match,
+        which depend on the fields they match them in (see FIELD_WEIGHTS),
+        then sorted by name.
+        """
+        words = set(WORD.findall(text.lower()))
+        if len(words) == 1:
+            found = self.matching(words.pop())
+        else:
+            scores = {}
+            for word in words:
+                for score, names in self.matching(word):
+                    for name in names:
+                        scores[name] = scores.get(name, 0) + score
+            levels = {}
+            for name, score in scores.items():
+                levels.setdefault(score, []).append(name)
+            found = sorted(levels.items(), reverse=True)
+        return [self.presets[name] for score, names in found
+                for name in sorted(names)]
+
+    def synchronize(self, defaults):
+        """
+        Merge the presets of the PresetStore defaults into this one.
+
+        For each preset in defaults:
+        - if there is no preset with its name, add it
+        - if there is a preset with its name but different values, add
+          a config.presets_old suffix to the name of that preset and add
+          the default one
+        """
+        for default in defaults:
+            current = self.get(default.name)
+            if current is not None and current.values() != default.values():
+                self.remove(current.name)
+                self.add(current.renamed(current.name + config.presets_old))
+                current = None
+            if current is None:
+                self.add(default.renamed(default.name))
+
+    def remove_old(self):
+        """Remove the presets whose names have a config.presets_old suffix."""
+        for name in list(self.presets):
+            if name.endswith(config.presets_old):
+                self.remove(name)
+
+
+class PresetsFile(object):
+    """
+    User's presets file and the PresetStore loaded from it.
+
+    Changes to the store are not written one by one: call changed() after
+    each one and flush() to write them all at once.
+    """
+    def __init__(self, path=None, cache_file=None):
+        """
+        Keyword arguments:
+        path       -- the presets file, config.presets_file by default
+        cache_file -- json cache of the parsed presets,
+                      config.presets_cache_file by default if
+                      config.use_presets_cache is set; '' for no cache
+        """
+        self.path = path or config.presets_file
+        if cache_file is None and config.use_presets_cache:
+            cache_file = config.presets_cache_file
+        self.cache_file = cache_file
+        self.store = None
+        # (size, mtime) of path when it was read or written
+        self.stamp = None
+        self.dirty = False
+
+    def load(self):
+        """
+        Read and return self.store, or the default presets if there is no
+        valid presets file. Unwritten changes are lost.
+        """
+        self.stamp = file_stamp(self.path)
+        self.dirty = False
+        self.store = None
+        if self.stamp is not None:
+            self.store = self.load_cache()
+            if self.store is None:
+                try:
+                    self.store = PresetStore.from_tree(etree.parse(self.path))
+                except (etree.ParseError, OSError):
+                    pass
+                else:
+                    self.save_cache()
+        if self.store is None:
+            self.store = PresetStore.from_tree(load_default_tree())
+        return self.store
+
+    def current(self):
+        """
+        Return self.store, reading it again only if the file changed since
+        it was read or written and self.store has no unwritten changes.
+        """
+        if self.store is None or (not self.dirty and
+                                  self.modified_elsewhere()):
+            return self.load()
+        return self.store
+
+    def load_cache(self):
+        """Return the PresetStore of the cache if it is up to date, or None."""
+        if not self.cache_file:
+            return None
+        try:
+            with open(self.cache_file, encoding='utf8') as f:
+                data = json.load(f)
+            if (data['path'] != os.path.realpath(self.path)
+                    or tuple(data['stamp']) != self.stamp):
+                return None
+            return PresetStore(Preset(*i) for i in data['presets'])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def save_cache(self):
+        """Write self.store to the cache, ignoring errors."""
+        if not self.cache_file or self.stamp is None:
+            return
+        data = json.dumps({
+                'path' : os.path.realpath(self.path),
+                'stamp' : self.stamp,
+                'presets' : [[i.name, i.label, i.params, i.extension,
+                              i.category] for i in self.store]
+                })
+        try:
+            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+            tmp = self.cache_file + '.tmp'
+            with open(tmp, 'w', encoding='utf8') as f:
+                f.write(data)
+            os.replace(tmp, self.cache_file)
+        except OSError:
+            pass
+
+    def replace(self, store):
+        """Replace self.store with another PresetStore."""
+        self.store = store
+        self.changed()
+
+    def changed(self):
+        """Mark self.store as changed since it was read or written."""
+        self.dirty = True
+
+    def modified_elsewhere(self):
+        """Return True if the file changed since it was read or written."""
+        return file_stamp(self.path) != self.stamp
+
+    def flush(self, force=False):
+        """
+        Write self.store if it changed.
+
+        Raise ConflictError if the file was changed by another program
+        meanwhile, unless force is True, and OSError if it cannot be written.
+        """
+        if not self.dirty:
+            return
+        if not force and self.modified_elsewhere():
+            raise ConflictError(self.path)
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        write_tree(self.store.to_tree(), self.path)
+        self.stamp = file_stamp(self.path)
+        self.dirty = False
+        self.save_cache()
+
+
+_presets_file = None
+_presets_file_lock = threading.Lock()
+
+def get_presets_file():
+    """Return the PresetsFile of user's presets, shared by the program."""
+    global _presets_file
+    with _presets_file_lock:
+        if _presets_file is None:
+            _presets_file = PresetsFile()
+        return _presets_file
@@ -26,18 +26,16 @@ from PyQt4.QtGui import (
 
 from ffmulticonverter import utils
 from ffmulticonverter import config
+from ffmulticonverter import presets
 
 
 class ShowPresets(QDialog):
     def __init__(self, parent=None, choose=False):
         super(ShowPresets, self).__init__(parent)
 
-        self.original_presets_file = utils.find_presets_file(
-                config.presets_file_name,
-                config.presets_lookup_dirs,
-                config.presets_lookup_virtenv
-                )
+        self.original_presets_file = presets.original_presets_file()
         self.current_presets_file = config.presets_file
+        self.presets_file = presets.get_presets_file()
 
         self.presQLW = QListWidget()
         labelQL = QLabel(self.tr('Preset label'))
@@ -83,7 +81,7 @@ class ShowPresets(QDialog):
         self.deleteQPB.clicked.connect(self.delete_preset)
         self.delete_allQPB.clicked.connect(self.delete_all_presets)
         self.editQPB.clicked.connect(self.edit_preset)
-        self.searchQLE.textEdited.connect(self.search)
+        self.searchQLE.textEdited.connect(lambda: self.search_timer.start())
         if choose:
             self.presQLW.doubleClicked.connect(okQPB.click)
 
@@ -91,30 +89,26 @@ class ShowPresets(QDialog):
         del_shortcut.setKey(Qt.Key_Delete)
         del_shortcut.activated.connect(self.delete_preset)
 
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(config.presets_search_delay)
+        self.search_timer.timeout.connect(self.search)
+        self.save_timer = QTimer(self)
+        self.save_timer.setSingleShot(True)
+        self.save_timer.setInterval(config.presets_save_delay)
+        self.save_timer.timeout.connect(self.save_presets)
+
         self.resize(430, 480)
         self.setWindowTitle(self.tr('Edit Presets'))
 
-        QTimer.singleShot(0, self.load_xml)
+        QTimer.singleShot(0, self.load_presets)
         QTimer.singleShot(0, self.fill_presQLW)
 
-    def load_xml(self):
-        """Load xml tree and set xml root."""
-        try:
-            self.tree = etree.parse(self.current_presets_file)
-        except (etree.ParseError, IOError):
-            try:
-                self.tree = etree.parse(self.original_presets_file)
-            except IOError:
-                # when program is not installed
-                try:
-                    self.tree = etree.parse('share/' + config.presets_file_name)
-                except IOError:
-                    # when running from test_dialogs.py
-                    self.tree = etree.parse(
-                            '../share/' + config.presets_file_name)
-            if not os.path.exists(config.config_dir):
-                os.makedirs(config.config_dir)
-        self.root = self.tree.getroot()
+    def load_presets(self):
+        """Load user's presets into self.store."""
+        self.store = self.presets_file.current()
+        if not os.path.exists(config.config_dir):
+            os.makedirs(config.config_dir)
 
     def set_buttons_clear_lineEdits(self):
         """Enable or disable button's and clear lineEdits."""
@@ -127,129 +121,160 @@ class ShowPresets(QDialog):
             self.commandQLE.clear()
             self.extQLE.clear()
 
-    def fill_presQLW(self):
-        """Clear self.presQLW and to it presets' tags."""
-        self.presQLW.clear()
-        for i in sorted([y.tag for y in self.root]):
-            elem = self.root.find(i)
-            self.presQLW.addItem(utils.XmlListItem(i, elem))
+    def show_presets(self, found):
+        """
+        Make self.presQLW list the presets of found in that order.
+
+        Items of presets that are already listed are reused, so that refining
+        a search only removes the rows that no longer match.
+        """
+        wanted = dict((preset.name, preset) for preset in found)
+        for row in reversed(range(self.presQLW.count())):
+            item = self.presQLW.item(row)
+            if wanted.get(item.preset.name) is not item.preset:
+                self.presQLW.takeItem(row)
+
+        items = [self.presQLW.item(row) for row in
+                 range(self.presQLW.count())]
+        shown = dict((item.preset.name, item) for item in items)
+        if ([item.preset for item in items] !=
+                [preset for preset in found if preset.name in shown]):
+            # ranking changed, take all items and insert them in order
+            for row in reversed(range(len(items))):
+                self.presQLW.takeItem(row)
+
+        for row, preset in enumerate(found):
+            item = self.presQLW.item(row)
+            if item is not None and item.preset is preset:
+                continue
+            item = shown.get(preset.name)
+            if item is None:
+                item = utils.PresetListItem(preset.name, preset)
+            self.presQLW.insertItem(row, item)
 
         self.presQLW.setCurrentRow(0)
         self.set_buttons_clear_lineEdits()
+
+    def fill_presQLW(self):
+        """List all presets in self.presQLW and clear search."""
+        self.search_timer.stop()
+        self.show_presets(list(self.store))
         self.searchQLE.clear()
 
     def show_preset(self):
-        """Fill LineEdits with current xml element's values."""
+        """Fill LineEdits with current preset's values."""
         try:
-            xml_elem = self.presQLW.currentItem().xml_element
+            preset = self.presQLW.currentItem().preset
         except AttributeError:
             return
 
-        self.labelQLE.setText(xml_elem[0].text)
-        self.commandQLE.setText(xml_elem[1].text)
+        self.labelQLE.setText(preset.label)
+        self.commandQLE.setText(preset.params)
         self.commandQLE.home(False)
-        self.extQLE.setText(xml_elem[2].text)
+        self.extQLE.setText(preset.extension)
 
     def add_preset(self):
-        """Open AddorEditPreset() dialog and add a preset xml root."""
+        """Open AddorEditPreset() dialog and add a preset to self.store."""
         dialog = AddorEditPreset(None, False, self)
         if dialog.exec_():
-            element = etree.Element(dialog.name_text)
-            label = etree.Element('label')
-            label.text = dialog.label_text
-            command = etree.Element('params')
-            command.text = dialog.command_text
-            ext = etree.Element('extension')
-            ext.text = dialog.ext_text
-            category = etree.Element('category')
-            category.text = 'Scattered'
-
-            for num, elem in enumerate([label, command, ext, category]):
-                element.insert(num, elem)
-            index = sorted(
-                    [i.tag for i in self.root] + [dialog.name_text]
-                    ).index(dialog.name_text)
-            self.root.insert(index, element)
-            self.save_tree()
+            self.store.add(presets.Preset(
+                    dialog.name_text, dialog.label_text, dialog.command_text,
+                    dialog.ext_text, 'Scattered'))
+            self.store_changed()
             self.fill_presQLW()
 
     def delete_preset(self):
         """
         Ask user wether he wants to delete the selected preset.
-        If so, delete the preset from xml root.
+        If so, delete the preset from self.store.
         """
         try:
-            xml_elem = self.presQLW.currentItem().xml_element
+            preset = self.presQLW.currentItem().preset
         except AttributeError:
             return
 
         reply = QMessageBox.question(self, 'FF Multi Converter - ' + self.tr(
             'Delete Preset'), self.tr('Are you sure that you want to delete '
-            'the {0} preset?'.format(xml_elem.tag)),
+            'the {0} preset?'.format(preset.name)),
             QMessageBox.Yes|QMessageBox.Cancel)
         if reply == QMessageBox.Yes:
-            self.root.remove(xml_elem)
-            self.save_tree()
+            self.store.remove(preset.name)
+            self.store_changed()
             self.fill_presQLW()
 
     def delete_all_presets(self):
         """
         Ask user if he wants to delete all presets.
-        If so, clear xml root.
+        If so, clear self.store.
         """
         reply = QMessageBox.question(self, 'FF Multi Converter - ' + self.tr(
             'Delete Preset'), self.tr('Are you sure that you want to delete '
             'all presets?'), QMessageBox.Yes|QMessageBox.Cancel)
         if reply == QMessageBox.Yes:
-            self.root.clear()
-            self.save_tree()
+            self.store.clear()
+            self.store_changed()
             self.fill_presQLW()
 
     def edit_preset(self):
-        """Call the AddorEditPreset() dialog and update xml element's values."""
-        elem = self.presQLW.currentItem().xml_element
-        dialog = AddorEditPreset(elem, True)
+        """Call the AddorEditPreset() dialog and update preset's values."""
+        preset = self.presQLW.currentItem().preset
+        dialog = AddorEditPreset(preset, True)
 
         if dialog.exec_():
-            elem.tag = dialog.name_text
-            elem[0].text = dialog.label_text
-            elem[1].text = dialog.command_text
-            elem[2].text = dialog.ext_text
-            self.save_tree()
+            self.store.remove(preset.name)
+            self.store.add(presets.Preset(
+                    dialog.name_text, dialog.label_text, dialog.command_text,
+                    dialog.ext_text, preset.category))
+            self.store_changed()
             self.fill_presQLW()
 
     def search(self):
         """
         Search for keywords in presets data.
 
-        Show a preset only if its tag, label or extension matches any of
-        search string's tokens.
+        Show the presets that have a word starting with any of search
+        string's words, best matches first (see PresetStore.search()).
         """
-        txt = self.searchQLE.text().strip().lower()
+        txt = self.searchQLE.text().strip()
         if not txt:
             self.fill_presQLW()
             return
 
-        self.presQLW.clear()
-        for i in txt.split(' '):
-            for p in sorted([y.tag for y in self.root]):
-                elem = self.root.find(p)
-                if (i.strip() and (
-                        i in elem.tag.lower()
-                        or i in elem[0].text.lower()
-                        or i in elem[2].text.lower())):
-                    self.presQLW.addItem(utils.XmlListItem(p, elem))
+        self.show_presets(self.store.search(txt))
 
-        self.presQLW.setCurrentRow(0)
-        self.set_buttons_clear_lineEdits()
+    def store_changed(self):
+        """Schedule the changes of self.store to be written."""
+        self.presets_file.changed()
+        self.save_timer.start()
+
+    def save_presets(self, force=False):
+        """
+        Write the changes of user's presets.
 
-    def save_tree(self):
-        """Save xml tree."""
-        with open(self.current_presets_file, 'wb') as _file:
+        If the presets file was changed by another program meanwhile, ask
+        user whether to overwrite it, or else to discard the changes.
+        Overwrite it without asking if force is True.
+        """
+        self.save_timer.stop()
+        try:
             try:
-                etree.ElementTree(self.root).write(_file)
-            except:
-                pass
+                self.presets_file.flush(force)
+            except presets.ConflictError:
+                reply = QMessageBox.question(
+                        self, 'FF Multi Converter - ' +
+                        self.tr('Save presets'),
+                        self.tr('The presets have been changed by another '
+                        'program. Do you want to overwrite these changes?'),
+                        QMessageBox.Yes|QMessageBox.No)
+                if reply == QMessageBox.Yes:
+                    self.presets_file.flush(force=True)
+                else:
+                    self.store = self.presets_file.load()
+                    self.fill_presQLW()
+        except OSError as e:
+            QMessageBox.warning(
+                    self, 'FF Multi Converter - ' + self.tr('Error!'),
+                    self.tr('Presets could not be saved:') + '\n' + str(e))
 
     def import_presets(self):
         """Import an xml tree."""
@@ -262,12 +287,13 @@ class ShowPresets(QDialog):
             if fname:
                 msg = self.tr('Successful import!')
                 try:
-                    self.tree = etree.parse(fname)
-                except:
+                    self.store = presets.PresetStore.from_tree(
+                            etree.parse(fname))
+                except (etree.ParseError, OSError):
                     msg = self.tr('Import failed!')
                 else:
-                    self.root = self.tree.getroot()
-                    self.save_tree()
+                    self.presets_file.replace(self.store)
+                    self.save_presets(force=True)
                 QMessageBox.information(self, title, msg)
 
     def export_presets(self):
@@ -276,12 +302,13 @@ class ShowPresets(QDialog):
                 self, 'FF Multi Converter - ' + self.tr('Export presets'),
                 config.home + '/presets-' + time.strftime("%Y-%m-%d") + '.xml')
         if fname:
-            self.load_xml()
-            with open(fname, 'wb') as _file:
-                try:
-                    etree.ElementTree(self.root).write(_file)
-                except:
-                    pass
+            self.load_presets()
+            try:
+                presets.write_tree(self.store.to_tree(), fname)
+            except OSError as e:
+                QMessageBox.warning(
+                        self, 'FF Multi Converter - ' + self.tr('Error!'),
+                        self.tr('Export failed!') + '\n' + str(e))
 
     def reset(self):
         """Import the default xml tree."""
@@ -291,6 +318,8 @@ class ShowPresets(QDialog):
         if reply == QMessageBox.Yes:
             if os.path.exists(self.current_presets_file):
                 os.remove(self.current_presets_file)
+            # drop any unwritten changes of the shared presets
+            self.presets_file.load()
 
             QMessageBox.information(self, ' ',
                     self.tr('Default presets restored successfully.'))
@@ -315,45 +344,19 @@ class ShowPresets(QDialog):
         if not reply == QMessageBox.Yes:
             return
 
-        def_tree = etree.parse(self.original_presets_file)
-        def_root = def_tree.getroot()
-        self.load_xml()
-
-        for i in def_root:
-            for n, y in enumerate(self.root):
-                if i.tag == y.tag:
-                    if not (i[0].text == y[0].text
-                            and i[1].text == y[1].text
-                            and i[2].text == y[2].text):
-                        # copy element and change its name
-                        elem = etree.Element(y.tag)
-                        label = etree.Element('label')
-                        label.text = i[0].text
-                        command = etree.Element('params')
-                        command.text = i[1].text
-                        ext = etree.Element('extension')
-                        ext.text = i[2].text
-                        elem.insert(0, label)
-                        elem.insert(1, command)
-                        elem.insert(2, ext)
-
-                        y.tag = y.tag + config.presets_old
-                        self.root.insert(n+1, elem)
-                    break
-            else:
-                # preset not found
-                index = sorted([x.tag for x in self.root] +
-                               [i.tag]).index(i.tag)
-                self.root.insert(index, i)
-
-        self.save_tree()
+        defaults = presets.PresetStore.from_tree(
+                etree.parse(self.original_presets_file))
+        self.load_presets()
+        self.store.synchronize(defaults)
+        self.presets_file.changed()
+        self.save_presets()
 
         QMessageBox.information(self, ' ',
                 self.tr(
                 'Synchronization completed.\nYour presets are up to date!'))
 
     def remove_old(self):
-        """Remove those xml elements which their tags has an __OLD suffix."""
+        """Remove those presets which their names has an __OLD suffix."""
         reply = QMessageBox.question(self, 'FF Multi Converter - ' + self.tr(
             'Remove old presets'), self.tr('All presets with an __OLD suffix '
             'will be deleted. Are you sure that you want to continue?'),
@@ -361,33 +364,33 @@ class ShowPresets(QDialog):
         if not reply == QMessageBox.Yes:
             return
 
-        self.load_xml()
-
-        for i in self.root:
-            if i.tag.endswith(config.presets_old):
-                self.root.remove(i)
-
-        self.save_tree()
+        self.load_presets()
+        self.store.remove_old()
+        self.presets_file.changed()
+        self.save_presets()
 
         QMessageBox.information(self, ' ',
                 self.tr('Old presets successfully removed.'))
 
     def accept(self):
         """
-        Save current xml element's values in order to be used from
+        Save current preset's values in order to be used from
         main program and close (accept) dialog.
         """
         self.the_command = None
         if self.presQLW:
-            self.the_command = self.presQLW.currentItem()\
-                    .xml_element[1].text
-            self.the_extension = self.presQLW.currentItem()\
-                    .xml_element[2].text
+            self.the_command = self.presQLW.currentItem().preset.params
+            self.the_extension = self.presQLW.currentItem().preset.extension
         QDialog.accept(self)
 
+    def done(self, result):
+        """Write any pending changes of the presets and close the dialog."""
+        self.save_presets()
+        QDialog.done(self, result)
+
 
 class AddorEditPreset(QDialog):
-    def __init__(self, xml_element, edit=False, parent=None):
+    def __init__(self, preset, edit=False, parent=None):
         super(AddorEditPreset, self).__init__(parent)
 
         nameQL = QLabel(self.tr('Preset name (one word, A-z, 0-9)'))
@@ -414,13 +417,13 @@ class AddorEditPreset(QDialog):
         self.resize(410, 280)
 
         if edit:
-            self.nameQLE.setText(xml_element.tag)
-            self.labelQLE.setText(xml_element[0].text)
-            self.commandQLE.setText(xml_element[1].text)
+            self.nameQLE.setText(preset.name)
+            self.labelQLE.setText(preset.label)
+            self.commandQLE.setText(preset.params)
             self.commandQLE.home(False)
-            self.extQLE.setText(xml_element[2].text)
+            self.extQLE.setText(preset.extension)
 
-            title = self.tr('Edit {0}'.format(xml_element.tag))
+            title = self.tr('Edit {0}'.format(preset.name))
         else:
             title = self.tr('Add preset')
 
@@ -0,0 +1,292 @@
+# Copyright (C) 2011-2015 Ilias Stamatis <stamatis.iliass@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Media information using ffprobe (or avprobe).
+
+The format and streams of each file are probed once and kept in a
+persistent cache, keyed by the path, size and modification time of the
+file, so that the engine, the tabs and the files list share them across
+sessions.
+
+Example:
+    probe.probe_all(paths)          # in parallel, e.g. in the background
+    probe.duration(paths[0])        # from the cache
+    probe.save()
+"""
+
+import os
+import json
+import atexit
+import shutil
+import threading
+import subprocess
+import concurrent.futures
+
+from ffmulticonverter import config
+
+
+def find_prober():
+    """Return the name of the installed probe program or None."""
+    for program in ('ffprobe', 'avprobe'):
+        if shutil.which(program):
+            return program
+    return None
+
+prober = find_prober()
+
+# the fields of ffprobe's output that are used and kept in the cache
+FORMAT_FIELDS = ('duration', 'bit_rate')
+STREAM_FIELDS = ('codec_type', 'codec_name', 'width', 'height',
+                 'avg_frame_rate', 'bit_rate', 'sample_rate', 'channels')
+
+
+def seconds_to_duration(seconds):
+    """Return seconds as a string of type hh:mm:ss."""
+    seconds = int(seconds)
+    return '{0:02d}:{1:02d}:{2:02d}'.format(
+            seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+def select_fields(result):
+    """
+    Return a copy of the probe result with only the format and the stream
+    fields that are used, or None if result is None.
+    """
+    if result is None:
+        return None
+    return {
+            'format' : {key : value
+                        for key, value in result.get('format', {}).items()
+                        if key in FORMAT_FIELDS},
+            'streams' : [{key : value for key, value in stream.items()
+                          if key in STREAM_FIELDS}
+                         for stream in result.get('streams', [])]
+            }
+
+
+class ProbeCache(object):
+    """
+    Persistent cache of probe results with a maximum number of entries.
+    The oldest entries are removed when the cache grows too big.
+    """
+    def __init__(self, cache_file=None, max_entries=None):
+        """
+        Keyword arguments:
+        cache_file  -- where the cache is saved, config.probe_cache_file
+                       by default
+        max_entries -- maximum number of files in the cache,
+                       config.probe_cache_entries by default
+        """
+        self.cache_file = cache_file or config.probe_cache_file
+        self.max_entries = max_entries or config.probe_cache_entries
+        self.lock = threading.Lock()
+        self.changed = False
+        # real path -> [size, modification time, probe result]
+        self.entries = {}
+        try:
+            with open(self.cache_file, encoding='utf8') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            pass
+        # caches of older versions keep the whole output of ffprobe
+        for entry in self.entries.values():
+            entry[2] = select_fields(entry[2])
+
+    def identity(self, path):
+        """Return the real path, size and mtime of path or None."""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return os.path.realpath(path), stat.st_size, stat.st_mtime_ns
+
+    def get(self, path):
+        """
+        Return a (found, result) tuple. found is False if path has not been
+        probed since it was last modified.
+        """
+        identity = self.identity(path)
+        if identity is None:
+            return False, None
+        with self.lock:
+            entry = self.entries.get(identity[0])
+        if entry is None or entry[:2] != list(identity[1:]):
+            return False, None
+        return True, entry[2]
+
+    def put(self, path, result):
+        """Save result, None for files that cannot be probed, for path."""
+        identity = self.identity(path)
+        if identity is None:
+            return
+        with self.lock:
+            # re-inserting keeps the newest entries last
+            self.entries.pop(identity[0], None)
+            self.entries[identity[0]] = [identity[1], identity[2], result]
+            while len(self.entries) > self.max_entries:
+                del self.entries[next(iter(self.entries))]
+            self.changed = True
+
+    def save(self):
+        """Write the cache to disk if it changed."""
+        with self.lock:
+            if not self.changed:
+                return
+            data = json.dumps(self.entries)
+            self.changed = False
+        try:
+            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+            tmp = self.cache_file + '.tmp'
+            with open(tmp, 'w', encoding='utf8') as f:
+                f.write(data)
+            os.replace(tmp, self.cache_file)
+        except OSError:
+            pass
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    """Return the probe cache of the program."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ProbeCache()
+            atexit.register(save)
+        return _cache
+
+def save():
+    """Write the probe cache of the program to disk."""
+    if _cache is not None:
+        _cache.save()
+
+def run_prober(path):
+    """
+    Return ffprobe's information about the format and the streams of path
+    as a dict with the fields in FORMAT_FIELDS and STREAM_FIELDS, or None
+    if path cannot be probed.
+    """
+    cmd = [prober, '-v', 'error', '-show_format', '-show_streams',
+           '-of', 'json', path]
+    try:
+        output = subprocess.check_output(cmd, stderr=subprocess.DEVNULL)
+        result = json.loads(output.decode('utf8', 'replace'))
+    except (OSError, subprocess.CalledProcessError, ValueError):
+        return None
+    return select_fields(result)
+
+def info(path):
+    """
+    Return the information about path, probing it if it is not cached,
+    or None if it cannot be probed.
+    """
+    if prober is None:
+        return None
+    found, result = get_cache().get(path)
+    if not found:
+        result = run_prober(path)
+        get_cache().put(path, result)
+    return result
+
+def cached_info(path):
+    """
+    Return the cached information about path, or None if path has not been
+    probed yet. Never runs the prober, so it is fast enough for views.
+    """
+    return get_cache().get(path)[1]
+
+def probe_all(paths, workers=None):
+    """
+    Probe the paths that are not cached in parallel.
+
+    Keyword arguments:
+    paths   -- list of files
+    workers -- number of probes that run at the same time,
+               config.probe_jobs by default
+    """
+    if prober is None:
+        return
+    paths = [i for i in paths if not get_cache().get(i)[0]]
+    if not paths:
+        return
+    workers = min(workers or config.probe_jobs, len(paths))
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        list(executor.map(info, paths))
+
+def duration(path):
+    """Return the duration of media file path in seconds or None."""
+    result = info(path)
+    if result is None:
+        return None
+    try:
+        return float(result['format']['duration']) or None
+    except (KeyError, ValueError):
+        return None
+
+def streams(path):
+    """
+    Return the list of streams of media file path as dicts with the
+    ffprobe fields in STREAM_FIELDS, e.g. codec_type, codec_name, width and
+    sample_rate, or None if they cannot be read.
+    """
+    result = info(path)
+    return result['streams'] if result is not None else None
+
+def describe(result):
+    """
+    Return a short description of a probe result, e.g.
+    'h264 1280x720, aac 44100 Hz, 00:01:30', or an empty string.
+    """
+    if not result:
+        return ''
+    parts = []
+    for stream in result.get('streams', []):
+        if stream.get('codec_type') == 'video':
+            parts.append('{0} {1}x{2}'.format(
+                    stream.get('codec_name'), stream.get('width'),
+                    stream.get('height')))
+        elif stream.get('codec_type') == 'audio':
+            parts.append('{0} {1} Hz'.format(
+                    stream.get('codec_name'), stream.get('sample_rate')))
+    try:
+        parts.append(seconds_to_duration(float(result['format']['duration'])))
+    except (KeyError, ValueError):
+        pass
+    return ', '.join(parts)
+
+def keyframes(path):
+    """
+    Return the sorted timestamps in seconds of the keyframes of the first
+    video stream of path, or None if they cannot be read.
+    """
+    if prober is None:
+        return None
+    # packets are not decoded, so this is much faster than reading frames
+    cmd = [prober, '-v', 'error', '-select_streams', 'v:0',
+           '-show_entries', 'packet=pts_time,flags', '-of', 'csv=p=0', path]
+    try:
+        output = subprocess.check_output(cmd, stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    times = []
+    for line in output.decode('utf8', 'replace').splitlines():
+        pts_time, sep, flags = line.strip().partition(',')
+        if 'K' in flags:
+            try:
+                times.append(float(pts_time))
+            except ValueError:
+                pass
+    return sorted(times) or None
@@ -14,44 +14,64 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import os
-import re
-import io
-import signal
-import threading
-import subprocess
-import shlex
-import logging
+import glob
+import itertools
 
 from PyQt4.QtCore import pyqtSignal, QTimer
 from PyQt4.QtGui import (
         QApplication, QDialog, QFrame, QLabel, QPushButton, QProgressBar,
-        QMessageBox, QTextEdit, QCommandLinkButton, QTextCursor, QSizePolicy
+        QMessageBox, QCommandLinkButton, QSizePolicy
         )
 
 from ffmulticonverter import utils
+from ffmulticonverter import config
+from ffmulticonverter import engine
+from ffmulticonverter import cache
+from ffmulticonverter import journal
+
+
+_output_files = itertools.count(1)
+
+def output_file():
+    """
+    Return the path of a new file for the whole output of a conversion,
+    named after the process and a counter, so that conversions running at
+    the same time do not write to the same file. Only the newest
+    config.output_files_kept files are kept.
+    """
+    root, ext = os.path.splitext(config.last_output_file)
+    old = []
+    for path in glob.glob(glob.escape(root) + '-*' + ext):
+        try:
+            old.append((os.path.getmtime(path), path))
+        except OSError:
+            pass
+    extra = max(0, len(old) - config.output_files_kept + 1)
+    for mtime, path in sorted(old)[:extra]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    return '{0}-{1}-{2}{3}'.format(
+            root, os.getpid(), next(_output_files), ext)
 
 
 class Progress(QDialog):
-    file_converted_signal = pyqtSignal()
-    refr_bars_signal = pyqtSignal(int)
-    update_text_edit_signal = pyqtSignal(str)
+    engine_event_signal = pyqtSignal(object)
 
-    def __init__(self, files, tab, delete, parent, test=False):
+    def __init__(self, files, tab, delete, parent, test=False,
+                 converter=None, replaces=None):
         """
         Keyword arguments:
-        files  -- list with dicts containing file names
+        files  -- list of engine.Job, as returned by
+                  engine.create_paths_list()
         tab -- instanseof AudioVideoTab, ImageTab or DocumentTab
                indicating currently active tab
         delete -- boolean that shows if files must removed after conversion
         parent -- parent widget
-
-        files:
-        Each dict have only one key and one corresponding value.
-        Key is a file to be converted and it's value is the name of the new
-        file that will be converted.
-
-        Example list:
-        [{"/foo/bar.png" : "/foo/bar.bmp"}, {"/f/bar2.png" : "/f/bar2.bmp"}]
+        converter -- converter to use instead of one created from tab's
+                     data, e.g. to resume a batch
+        replaces  -- id of the journal batch that is resumed
         """
         super(Progress, self).__init__(parent)
         self.parent = parent
@@ -60,16 +80,36 @@ class Progress(QDialog):
         self.tab = tab
         self._type = tab.name
         self.delete = delete
-        if not test:
-            self.step = int(100 / len(files))
         self.ok = 0
         self.error = 0
-        self.running = True
 
-        self.nowQL = QLabel(self.tr('In progress: '))
+        if converter is None:
+            self.get_data() # should be first and not in singleShot()
+        else:
+            self.converter = converter
+
+        self.engine = engine.Engine(
+                self.converter, files,
+                getattr(self.parent, 'max_jobs', config.max_jobs),
+                delete, self.engine_event_signal.emit,
+                cache.ResultCache() if config.use_cache else None,
+                journal.get_journal(), replaces
+                )
+        self.percents = [0] * self.engine.max_jobs
+
+        self.nowQLs = []
+        self.nowQPBars = []
+        slot_items = []
+        for i in range(self.engine.max_jobs):
+            label = QLabel(self.tr('In progress: '))
+            bar = QProgressBar()
+            bar.setValue(0)
+            self.nowQLs.append(label)
+            self.nowQPBars.append(bar)
+            slot_items.extend([utils.add_to_layout('h', None, label, None), bar])
+        self.nowQL = self.nowQLs[0]
+        self.nowQPBar = self.nowQPBars[0]
         totalQL = QLabel(self.tr('Total:'))
-        self.nowQPBar = QProgressBar()
-        self.nowQPBar.setValue(0)
         self.totalQPBar = QProgressBar()
         self.totalQPBar.setValue(0)
         self.cancelQPB = QPushButton(self.tr('Cancel'))
@@ -81,42 +121,53 @@ class Progress(QDialog):
         line = QFrame()
         line.setFrameShape(QFrame.HLine)
         line.setFrameShadow(QFrame.Sunken)
-        self.outputQTE = QTextEdit()
-        self.outputQTE.setReadOnly(True)
+        if not os.path.exists(config.log_dir):
+            os.makedirs(config.log_dir)
+        self.output_file = output_file()
+        self.logView = utils.LogView(
+                config.log_view_lines, config.log_view_interval,
+                self.output_file)
+        logQL = QLabel(self.tr('Full output:') + ' ' + self.output_file)
+        logQL.setWordWrap(True)
         self.frame = QFrame()
-        frame_layout = utils.add_to_layout('h', self.outputQTE)
+        frame_layout = utils.add_to_layout('v', self.logView, logQL)
         self.frame.setLayout(frame_layout)
         self.frame.hide()
 
-        hlayout = utils.add_to_layout('h', None, self.nowQL, None)
         hlayout2 = utils.add_to_layout('h', None, totalQL, None)
         hlayout3 = utils.add_to_layout('h', detailsQPB, line)
         hlayout4 = utils.add_to_layout('h', self.frame)
         hlayout5 = utils.add_to_layout('h', None, self.cancelQPB)
         vlayout = utils.add_to_layout(
-                'v', hlayout, self.nowQPBar, hlayout2, self.totalQPBar, None,
-                hlayout3, hlayout4, hlayout5
+                'v', *(slot_items + [hlayout2, self.totalQPBar, None,
+                hlayout3, hlayout4, hlayout5])
                 )
         self.setLayout(vlayout)
 
         detailsQPB.toggled.connect(self.resize_dialog)
         detailsQPB.toggled.connect(self.frame.setVisible)
         self.cancelQPB.clicked.connect(self.reject)
-        self.file_converted_signal.connect(self.next_file)
-        self.refr_bars_signal.connect(self.refresh_progress_bars)
-        self.update_text_edit_signal.connect(self.update_text_edit)
+        self.engine_event_signal.connect(self.handle_event)
 
-        self.resize(484, 200)
+        # every extra conversion slot needs some more vertical space
+        self.base_height = 200 + 50 * (self.engine.max_jobs - 1)
+        self.resize(484, self.base_height)
         self.setWindowTitle('FF Multi Converter - ' + self.tr('Conversion'))
 
-        self.get_data() # should be first and not in singleShot()
         if not test:
             QTimer.singleShot(0, self.manage_conversions)
 
     def get_data(self):
-        """Collect conversion data from parents' widgets."""
+        """
+        Collect conversion data from parents' widgets and create the
+        converter of the active tab.
+        """
         if self._type == 'AudioVideo':
             self.cmd = self.tab.commandQLE.text()
+            self.converter = engine.VideoConverter(
+                    self.parent.vidconverter, self.cmd,
+                    getattr(self.parent, 'max_ffmpeg_jobs', None),
+                    getattr(self.parent, 'video_segments', None))
         elif self._type == 'Images':
             width = self.tab.widthQLE.text()
             self.size = ''
@@ -135,74 +186,138 @@ class Progress(QDialog):
                 self.imgcmd += ' -flip'
             if self.tab.hflipQChB.isChecked():
                 self.imgcmd += ' -flop'
+            self.converter = engine.ImageConverter(
+                    self.size, self.mntaspect, self.imgcmd,
+                    getattr(self.parent, 'max_imagemagick_jobs', None))
+        else:
+            self.converter = engine.DocumentConverter(
+                    getattr(self.parent, 'max_unoconv_jobs', None))
 
     def resize_dialog(self):
         """Resize dialog."""
-        height = 200 if self.frame.isVisible() else 366
+        height = self.base_height
+        if not self.frame.isVisible():
+            height += 166
         self.setMinimumSize(484, height)
         self.resize(484, height)
 
     def update_text_edit(self, txt):
-        """Append txt to the end of current self.outputQTE's text."""
-        current = self.outputQTE.toPlainText()
-        self.outputQTE.setText(current+txt)
-        self.outputQTE.moveCursor(QTextCursor.End)
-
-    def refresh_progress_bars(self, now_percent):
-        """Refresh the values of self.nowQPBar and self.totalQPBar."""
-        total_percent = int(((now_percent * self.step) / 100) + self.min_value)
-
-        if now_percent > self.nowQPBar.value() and not (now_percent > 100):
-            self.nowQPBar.setValue(now_percent)
-        if (total_percent > self.totalQPBar.value() and
-        not (total_percent > self.max_value)):
-            self.totalQPBar.setValue(total_percent)
-
-    def manage_conversions(self):
+        """Append txt to the end of self.logView's text."""
+        self.logView.append_text(txt)
+
+    def refresh_progress_bars(self, slot, now_percent):
+        """Refresh the value of slot's progress bar."""
+        if now_percent > self.percents[slot] and not (now_percent > 100):
+            self.percents[slot] = now_percent
+            self.nowQPBars[slot].setValue(now_percent)
+
+    def show_stats(self, slot, speed, fps, eta):
+        """Show encoding speed, fps and remaining time in slot's bar."""
+        stats = []
+        if speed is not None:
+            stats.append('{0:.2f}x'.format(speed))
+        if fps is not None:
+            stats.append('{0:.0f} fps'.format(fps))
+        if eta is not None:
+            stats.append(self.tr('ETA') + ' ' + utils.seconds_to_duration(eta))
+        text = '%p%'
+        if stats:
+            text += ' - ' + ', '.join(stats)
+        self.nowQPBars[slot].setFormat(text)
+
+    def refresh_total_bar(self, total_percent, total_eta):
         """
-        Check whether all files have been converted.
-        If not, it will allow convert_a_file() to convert the next file.
+        Set self.totalQPBar's value to the weighted progress of all files
+        computed by the engine and show the remaining time of the batch.
         """
-        if not self.running:
-            return
-        if not self.files:
-            self.totalQPBar.setValue(100)
-        if self.totalQPBar.value() >= 100:
-            sum_files = self.ok + self.error
-            msg = QMessageBox(self)
-            msg.setStandardButtons(QMessageBox.Ok)
-            msg.setWindowTitle(self.tr("Report"))
-            msg.setText(self.tr("Converted: {0}/{1}".format(self.ok,sum_files)))
-            msg.setModal(False)
-            msg.show()
-
-            self.cancelQPB.setText(self.tr("Close"))
+        if total_percent > self.totalQPBar.value():
+            self.totalQPBar.setValue(min(total_percent, 100))
+        text = '%p%'
+        if total_eta is not None:
+            text += ' - ' + self.tr('ETA') + ' ' + \
+                    utils.seconds_to_duration(total_eta)
+        self.totalQPBar.setFormat(text)
+
+    def finished(self):
+        """Return True if all files have been processed."""
+        return self.ok + self.error >= len(self.files)
+
+    def manage_conversions(self):
+        """Start the conversion engine."""
+        self.engine.start()
+
+    def handle_event(self, event):
+        """Update the dialog according to an event of the engine."""
+        if event.kind == engine.STARTED:
+            self.start_file(event.slot, event.job.source)
+        elif event.kind == engine.PROGRESS:
+            self.refresh_progress_bars(event.slot, event.percent)
+            self.show_stats(event.slot, event.speed, event.fps, event.eta)
+            self.refresh_total_bar(event.total_percent, event.total_eta)
+        elif event.kind == engine.OUTPUT:
+            self.update_text_edit(event.text)
+        elif event.kind == engine.FINISHED:
+            self.next_file(event.slot, event.result.success)
+            self.refresh_total_bar(event.total_percent, event.total_eta)
+        elif event.kind == engine.DONE:
+            self.logView.close_spill()
+            if not self.engine.cancelled:
+                self.show_report()
+
+    def show_report(self):
+        """Show how many files converted successfully."""
+        self.totalQPBar.setValue(100)
+        self.totalQPBar.setFormat('%p%')
+        sum_files = self.ok + self.error
+        msg = QMessageBox(self)
+        msg.setStandardButtons(QMessageBox.Ok)
+        msg.setWindowTitle(self.tr("Report"))
+        text = self.tr("Converted: {0}/{1}".format(self.ok,sum_files))
+        if self.engine.cache is not None and self.engine.cache.hits:
+            text += '\n' + self.tr('Unchanged, taken from cache: {0}').format(
+                    self.engine.cache.hits)
+        msg.setText(text)
+        msg.setModal(False)
+        msg.show()
+
+        self.cancelQPB.setText(self.tr("Close"))
+
+    def start_file(self, slot, from_file):
+        """Update slot's label with current file's name and reset its bar."""
+        if len(from_file) > 40:
+            # split file name if it is too long in order to display it properly
+            text = '.../' + from_file.split('/')[-1]
         else:
-            self.convert_a_file()
+            text = from_file
+
+        self.nowQLs[slot].setText(self.tr('In progress:') + ' ' + text)
+        self.percents[slot] = 0
+        self.nowQPBars[slot].setValue(0)
+        self.nowQPBars[slot].setFormat('%p%')
 
-    def next_file(self):
+    def next_file(self, slot, success):
         """
-        Update progress bars values, remove converted file from self.files
-        and call manage_conversions() to continue the process.
+        Count the result of the file converted in slot and update progress
+        bars values.
         """
-        self.totalQPBar.setValue(self.max_value)
-        self.nowQPBar.setValue(100)
+        if success:
+            self.ok += 1
+        else:
+            self.error += 1
+        self.percents[slot] = 0
+        self.nowQPBars[slot].setValue(100)
         QApplication.processEvents()
-        self.files.pop(0)
-        self.manage_conversions()
 
     def reject(self):
         """
         Use standard dialog to ask whether procedure must stop or not.
-        Use the SIGSTOP to stop the conversion process while waiting for user
-        to respond and SIGCONT or kill depending on user's answer.
+        Pause the conversion processes while waiting for user to respond
+        and resume or kill them depending on user's answer.
         """
-        if not self.files:
+        if self.finished():
             QDialog.accept(self)
             return
-        if self._type == 'AudioVideo':
-            self.process.send_signal(signal.SIGSTOP)
-        self.running = False
+        self.engine.pause()
         reply = QMessageBox.question(
                 self,
                 'FF Multi Converter - ' + self.tr('Cancel Conversion'),
@@ -210,211 +325,8 @@ class Progress(QDialog):
                 QMessageBox.Yes|QMessageBox.Cancel
                 )
         if reply == QMessageBox.Yes:
-            if self._type == 'AudioVideo':
-                self.process.kill()
-            self.running = False
-            self.thread.join()
+            self.engine.cancel()
+            self.engine.wait()
             QDialog.reject(self)
         if reply == QMessageBox.Cancel:
-            self.running = True
-            if self._type == 'AudioVideo':
-                self.process.send_signal(signal.SIGCONT)
-            else:
-                self.manage_conversions()
-
-    def convert_a_file(self):
-        """
-        Update self.nowQL's text with current file's name, set self.nowQPBar
-        value to zero and start the conversion procedure in a second thread
-        using threading module.
-        """
-        if not self.files:
-            return
-        from_file = list(self.files[0].keys())[0]
-        to_file = list(self.files[0].values())[0]
-
-        if len(from_file) > 40:
-            # split file name if it is too long in order to display it properly
-            text = '.../' + from_file.split('/')[-1]
-        else:
-            text = from_file
-
-        self.nowQL.setText(self.tr('In progress:') + ' ' + text)
-        self.nowQPBar.setValue(0)
-
-        self.min_value = self.totalQPBar.value()
-        self.max_value = self.min_value + self.step
-
-        if not os.path.exists(from_file[1:-1]):
-            self.error += 1
-            self.file_converted_signal.emit()
-            return
-
-        def convert():
-            if self._type == 'AudioVideo':
-                conv_func = self.convert_video
-                params = (from_file, to_file, self.cmd)
-            elif self._type == 'Images':
-                conv_func = self.convert_image
-                params = (from_file, to_file, self.size, self.mntaspect,
-                          self.imgcmd)
-            else:
-                conv_func = self.convert_document
-                params = (from_file, to_file)
-
-            if conv_func(*params):
-                self.ok += 1
-                if self.delete:
-                    try:
-                        os.remove(from_file[1:-1])
-                    except OSError:
-                        pass
-            else:
-                self.error += 1
-
-            self.file_converted_signal.emit()
-
-        self.thread = threading.Thread(target=convert)
-        self.thread.start()
-
-    def convert_video(self, from_file, to_file, command):
-        """
-        Create the ffmpeg command and execute it in a new process using the
-        subprocess module. While the process is alive, parse ffmpeg output,
-        estimate conversion progress using video's duration.
-        With the result, emit the corresponding signal in order progressbars
-        to be updated. Also emit regularly the corresponding signal in order
-        an outputQTE to be updated with ffmpeg's output. Finally, save log
-        information.
-
-        Return True if conversion succeed, else False.
-        """
-        # note: from_file and to_file names are inside quotation marks
-        convert_cmd = '{0} -y -i {1} {2} {3}'.format(
-                self.parent.vidconverter, from_file, command, to_file)
-        self.update_text_edit_signal.emit(convert_cmd + '\n')
-
-        self.process = subprocess.Popen(
-                shlex.split(convert_cmd),
-                stderr=subprocess.STDOUT,
-                stdout=subprocess.PIPE
-                )
-
-        final_output = myline = ''
-        reader = io.TextIOWrapper(self.process.stdout, encoding='utf8')
-        while True:
-            out = reader.read(1)
-            if out == '' and self.process.poll() is not None:
-                break
-            myline += out
-            if out in ('\r', '\n'):
-                m = re.search("Duration: ([0-9:.]+)", myline)
-                if m:
-                    total = utils.duration_in_seconds(m.group(1))
-                n = re.search("time=([0-9:]+)", myline)
-                # time can be of format 'time=hh:mm:ss.ts' or 'time=ss.ts'
-                # depending on ffmpeg version
-                if n:
-                    time = n.group(1)
-                    if ':' in time:
-                        time = utils.duration_in_seconds(time)
-                    now_sec = int(float(time))
-                    try:
-                        self.refr_bars_signal.emit(100 * now_sec / total)
-                    except (UnboundLocalError, ZeroDivisionError):
-                        pass
-                self.update_text_edit_signal.emit(myline)
-                final_output += myline
-                myline = ''
-        self.update_text_edit_signal.emit('\n\n')
-
-        return_code = self.process.poll()
-
-        log_data = {
-                'command' : convert_cmd,
-                'returncode' : return_code,
-                'type' : 'VIDEO'
-                }
-        log_lvl = logging.info if return_code == 0 else logging.error
-        log_lvl(final_output, extra=log_data)
-
-        return return_code == 0
-
-    def convert_image(self, from_file, to_file, size, mntaspect, imgcmd):
-        """
-        Convert an image using ImageMagick.
-        Create conversion info ("cmd") and emit the corresponding signal
-        in order an outputQTE to be updated with that info.
-        Finally, save log information.
-
-        Return True if conversion succeed, else False.
-        """
-        # note: from_file and to_file names are inside quotation marks
-        resize = ''
-        if size:
-            resize = '-resize {0}'.format(size)
-            if not mntaspect:
-                resize += '\!'
-
-        imgcmd = ' ' + imgcmd.strip() + ' '
-        cmd = 'convert {0} {1}{2}{3}'.format(from_file, resize, imgcmd, to_file)
-        self.update_text_edit_signal.emit(cmd + '\n')
-        child = subprocess.Popen(
-                shlex.split(cmd),
-                stderr=subprocess.STDOUT,
-                stdout=subprocess.PIPE
-                )
-        child.wait()
-
-        reader = io.TextIOWrapper(child.stdout, encoding='utf8')
-        final_output = reader.read()
-        self.update_text_edit_signal.emit(final_output+'\n\n')
-
-        return_code = child.poll()
-
-        log_data = {
-                'command' : cmd,
-                'returncode' : return_code,
-                'type' : 'IMAGE'
-                }
-        log_lvl = logging.info if return_code == 0 else logging.error
-        log_lvl(final_output, extra=log_data)
-
-        return return_code == 0
-
-    def convert_document(self, from_file, to_file):
-        """
-        Create the unoconv command and execute it using the subprocess module.
-
-        Emit the corresponding signal in order an outputQTE to be updated
-        with unoconv's output. Finally, save log information.
-
-        Return True if conversion succeed, else False.
-        """
-        # note: from_file and to_file names are inside quotation marks
-        to_base, to_ext = os.path.splitext(to_file[1:-1])
-
-        cmd = 'unoconv -f {0} -o {1} {2}'.format(to_ext[1:], to_file, from_file)
-        self.update_text_edit_signal.emit(cmd + '\n')
-        child = subprocess.Popen(
-                shlex.split(cmd),
-                stderr=subprocess.STDOUT,
-                stdout=subprocess.PIPE
-                )
-        child.wait()
-
-        reader = io.TextIOWrapper(child.stdout, encoding='utf8')
-        final_output = reader.read()
-        self.update_text_edit_signal.emit(final_output+'\n\n')
-
-        return_code = child.poll()
-
-        log_data = {
-                'command' : cmd,
-                'returncode' : return_code,
-                'type' : 'DOCUMENT'
-                }
-        log_lvl = logging.info if return_code == 0 else logging.error
-        log_lvl(final_output, extra=log_data)
-
-        return return_code == 0
+            self.engine.resume()
@@ -0,0 +1,235 @@
+# Copyright (C) 2011-2015 Ilias Stamatis <stamatis.iliass@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Detect when the streams of a file can be copied instead of encoded.
+
+If the user asks for the codec that a stream already has and for nothing
+that needs the stream to be decoded, e.g. a filter or a different size,
+the stream is copied with '-c:v copy' or '-c:a copy'. These apply to all the
+streams of their type, so all of them must qualify. Remuxing is much faster
+than encoding and does not lose quality.
+
+Example:
+    args, decisions = streamcopy.plan(
+            ['-vcodec', 'libx264', '-acodec', 'aac', '-ar', '44100'],
+            probe.streams('/foo/bar.mkv'))
+"""
+
+# encoder -> name of the codec it produces, as reported by ffprobe
+ENCODERS = {
+        'aac' : 'aac',
+        'ac3' : 'ac3',
+        'flac' : 'flac',
+        'flv' : 'flv1',
+        'h263' : 'h263',
+        'libfaac' : 'aac',
+        'libfdk_aac' : 'aac',
+        'libmp3lame' : 'mp3',
+        'libopus' : 'opus',
+        'libtheora' : 'theora',
+        'libvo_aacenc' : 'aac',
+        'libvorbis' : 'vorbis',
+        'libvpx' : 'vp8',
+        'libvpx-vp9' : 'vp9',
+        'libx264' : 'h264',
+        'libx265' : 'hevc',
+        'libxvid' : 'mpeg4',
+        'mp2' : 'mp2',
+        'mpeg2video' : 'mpeg2video',
+        'mpeg4' : 'mpeg4',
+        'msmpeg4' : 'msmpeg4v3',
+        'wmav2' : 'wmav2',
+        'wmv2' : 'wmv2'
+        }
+
+# options that select the codec of video, audio or both kinds of streams
+VIDEO_CODEC = set(['-vcodec', '-c:v', '-codec:v'])
+AUDIO_CODEC = set(['-acodec', '-c:a', '-codec:a'])
+CODEC = set(['-c', '-codec'])
+# options that allow copying only if the stream already has their value
+VIDEO_CHECKED = set(['-s', '-s:v', '-r', '-b', '-b:v', '-vb'])
+AUDIO_CHECKED = set(['-ar', '-ac', '-ab', '-b:a'])
+# options that need the streams to be decoded
+VIDEO_ENCODE = set([
+        '-vf', '-filter:v', '-pix_fmt', '-crf', '-preset', '-tune', '-qscale',
+        '-qscale:v', '-q:v', '-profile:v', '-aspect', '-maxrate', '-bufsize',
+        '-g', '-pass', '-sameq'])
+AUDIO_ENCODE = set(['-af', '-filter:a', '-aq', '-q:a', '-qscale:a'])
+# options that do not affect stream copying
+HARMLESS = set(['-threads', '-metadata', '-map_metadata', '-movflags', '-f',
+                '-an', '-vn', '-sn', '-y', '-n', '-shortest'])
+# options without a value
+FLAGS = set(['-an', '-vn', '-sn', '-y', '-n', '-shortest', '-sameq'])
+
+
+def parse_args(args):
+    """
+    Return the list of (option, value) pairs of the ffmpeg output options
+    args, with value None for flags, or None if args contain something
+    that is not an option.
+    """
+    options = []
+    args = list(args)
+    while args:
+        option = args.pop(0)
+        if not option.startswith('-'):
+            return None
+        if option in FLAGS:
+            options.append((option, None))
+        elif args:
+            options.append((option, args.pop(0)))
+        else:
+            return None
+    return options
+
+def parse_rate(value):
+    """Return the number of a rate like '25', '29.97' or '30000/1001'."""
+    try:
+        if '/' in value:
+            num, den = value.split('/')
+            return float(num) / float(den) if float(den) else None
+        return float(value)
+    except ValueError:
+        return None
+
+def parse_bitrate(value):
+    """Return bits per second of a bitrate like '128k' or '2M'."""
+    scale = {'k' : 1000, 'm' : 1000000}
+    try:
+        if value and value[-1].lower() in scale:
+            return float(value[:-1]) * scale[value[-1].lower()]
+        return float(value)
+    except ValueError:
+        return None
+
+def streams_of_type(streams, codec_type):
+    """Return the streams of the given type, e.g. 'video'."""
+    return [i for i in streams if i.get('codec_type') == codec_type]
+
+def first_stream(streams, codec_type):
+    """Return the first stream of the given type or None."""
+    found = streams_of_type(streams, codec_type)
+    return found[0] if found else None
+
+def satisfies(option, value, stream):
+    """Return True if stream already is what option asks for."""
+    if option in ('-s', '-s:v'):
+        return value == '{0}x{1}'.format(
+                stream.get('width'), stream.get('height'))
+    if option == '-r':
+        wanted = parse_rate(value)
+        actual = parse_rate(stream.get('avg_frame_rate', ''))
+        return wanted is not None and actual is not None and \
+                abs(wanted - actual) < 0.01
+    if option in ('-b', '-b:v', '-vb', '-ab', '-b:a'):
+        # a bitrate is a limit, streams below it do not need encoding
+        wanted = parse_bitrate(value)
+        actual = parse_bitrate(stream.get('bit_rate', ''))
+        return wanted is not None and actual is not None and actual <= wanted
+    if option == '-ar':
+        return value == str(stream.get('sample_rate'))
+    if option == '-ac':
+        return value == str(stream.get('channels'))
+    return False
+
+def plan(args, streams):
+    """
+    Decide which streams can be copied when converting a file with the
+    ffmpeg output options args.
+
+    Return the new list of options and a list of strings explaining the
+    decisions. args are returned unchanged if nothing can be copied.
+
+    Keyword arguments:
+    args    -- list of ffmpeg output options
+    streams -- the streams of the input file, as returned by
+               probe.streams()
+    """
+    options = parse_args(args)
+    if options is None:
+        return args, ['cannot parse the command']
+    if not streams:
+        return args, ['input streams are unknown']
+
+    kinds = {
+            'video' : (VIDEO_CODEC, VIDEO_CHECKED, VIDEO_ENCODE, '-c:v'),
+            'audio' : (AUDIO_CODEC, AUDIO_CHECKED, AUDIO_ENCODE, '-c:a')
+            }
+    known = set(HARMLESS) | CODEC
+    for codec_options, checked, encode, copy in kinds.values():
+        known |= codec_options | checked | encode
+    for option, value in options:
+        if option not in known:
+            return args, ['{0} may need encoding'.format(option)]
+
+    copied = []
+    decisions = []
+    for kind, (codec_options, checked, encode, copy) in sorted(kinds.items()):
+        kind_streams = streams_of_type(streams, kind)
+        if not kind_streams:
+            continue
+        encoders = [value for option, value in options
+                    if option in codec_options or option in CODEC]
+        if not encoders:
+            decisions.append('{0}: no codec given, encoding'.format(kind))
+            continue
+        encoder = encoders[-1]
+        if encoder == 'copy':
+            continue
+        # the copy option applies to all the streams of the kind
+        decision = None
+        for stream in kind_streams:
+            source_codec = stream.get('codec_name')
+            if ENCODERS.get(encoder) != source_codec:
+                decision = '{0}: {1} to {2}, encoding'.format(
+                        kind, source_codec, encoder)
+                break
+            blocking = [option for option, value in options
+                        if option in encode or
+                        (option in checked and not satisfies(option, value,
+                                                             stream))]
+            if blocking:
+                decision = '{0}: {1} changes the stream, encoding'.format(
+                        kind, blocking[0])
+                break
+        if decision is not None:
+            decisions.append(decision)
+            continue
+        decisions.append('{0}: already {1}, copying'.format(
+                kind, kind_streams[0].get('codec_name')))
+        copied.append((kind, codec_options, checked, copy))
+
+    if not copied:
+        return args, decisions
+
+    copied_kinds = [i[0] for i in copied]
+    removed = set()
+    for kind, codec_options, checked, copy in copied:
+        removed |= codec_options | checked
+    new_args = []
+    for option, value in options:
+        if option in CODEC:
+            # keep the codec only for the streams that are encoded
+            for kind in sorted(kinds):
+                if kind not in copied_kinds:
+                    new_args += [kinds[kind][3], value]
+        elif option not in removed:
+            new_args.append(option)
+            if value is not None:
+                new_args.append(value)
+    for kind, codec_options, checked, copy in copied:
+        new_args += [copy, 'copy']
+    return new_args, decisions
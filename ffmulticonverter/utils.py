@@ -17,19 +17,23 @@
 Various useful functions.
 """
 
-import os
-import re
-import sys
-import shlex
-import subprocess
-import time
-
-from PyQt4.QtCore import pyqtSignal, QSize, Qt
+import queue
+import threading
+
+from PyQt4.QtCore import (
+        pyqtSignal, QAbstractListModel, QModelIndex, QObject, QSize, Qt,
+        QTimer
+        )
 from PyQt4.QtGui import (
-        QAction, QLayout, QLineEdit, QListWidget, QListWidgetItem, QMenu,
-        QSpacerItem, QWidget, QHBoxLayout, QVBoxLayout, QGridLayout
+        QAction, QLayout, QLineEdit, QListView, QListWidgetItem, QMenu,
+        QSpacerItem, QWidget, QHBoxLayout, QVBoxLayout, QGridLayout,
+        QPlainTextEdit, QTextCursor
         )
 
+from ffmulticonverter import config
+from ffmulticonverter import fileset
+from ffmulticonverter import probe
+
 
 def str_to_bool(string):
     """Convert a string to bool and return it."""
@@ -37,166 +41,8 @@ def str_to_bool(string):
         return string.lower() == 'true'
     return False
 
-def duration_in_seconds(duration):
-    """
-    Return the number of seconds of duration, an integer.
-    Duration is a string of type hh:mm:ss.ts
-    """
-    duration = duration.split('.')[0] # get rid of milliseconds
-    hours, mins, secs = [int(i) for i in duration.split(':')]
-    return secs + (hours * 3600) + (mins * 60)
-
-def is_installed(program):
-    """Return True if program appears in user's PATH var, else False."""
-    for path in os.getenv('PATH').split(os.pathsep):
-        fpath = os.path.join(path, program)
-        if os.path.exists(fpath) and os.access(fpath, os.X_OK):
-            return True
-    return False
-
-def start_office_listener():
-    """
-    Start a openoffice/libreoffice listener.
-    We need an open office listener in order to make convertions with unoconv.
-    """
-    # note: we cannot kill the listener with p.kill() as it is a spawned process
-    # the office listener remains open even after program's termination
-    p = subprocess.Popen(shlex.split("unoconv --listener"))
-    while p.poll() is not None:
-        time.sleep(0.1)
-    time.sleep(1) # wait for listener to setup correctly
-
-def find_presets_file(fname, lookup_dirs, lookup_virtenv):
-    """
-    The default presets.xml could be stored in different locations during
-    the installation depending on different Linux distributions.
-    Search for this file on each possible directory to which user
-    specific data files could be stored.
-
-    Keyword arguments:
-    fname          -- file name
-    lookup_dirs    -- list of the directories to search for fname
-    lookup_virtent -- directory to search for fname in virtualenv
-
-    Return the path of the file if found, else an empty string.
-    """
-    possible_dirs = os.environ.get(
-            "XDG_DATA_DIRS", ":".join(lookup_dirs)
-            ).split(":")
-    # for virtualenv installations
-    posdir = os.path.realpath(
-            os.path.join(os.path.dirname(sys.argv[0]), '..', lookup_virtenv))
-    if not posdir in possible_dirs:
-        possible_dirs.append(posdir)
-
-    for _dir in possible_dirs:
-        _file = os.path.join(_dir, 'ffmulticonverter/' + fname)
-        if os.path.exists(_file):
-            return _file
-    return ''
-
-def create_paths_list(
-        files_list, ext_to, prefix, suffix, output, orig_dir,
-        overwrite_existing
-        ):
-    """
-    Create and return a list with dicts.
-    Each dict will have only one key and one corresponding value.
-    Key will be a file to be converted and it's value will be the name
-    of the new converted file.
-
-    Example list:
-    [{"/foo/bar.png" : "/foo/bar.bmp"}, {"/f/bar2.png" : "/f/bar2.bmp"}]
-
-    Keyword arguments:
-    files_list -- list with files to be converted
-    ext_to     -- the extension to which each file must be converted to
-    prefix     -- string that will be added as a prefix to all filenames
-    suffix     -- string that will be added as a suffix to all filenames
-    output     -- the output folder
-    orig_dir   -- if True, each file will be saved at its original directory
-                  else, files will be saved at output
-    overwrite_existing -- if False, a '~' will be added as prefix to
-                          filenames
-    """
-    assert ext_to.startswith('.'), 'ext_to must start with a dot (.)'
-
-    conversion_list = []
-    dummy = []
-
-    for _file in files_list:
-        _dir, name = os.path.split(_file)
-        y = prefix + os.path.splitext(name)[0] + suffix + ext_to
-
-        if orig_dir:
-            y = _dir + '/' + y
-        else:
-            y = output + '/' + y
-
-        if not overwrite_existing:
-            while os.path.exists(y) or y in dummy:
-                _dir2, _name2 = os.path.split(y)
-                y = _dir2 + '/~' + _name2
-
-        dummy.append(y)
-        # Add quotations to paths in order to avoid error in special
-        # cases such as spaces or special characters.
-        _file = '"' + _file + '"'
-        y = '"' + y + '"'
-
-        _dict = {}
-        _dict[_file] = y
-        conversion_list.append(_dict)
-
-    return conversion_list
-
-def update_cmdline_text(command, _filter, regex, add, gindex1, gindex2):
-    """
-    Update and return the command line text by adding, removing or edditing a
-    ffmpeg filter based on the given regular expression.
-
-    Keyword arguments:
-    command  -- initial command text (string)
-    _filter  -- ffmpeg filter to add or edit in command (string)
-    regex    -- regex to search in command
-    add      -- if True, add filter to command, else filter must be removed
-    gindex1  -- group index of the first group before filter group in regex
-    gindex2  -- group index of the first group after filter group in regex
-    """
-    regex2 = r'(-vf "[^"]*)"'
-    regex3 = r'-vf +([^ ]+)'
-
-    search = re.search(regex, command)
-    if search:
-        if add:
-            command = re.sub(
-                    regex,
-                    r'\{0}{1}\{2}'.format(gindex1+1, _filter, gindex2+1),
-                    command
-                    )
-        else:
-            group1 = search.groups()[gindex1].strip()
-            group2 = search.groups()[gindex2].strip()
-            if group1 and group2:
-                # the filter is between 2 other filters
-                # remove it and leave a comma
-                command = re.sub(regex, ',', command)
-            else:
-                # remove filter
-                command = re.sub(regex, _filter, command)
-                # add a space between -vf and filter if needed
-                command = re.sub(r'-vf([^ ])', r'-vf \1', command)
-                if not group1 and not group2:
-                    # remove -vf option
-                    command = re.sub(r'-vf *("\s*"){0,1}', '', command)
-    elif re.search(regex2, command):
-        command = re.sub(regex2, r'\1,{0}"'.format(_filter), command)
-    elif re.search(regex3, command):
-        command = re.sub(regex3, r'-vf "\1,{0}"'.format(_filter), command)
-    elif _filter:
-        command += ' -vf "' + _filter + '"'
-
-    return re.sub(' +', ' ', command).strip()
+# defined in probe, which cannot import this module, to be shared with it
+seconds_to_duration = probe.seconds_to_duration
 
 
 #######################################################################
@@ -329,18 +175,175 @@ def create_LineEdit(maxsize, validator, maxlength):
 # Custom pyqt widgets
 ######################
 
-class XmlListItem(QListWidgetItem):
-    def __init__(self, text, xml_element, parent=None):
-        super(XmlListItem, self).__init__(text, parent)
-        self.xml_element = xml_element
+class PresetListItem(QListWidgetItem):
+    def __init__(self, text, preset, parent=None):
+        super(PresetListItem, self).__init__(text, parent)
+        self.preset = preset
+
+
+class FilesListModel(QAbstractListModel):
+    """
+    Model that shows the files of a fileset.FileSet.
+    The set must be changed only through the model so that views are
+    notified, once per batch of changes.
+    """
+    # with many scattered rows a reset is cheaper than many removals
+    max_remove_ranges = 32
+
+    def __init__(self, files, parent=None):
+        super(FilesListModel, self).__init__(parent)
+        self.files = files
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.files)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.DisplayRole:
+            return self.files[index.row()]
+        if role == Qt.ToolTipRole:
+            path = self.files[index.row()]
+            # only what is already probed, views must not wait for ffprobe
+            description = probe.describe(probe.cached_info(path))
+            return path + '\n' + description if description else path
+        return None
+
+    def add_files(self, paths):
+        """Append the paths that are not in the list yet."""
+        paths = [i for i in paths if i not in self.files]
+        if not paths:
+            return
+        # paths may contain duplicates, count what is actually added
+        first = len(self.files)
+        added = fileset.FileSet(paths)
+        self.beginInsertRows(QModelIndex(), first, first + len(added) - 1)
+        self.files.extend(added)
+        self.endInsertRows()
+
+    def remove_rows(self, rows):
+        """Remove the files of the given rows."""
+        row_ranges = fileset.ranges(rows)
+        if len(row_ranges) > self.max_remove_ranges:
+            self.beginResetModel()
+            self.files.remove_rows(rows)
+            self.endResetModel()
+            return
+        # remove from the end so that earlier rows keep their numbers
+        for first, last in reversed(row_ranges):
+            self.beginRemoveRows(QModelIndex(), first, last)
+            self.files.remove_rows(range(first, last + 1))
+            self.endRemoveRows()
+
+    def clear(self):
+        self.beginResetModel()
+        self.files.clear()
+        self.endResetModel()
+
+
+class FolderScanner(QObject):
+    """
+    Collect files from folder trees in background threads.
+    found is emitted with each chunk of files and done when a scan ends.
+    """
+    found = pyqtSignal(list)
+    done = pyqtSignal()
+    # generation of the scan and a chunk of its files, from its thread
+    scanned = pyqtSignal(int, list)
 
+    def __init__(self, parent=None):
+        super(FolderScanner, self).__init__(parent)
+        # scans started before the last cancel() have older generations
+        self.generation = 0
+        self.scanned.connect(self.forward)
+
+    def scan(self, folders, extensions=None):
+        """
+        Start scanning folders for files with one of extensions and return
+        immediately.
+        """
+        thread = threading.Thread(
+                target=self.run, args=(self.generation, folders, extensions))
+        thread.daemon = True
+        thread.start()
+
+    def run(self, generation, folders, extensions):
+        for chunk in fileset.scan(folders, extensions):
+            if generation != self.generation:
+                return
+            self.scanned.emit(generation, chunk)
+        if generation == self.generation:
+            self.done.emit()
+
+    def forward(self, generation, chunk):
+        # chunks that were queued before cancel() are dropped here
+        if generation == self.generation:
+            self.found.emit(chunk)
+
+    def cancel(self):
+        """
+        Stop all running scans without waiting for them. Files they have
+        found but not reported yet are dropped.
+        """
+        self.generation += 1
+
+
+class MediaProber(QObject):
+    """
+    Probe media files in config.probe_jobs background threads so that their
+    information is cached before it is needed. The threads live as long as
+    the prober and take the files from one queue, so adding many files never
+    starts more probes. idle is emitted when all queued files are probed.
+    """
+    idle = pyqtSignal()
 
-class FilesList(QListWidget):
+    def __init__(self, parent=None):
+        super(MediaProber, self).__init__(parent)
+        self.paths = queue.Queue()
+        self.threads = []
+        self.lock = threading.Lock()
+        self.pending = 0
+
+    def probe(self, paths):
+        """Queue paths to be probed and return immediately."""
+        if probe.prober is None:
+            return
+        paths = list(paths)
+        with self.lock:
+            self.pending += len(paths)
+            while paths and len(self.threads) < config.probe_jobs:
+                thread = threading.Thread(target=self.run)
+                thread.daemon = True
+                self.threads.append(thread)
+                thread.start()
+        for path in paths:
+            self.paths.put(path)
+
+    def run(self):
+        while True:
+            # cached files are not probed again
+            probe.info(self.paths.get())
+            with self.lock:
+                self.pending -= 1
+                idle = self.pending == 0
+            if idle:
+                self.idle.emit()
+
+
+class FilesList(QListView):
     dropped = pyqtSignal(list)
 
     def __init__(self, parent=None):
         super(FilesList, self).__init__(parent)
         self.setAcceptDrops(True)
+        # lets the view lay out huge lists without measuring every item
+        self.setUniformItemSizes(True)
+
+    def selected_rows(self):
+        """Return the rows of the selected files."""
+        return [i.row() for i in self.selectionModel().selectedRows()]
 
     def dragEnterEvent(self, event):
         if event.mimeData().hasUrls:
@@ -365,3 +368,68 @@ class FilesList(QListWidget):
             self.dropped.emit(links)
         else:
             event.ignore()
+
+
+class LogView(QPlainTextEdit):
+    """
+    Read-only view of a growing log.
+
+    Appended text is collected and shown at most once every interval
+    milliseconds, and only the last max_lines lines are kept. If spill_file
+    is given, the whole log is written there as well.
+    """
+    def __init__(self, max_lines, interval=100, spill_file=None, parent=None):
+        super(LogView, self).__init__(parent)
+        self.setReadOnly(True)
+        self.setMaximumBlockCount(max_lines)
+        self.max_lines = max_lines
+        self.pending = []
+
+        self.spill = None
+        if spill_file is not None:
+            try:
+                self.spill = open(spill_file, 'w', encoding='utf8')
+            except OSError:
+                pass
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(interval)
+        self.timer.timeout.connect(self.flush)
+
+    def append_text(self, text):
+        """Schedule text to be added at the end of the log."""
+        self.pending.append(text)
+        if self.spill is not None:
+            self.spill.write(text)
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def flush(self):
+        """Show all pending text, keeping the view scrolled to the end."""
+        if not self.pending:
+            return
+        text = ''.join(self.pending)
+        self.pending = []
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+        # do not insert lines that would be dropped right away
+        lines = text.split('\n')
+        if len(lines) > self.max_lines:
+            text = '\n'.join(lines[-self.max_lines:])
+
+        scrollbar = self.verticalScrollBar()
+        at_end = scrollbar.value() == scrollbar.maximum()
+        cursor = QTextCursor(self.document())
+        cursor.movePosition(QTextCursor.End)
+        cursor.insertText(text)
+        if at_end:
+            scrollbar.setValue(scrollbar.maximum())
+        if self.spill is not None:
+            self.spill.flush()
+
+    def close_spill(self):
+        """Show pending text and close the spill file."""
+        self.flush()
+        if self.spill is not None:
+            self.spill.close()
+            self.spill = None
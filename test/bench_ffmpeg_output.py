@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+"""
+Compare the old byte-at-a-time ffmpeg output parsing with
+engine.read_lines().
+
+Usage: bench_ffmpeg_output.py [ffmpeg-stderr.log]
+
+If no log is given, a synthetic one of a few megabytes is used.
+A log can be recorded with: ffmpeg -i in.avi out.mp4 2> ffmpeg-stderr.log
+"""
+
+import io
+import re
+import sys
+import time
+
+sys.path.append('..')
+from ffmulticonverter import engine
+
+
+def synthetic_log(frames=60000):
+    header = ('ffmpeg version 2.6 Copyright (c) 2000-2015 the FFmpeg '
+              'developers\n'
+              "Input #0, avi, from 'in.avi':\n"
+              '  Duration: 00:41:40.00, start: 0.000000, bitrate: 1500 kb/s\n'
+              '    Stream #0:0: Video: mpeg4, yuv420p, 640x480, 25 fps\n')
+    progress = ('frame={0:5d} fps= 25 q=28.0 size={1:8d}kB '
+                'time={2:02d}:{3:02d}:{4:02d}.{5:02d} bitrate=1500.0kbits/s '
+                'speed=1.00x\r')
+    lines = [header]
+    for i in range(frames):
+        sec = i // 25
+        lines.append(progress.format(
+                i, i * 8, sec // 3600, sec // 60 % 60, sec % 60, i % 25 * 4))
+    lines.append('\nvideo:500000kB audio:40000kB muxing overhead: 0.1%\n')
+    return ''.join(lines).encode('utf8')
+
+def old_reader(data):
+    """The parser used before engine.read_lines()."""
+    reader = io.TextIOWrapper(io.BytesIO(data), encoding='utf8')
+    final_output = myline = ''
+    percent = 0
+    while True:
+        out = reader.read(1)
+        if out == '':
+            break
+        myline += out
+        if out in ('\r', '\n'):
+            m = re.search("Duration: ([0-9:.]+)", myline)
+            if m:
+                total = engine.duration_in_seconds(m.group(1))
+            n = re.search("time=([0-9:]+)", myline)
+            if n:
+                percent = 100 * engine.time_in_seconds(n.group(1)) / total
+            final_output += myline
+            myline = ''
+    return percent
+
+def new_reader(data):
+    """Same parsing as engine.VideoConverter.convert()."""
+    stream = io.BufferedReader(io.BytesIO(data))
+    total = None
+    percent = 0
+    for lines in engine.read_lines(stream):
+        if total is None:
+            for line in lines:
+                m = engine.DURATION_RE.search(line)
+                if m:
+                    total = engine.duration_in_seconds(m.group(1))
+                    break
+        for line in reversed(lines):
+            n = engine.TIME_RE.search(line)
+            if n:
+                percent = 100 * engine.time_in_seconds(n.group(1)) / total
+                break
+    return percent
+
+def bench(func, data):
+    start = time.perf_counter()
+    func(data)
+    return time.perf_counter() - start
+
+def main():
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], 'rb') as f:
+            data = f.read()
+    else:
+        data = synthetic_log()
+    size = len(data) / 2**20
+
+    print('log size: {0:.1f} MiB'.format(size))
+    for name, func in [('old', old_reader), ('new', new_reader)]:
+        secs = bench(func, data)
+        print('{0}: {1:.3f} s, {2:.1f} MiB/s'.format(name, secs, size / secs))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+"""
+Compare the plain list of file names that MainWindow used with
+fileset.FileSet, adding paths (with some duplicates) and then removing
+every other one.
+
+Usage: bench_fileset.py [number-of-paths]
+"""
+
+import sys
+import time
+
+sys.path.append('..')
+from ffmulticonverter import fileset
+
+
+# the old list is quadratic, larger sizes take too long
+MAX_OLD_PATHS = 20000
+
+
+def old_list(paths, removed):
+    fnames = []
+    for i in paths:
+        if not i in fnames:
+            fnames.append(i)
+    for i in removed:
+        fnames.remove(i)
+    return fnames
+
+def new_set(paths, removed):
+    files = fileset.FileSet()
+    files.extend(paths)
+    files.remove(removed)
+    return files
+
+def bench(func, paths, removed):
+    start = time.perf_counter()
+    func(paths, removed)
+    return time.perf_counter() - start
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    for size in sorted(set([1000, 10000, count])):
+        paths = ['/home/user/videos/clip{0:06d}.avi'.format(i)
+                 for i in range(size)]
+        # users drop the same files twice
+        paths += paths[:size // 10]
+        removed = paths[:size:2]
+        print('{0} paths'.format(size))
+        for name, func in [('list', old_list), ('FileSet', new_set)]:
+            if func is old_list and size > MAX_OLD_PATHS:
+                print('  {0}: skipped'.format(name))
+                continue
+            print('  {0}: {1:.3f} s'.format(name, bench(func, paths, removed)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+"""
+Measure how the number of images converted by one ImageMagick process
+affects the conversion time, in order to tune
+config.imagemagick_batch_size, and compare it with Pillow.
+
+Usage: bench_image_batch.py [number-of-images]
+
+Small png images are generated with ImageMagick in a temporary folder and
+converted to jpg with each batch size, using one worker.
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+
+sys.path.append('..')
+from ffmulticonverter import engine
+from ffmulticonverter import imaging
+
+
+BATCH_SIZES = [1, 4, 8, 16, 32, 64, 128]
+
+
+def create_images(folder, count):
+    sources = []
+    for i in range(count):
+        source = os.path.join(folder, 'img{0}.png'.format(i))
+        sources.append(source)
+    # one process for all images
+    cmd = ['convert']
+    for source in sources[:-1]:
+        cmd += ['(', '-size', '64x64', 'plasma:', '-write', source,
+                '+delete', ')']
+    cmd += ['-size', '64x64', 'plasma:', sources[-1]]
+    subprocess.check_call(cmd)
+    return sources
+
+def bench(sources, batch_size, use_pillow=False, max_jobs=1):
+    jobs = [engine.Job(i, i + '.jpg') for i in sources]
+    converter = engine.ImageConverter(
+            '32x32', True, '', max_jobs=max_jobs, batch_size=batch_size,
+            use_pillow=use_pillow)
+    start = time.perf_counter()
+    results = engine.Engine(converter, jobs, max_jobs).run()
+    secs = time.perf_counter() - start
+    for job in jobs:
+        os.remove(job.target)
+    assert all(i.success for i in results)
+    return secs
+
+def main():
+    if not engine.is_installed('convert'):
+        print('ImageMagick is not installed')
+        return
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 512
+    folder = tempfile.mkdtemp()
+    try:
+        sources = create_images(folder, count)
+        print('{0} images'.format(count))
+        for size in BATCH_SIZES:
+            secs = bench(sources, size)
+            print('batch size {0:3d}: {1:.2f} s, {2:.0f} images/s'.format(
+                  size, secs, count / secs))
+        if imaging.available:
+            for jobs in (1, os.cpu_count() or 1):
+                secs = bench(sources, 16, True, jobs)
+                print('pillow, {0} processes: {1:.2f} s, {2:.0f} '
+                      'images/s'.format(jobs, secs, count / secs))
+    finally:
+        shutil.rmtree(folder)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+"""
+Compare the old output path planner with engine.create_paths_list() for
+files of the same name converted into one folder, which is the worst case
+for name collisions.
+
+Usage: bench_paths_list.py [number-of-files]
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+sys.path.append('..')
+from ffmulticonverter import engine
+
+
+# the old planner is cubic in the number of equal names
+MAX_OLD_FILES = 2000
+
+
+def old_create_paths_list(files_list, ext_to, prefix, suffix, output,
+                          orig_dir, overwrite_existing):
+    """create_paths_list() before it used directory listings."""
+    conversion_list = []
+    dummy = []
+    for _file in files_list:
+        _dir, name = os.path.split(_file)
+        y = prefix + os.path.splitext(name)[0] + suffix + ext_to
+        if orig_dir:
+            y = _dir + '/' + y
+        else:
+            y = output + '/' + y
+        if not overwrite_existing:
+            while os.path.exists(y) or y in dummy:
+                _dir2, _name2 = os.path.split(y)
+                y = _dir2 + '/~' + _name2
+        dummy.append(y)
+        conversion_list.append({'"' + _file + '"' : '"' + y + '"'})
+    return conversion_list
+
+def bench(func, files, output):
+    start = time.perf_counter()
+    func(files, '.mp4', '', '', output, False, False)
+    return time.perf_counter() - start
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    output = tempfile.mkdtemp()
+    try:
+        # some targets exist already
+        for name in ['clip.mp4', '~clip.mp4']:
+            open(os.path.join(output, name), 'w').close()
+        for size in sorted(set([500, MAX_OLD_FILES, count])):
+            files = ['/videos/{0}/clip.avi'.format(i) for i in range(size)]
+            print('{0} files'.format(size))
+            for name, func in [('old', old_create_paths_list),
+                               ('new', engine.create_paths_list)]:
+                if func is old_create_paths_list and size > MAX_OLD_FILES:
+                    print('  {0}: skipped'.format(name))
+                    continue
+                print('  {0}: {1:.3f} s'.format(
+                      name, bench(func, files, output)))
+    finally:
+        shutil.rmtree(output)
+
+if __name__ == '__main__':
+    main()
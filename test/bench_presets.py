@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+
+"""
+Compare the ElementTree scans that ShowPresets used with presets.PresetStore
+on a generated presets file: loading and listing all presets sorted by name,
+and searching them for a few strings. Then time single searches, as they run
+while the user types, and loading the presets from the xml file, from the
+json cache of presets.PresetsFile and again while the file is unchanged, as
+each presets dialog does.
+
+Usage: bench_presets.py [number-of-presets]
+"""
+
+import os
+import sys
+import time
+import tempfile
+import xml.etree.ElementTree as etree
+
+sys.path.append('..')
+from ffmulticonverter import presets
+
+
+# root.find() makes the old listing quadratic
+MAX_OLD_PRESETS = 20000
+
+SEARCHES = ['mp4', 'audio', 'ipod mp3', 'h264 wav', 'nothing']
+# number of times each single search is repeated
+REPEAT = 100
+
+
+def write_presets(fname, count):
+    root = etree.Element('presets')
+    kinds = [('Audio', 'MP3 audio', 'mp3'), ('Apple', 'iPod video', 'mp4'),
+             ('Web', 'H264 for the web', 'mp4'), ('Audio', 'Wav', 'wav')]
+    for i in range(count):
+        category, label, ext = kinds[i % len(kinds)]
+        # unsorted names, like user presets added over time
+        root.append(presets.Preset(
+                'preset{0:06d}'.format((i * 7919) % count),
+                '{0} {1}'.format(label, i), '-b:v {0}k'.format(i), ext,
+                category).to_element())
+    etree.ElementTree(root).write(fname)
+
+def old_list(root):
+    return [root.find(i) for i in sorted([y.tag for y in root])]
+
+def old_search(root, txt):
+    found = []
+    for i in txt.split(' '):
+        for p in sorted([y.tag for y in root]):
+            elem = root.find(p)
+            if (i.strip() and (
+                    i in elem.tag.lower()
+                    or i in elem[0].text.lower()
+                    or i in elem[2].text.lower())):
+                found.append(elem)
+    return found
+
+def old_presets(fname):
+    root = etree.parse(fname).getroot()
+    old_list(root)
+    for txt in SEARCHES:
+        old_search(root, txt)
+
+def new_presets(fname):
+    store = presets.PresetStore.from_tree(etree.parse(fname))
+    list(store)
+    for txt in SEARCHES:
+        store.search(txt)
+
+def bench_searches(fname):
+    store = presets.PresetStore.from_tree(etree.parse(fname))
+    # build the index
+    store.search('x')
+    for txt in SEARCHES + ['p', 'preset00']:
+        start = time.perf_counter()
+        for i in range(REPEAT):
+            found = store.search(txt)
+        print('  search {0!r}: {1} found, {2:.3f} ms'.format(
+              txt, len(found), (time.perf_counter() - start) / REPEAT * 1000))
+
+def bench_loading(fname):
+    cache_file = fname + '.json'
+    try:
+        for name, cache in [('xml', ''), ('json cache', cache_file)]:
+            presets.PresetsFile(fname, cache).load()
+            start = time.perf_counter()
+            presets.PresetsFile(fname, cache).load()
+            print('  load from {0}: {1:.3f} s'.format(
+                  name, time.perf_counter() - start))
+        pfile = presets.PresetsFile(fname, '')
+        pfile.current()
+        start = time.perf_counter()
+        for i in range(REPEAT):
+            pfile.current()
+        print('  load again, unchanged: {0:.3f} ms'.format(
+              (time.perf_counter() - start) / REPEAT * 1000))
+    finally:
+        os.remove(cache_file)
+
+def bench(func, fname):
+    start = time.perf_counter()
+    func(fname)
+    return time.perf_counter() - start
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    fd, fname = tempfile.mkstemp(suffix='.xml')
+    os.close(fd)
+    try:
+        for size in sorted(set([500, 5000, count])):
+            write_presets(fname, size)
+            print('{0} presets'.format(size))
+            for name, func in [('ElementTree', old_presets),
+                               ('PresetStore', new_presets)]:
+                if func is old_presets and size > MAX_OLD_PRESETS:
+                    print('  {0}: skipped'.format(name))
+                    continue
+                print('  {0}: {1:.3f} s'.format(name, bench(func, fname)))
+            bench_searches(fname)
+            bench_loading(fname)
+    finally:
+        os.remove(fname)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+
+"""Converters and jobs shared by the tests."""
+
+import os
+import sys
+
+sys.path.append('..')
+from ffmulticonverter import engine
+
+
+class CopyConverter(engine.Converter):
+    """Converter that copies source to target using cp."""
+    name = 'TEST'
+
+    def command(self, job):
+        return ['cp', job.source, job.output]
+
+
+def make_jobs(tmpdir, count):
+    """Return count jobs of new files in tmpdir with different contents."""
+    jobs = []
+    for i in range(count):
+        source = os.path.join(str(tmpdir), 'in{0}.txt'.format(i))
+        with open(source, 'w') as f:
+            f.write(str(i))
+        jobs.append(engine.Job(source, source + '.out'))
+    return jobs
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+
+sys.path.append('..')
+from ffmulticonverter import cache
+from ffmulticonverter import engine
+from helpers import CopyConverter, make_jobs
+
+
+def test_unchanged_files_are_not_converted_again(tmpdir):
+    results = cache.ResultCache(str(tmpdir.mkdir('cache')), 1024)
+    jobs = make_jobs(tmpdir, 3)
+    engine.Engine(CopyConverter(), jobs, cache=results).run()
+    assert (results.hits, results.misses, results.stores) == (0, 3, 3)
+
+    # same inputs and settings, new targets
+    for job in jobs:
+        job.target = job.target.replace('.out', '.again.out')
+    with open(jobs[0].source, 'w') as f:
+        f.write('changed')
+    os.utime(jobs[0].source, (0, 0))
+    eng = engine.Engine(CopyConverter(), jobs, cache=results)
+    eng.run()
+    assert eng.ok == 3
+    assert (results.hits, results.misses, results.stores) == (2, 4, 4)
+    for job in jobs:
+        with open(job.source) as src, open(job.target) as dst:
+            assert src.read() == dst.read()
+
+    # the index survives
+    assert cache.ResultCache(results.folder).stats()['entries'] == 4
+
+
+def test_least_recently_used_results_are_evicted(tmpdir):
+    results = cache.ResultCache(str(tmpdir.mkdir('cache')), 12)
+    for i in range(4):
+        path = str(tmpdir.join('out{0}'.format(i)))
+        with open(path, 'w') as f:
+            f.write('abcd')
+        if i == 3:
+            # key0 becomes more recently used than key1
+            assert results.fetch('key0', str(tmpdir.join('copy')))
+        results.store('key{0}'.format(i), path)
+    stats = results.stats()
+    assert (stats['entries'], stats['size'], stats['evictions']) == (3, 12, 1)
+    assert set(results.entries) == {'key0', 'key2', 'key3'}
+
+
+def test_concurrent_caches_keep_each_others_results(tmpdir, monkeypatch):
+    folder = str(tmpdir.mkdir('cache'))
+    first = cache.ResultCache(folder, 1024)
+    second = cache.ResultCache(folder, 1024)
+    path = str(tmpdir.join('out'))
+    with open(path, 'w') as f:
+        f.write('abcd')
+    first.store('key0', path)
+    second.store('key1', path)
+    second.store('key2', path)
+    first.save()
+    second.forget('key2')
+    second.save()
+    assert set(second.entries) == {'key0', 'key1'}
+    assert set(cache.ResultCache(folder).entries) == {'key0', 'key1'}
+
+    # files that no index lists are removed once they are old enough
+    orphan = first.path('key3')
+    with open(orphan, 'w') as f:
+        f.write('abcd')
+    first.save()
+    assert os.path.exists(orphan)
+    monkeypatch.setattr(cache.config, 'cache_orphan_age', -1)
+    first.save()
+    assert not os.path.exists(orphan)
+    assert os.path.exists(first.path('key0'))
+
+
+def test_changed_results_are_not_used(tmpdir):
+    results = cache.ResultCache(str(tmpdir.mkdir('cache')), 1024)
+    path = str(tmpdir.join('out'))
+    with open(path, 'w') as f:
+        f.write('abcd')
+    results.store('key0', path)
+    # the target is linked to the result
+    with open(path, 'a') as f:
+        f.write('efgh')
+    assert not results.fetch('key0', str(tmpdir.join('copy')))
+    assert 'key0' not in results.entries
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.append('..')
+from ffmulticonverter import cli
+from ffmulticonverter import engine
+from helpers import CopyConverter
+
+
+@pytest.fixture
+def stub_converter(monkeypatch):
+    converter = CopyConverter(max_jobs=2)
+    monkeypatch.setattr(cli, 'create_converter', lambda *args: converter)
+    monkeypatch.setattr(engine, 'setup_logging', lambda: None)
+    return converter
+
+
+def test_parse_args():
+    opts = cli.parse_args(['a.avi', 'b*.avi', '-f', 'mp4', '-j', '3'])
+    assert opts.inputs == ['a.avi', 'b*.avi']
+    assert (opts.format, opts.preset, opts.jobs) == ('mp4', None, 3)
+    assert not opts.cache
+    assert cli.parse_args(['a.avi', '-p', 'mp3', '--cache']).cache
+    for args in (['a.avi'], ['a.avi', '-f', 'mp4', '-p', 'mp3'],
+                 ['a.avi', '-f', 'mp4', '-j', '0']):
+        with pytest.raises(SystemExit):
+            cli.parse_args(args)
+
+
+def test_guess_type():
+    assert cli.guess_type(['/a.doc', '/b.odt'], 'pdf') == 'document'
+    assert cli.guess_type(['/a.doc', '/b.png'], 'pdf') == 'image'
+    assert cli.guess_type(['/a.png'], 'jpg') == 'image'
+    assert cli.guess_type(['/a.avi'], 'mp4') == 'video'
+    assert cli.guess_type([], 'pdf') == 'image'
+
+
+def test_event_to_dict():
+    job = engine.Job('/a.avi', '/a.mp4')
+    event = engine.Event(engine.PROGRESS, 0, job, percent=42, speed=2.5,
+                         total_percent=21)
+    assert cli.event_to_dict(event) == {
+            'event' : 'progress', 'slot' : 0, 'source' : '/a.avi',
+            'percent' : 42, 'speed' : 2.5, 'total' : 21}
+    event = engine.Event(engine.FINISHED, 1, job,
+                         result=engine.Result(job, True), total_percent=100,
+                         total_eta=0)
+    assert cli.event_to_dict(event) == {
+            'event' : 'finished', 'slot' : 1, 'source' : '/a.avi',
+            'target' : '/a.mp4', 'success' : True, 'total' : 100,
+            'total_eta' : 0}
+    assert cli.event_to_dict(engine.Event(engine.DONE)) == {'event' : 'done'}
+
+
+def test_main(tmpdir, capsys, monkeypatch, stub_converter):
+    for i in range(3):
+        tmpdir.join('in{0}.txt'.format(i)).write(str(i))
+    output = tmpdir.mkdir('out')
+    status = cli.main([str(tmpdir.join('*.txt')), '-f', 'dat', '-o',
+                       str(output), '-j', '8', '--no-cache'])
+    assert status == 0
+    out, err = capsys.readouterr()
+    events = [json.loads(i) for i in out.splitlines()]
+    assert [i['event'] for i in events].count('finished') == 3
+    assert all(i['success'] for i in events if i['event'] == 'finished')
+    assert events[-1] == {'event' : 'done', 'ok' : 3, 'error' : 0}
+    assert sorted(os.listdir(str(output))) == ['in0.dat', 'in1.dat',
+                                               'in2.dat']
+    # -j is capped by the converter
+    assert 'at most 2' in err
+
+    # failed conversions
+    monkeypatch.setattr(stub_converter, 'command', lambda job: ['false'])
+    assert cli.main([str(tmpdir.join('in0.txt')), '-f', 'dat']) == 1
+    events = [json.loads(i) for i in capsys.readouterr()[0].splitlines()]
+    assert [i['success'] for i in events if i['event'] == 'finished'] == \
+            [False]
+    assert events[-1] == {'event' : 'done', 'ok' : 0, 'error' : 1}
+
+
+def test_main_without_inputs(tmpdir, capsys, stub_converter):
+    assert cli.main([str(tmpdir.join('*.missing')), '-f', 'dat']) == 2
+    assert 'No such file' in capsys.readouterr()[1]
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+
+import random
+import shlex
+import sys
+
+sys.path.append('..')
+from ffmulticonverter import cmdline
+
+
+# number of random commands each property is checked with
+RUNS = 500
+
+OPTIONS = ['-vcodec', '-c:v', '-acodec', '-c:a', '-b', '-b:v', '-ab', '-b:a',
+           '-s', '-r', '-ar', '-ac', '-aspect', '-threads', '-ss', '-t',
+           '-vf', '-filter:v', '-f', '-metadata']
+VALUES = ['libx264', 'aac', '800k', '640x480', '25', '-1', '0.5', '16:9',
+          'title=a b', "it's", 'say "hi"', 'back\\slash', '$HOME', 'ünï',
+          'a,b', '', ' ', 'tab\there', 'new\nline']
+FILTERS = ['scale=640:-1', 'hflip', 'vflip', 'transpose=1', 'null',
+           "subtitles='/a, b.srt'", 'drawtext=text=a\\,b', '[in]null[out]',
+           ' yadif', 'fps=fps=25 ']
+SPACES = [' ', '  ', '\t', ' \n ']
+
+
+def random_word(rand):
+    word = rand.choice(OPTIONS + VALUES + ['"', "'", '\\', '-sameq', '-an'])
+    return cmdline.quote(word) if rand.random() < 0.7 else word
+
+def random_text(rand):
+    """Any text, including unbalanced quotes and odd spacing."""
+    return ''.join(rand.choice(SPACES + [''] * 3) + random_word(rand)
+                   for i in range(rand.randint(0, 8))) + rand.choice(
+                   SPACES + [''] * 3)
+
+def random_options(rand):
+    """A list of (option, value) pairs, with value None for flags."""
+    options = []
+    for i in range(rand.randint(0, 6)):
+        if rand.random() < 0.2:
+            options.append((rand.choice(['-sameq', '-an', '-vn']), None))
+        else:
+            options.append((rand.choice(OPTIONS),
+                            rand.choice([i for i in VALUES if i])))
+    return options
+
+def options_text(rand, options):
+    words = []
+    for option, value in options:
+        words.append(option)
+        if value is not None:
+            words.append(cmdline.quote(value))
+    return rand.choice(['', ' ']) + ' '.join(words)
+
+def canonical(option):
+    return cmdline.CANONICAL.get(option, option)
+
+
+def test_examples():
+    command = cmdline.Command(
+            '-vcodec libx264 -vf "scale=640:-1, hflip" -sameq -b 2M')
+    assert command.get('-c:v') == 'libx264'
+    assert command.get('-b:v') == '2M'
+    assert command.get('-sameq') == ''
+    assert command.get('-r') is None
+    assert '-sameq' in command and '-an' not in command
+    assert command.filters() == ['scale=640:-1', ' hflip']
+    assert command.find_filter('hflip') == ' hflip'
+
+    command.remove('-sameq')
+    command.set('-b:v', '800k')
+    command.set('-r', '25')
+    command.set_filter(['scale'], ['scale=-1:480'])
+    assert command.text() == \
+            '-vcodec libx264 -vf "scale=-1:480, hflip" -b 800k -r 25'
+    command.set_filter(['transpose', 'hflip', 'vflip'],
+                       ['transpose=2', 'transpose=2'])
+    command.set_filter(['subtitles'], ["subtitles='/a b.srt'"])
+    # the space after the comma of the replaced filter is kept
+    assert command.filters() == ['scale=-1:480', ' transpose=2',
+                                 'transpose=2', "subtitles='/a b.srt'"]
+    command.set_filters([])
+    command.remove('-vcodec')
+    assert command.text() == '-b 800k -r 25'
+
+    # later options override earlier ones, as in ffmpeg
+    command = cmdline.Command('-c:v mpeg4 -threads 2 -vcodec libx264')
+    assert command.get('-vcodec') == 'libx264'
+    command.set('-vcodec', 'copy')
+    assert command.text() == '-c:v copy -threads 2'
+    assert cmdline.Command('').options() == []
+    assert cmdline.Command('-s -1 -an -t').options() == [
+            ('-s', '-1'), ('-an', None), ('-t', None)]
+
+
+def test_split_filters():
+    assert cmdline.split_filters('') == []
+    assert cmdline.split_filters("a=1,subtitles='x,y',b\\,c,,[l,m]d") == [
+            'a=1', "subtitles='x,y'", 'b\\,c', '', '[l,m]d']
+    assert cmdline.filter_name(' [in] scale=1:2') == 'scale'
+    assert cmdline.filter_name('drawtext@t=text=a') == 'drawtext'
+    rand = random.Random(3)
+    for i in range(RUNS):
+        chain = ','.join(rand.choice(FILTERS + ['', "'", '\\'])
+                         for i in range(rand.randint(1, 5)))
+        assert ','.join(cmdline.split_filters(chain)) == chain
+
+
+def test_round_trip():
+    rand = random.Random(1)
+    for i in range(RUNS):
+        text = random_text(rand)
+        command = cmdline.Command(text)
+        assert command.text() == text
+        try:
+            words = shlex.split(text)
+        except ValueError:
+            continue
+        assert [i[2] for i in command.words] == words
+
+
+def test_quote():
+    for value in VALUES + FILTERS + ['"', "'", '\\', '-']:
+        assert shlex.split(cmdline.quote(value)) == [value]
+
+
+def test_set_and_remove():
+    rand = random.Random(2)
+    for i in range(RUNS):
+        options = random_options(rand)
+        command = cmdline.Command(options_text(rand, options))
+        assert command.options() == options
+
+        option = rand.choice(OPTIONS)
+        others = [i for i in options if canonical(i[0]) != canonical(option)]
+        if rand.random() < 0.3:
+            command.remove(option)
+            expected = None
+        else:
+            expected = rand.choice([i for i in VALUES if i])
+            command.set(option, expected)
+
+        text = command.text()
+        parsed = cmdline.Command(text)
+        assert parsed.get(option) == expected
+        assert [i for i in parsed.options()
+                if canonical(i[0]) != canonical(option)] == others
+        assert [i[2] for i in parsed.words] == shlex.split(text)
+
+
+def test_set_filter():
+    rand = random.Random(4)
+    names = ['scale', 'transpose', 'hflip', 'vflip', 'subtitles']
+    for i in range(RUNS):
+        filters = [rand.choice(FILTERS) for i in range(rand.randint(0, 4))]
+        command = cmdline.Command(options_text(rand, random_options(rand)))
+        command.set_filters(filters)
+        assert command.filters() == filters
+
+        replaced = rand.sample(names, rand.randint(1, 3))
+        new = rand.sample(FILTERS, rand.randint(0, 2))
+        command.set_filter(replaced, new)
+        matching = [i for i, f in enumerate(filters)
+                    if cmdline.filter_name(f) in replaced]
+        kept = [f for f in filters if cmdline.filter_name(f) not in replaced]
+        position = matching[0] if matching else len(kept)
+        expected = kept[:position] + new + kept[position:]
+        result = cmdline.Command(command.text()).filters()
+        assert [i.strip() for i in result] == [i.strip() for i in expected]
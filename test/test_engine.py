@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+
+import io
+import os
+import sys
+
+sys.path.append('..')
+from ffmulticonverter import engine
+from helpers import CopyConverter, make_jobs
+
+
+def test_run_parallel(tmpdir):
+    jobs = make_jobs(tmpdir, 20)
+    jobs.append(engine.Job(str(tmpdir) + '/missing', str(tmpdir) + '/x'))
+    eng = engine.Engine(CopyConverter(max_jobs=8), jobs, max_jobs=4)
+    assert eng.max_jobs == 4
+
+    results = eng.run()
+    assert len(results) == 21
+    assert (eng.ok, eng.error) == (20, 1)
+    for job in jobs[:-1]:
+        assert os.path.exists(job.target)
+
+
+def test_max_jobs_limits():
+    jobs = [engine.Job('a', 'b')] * 3
+    assert engine.Engine(CopyConverter(max_jobs=2), jobs, 8).max_jobs == 2
+    assert engine.Engine(CopyConverter(max_jobs=8), jobs, 8).max_jobs == 3
+    assert engine.Engine(CopyConverter(), [], 8).max_jobs == 1
+
+
+def test_iter_events_and_delete(tmpdir):
+    jobs = make_jobs(tmpdir, 5)
+    eng = engine.Engine(
+            CopyConverter(max_jobs=2), jobs, max_jobs=2, delete=True)
+    kinds = [event.kind for event in eng.iter_events()]
+    assert kinds.count(engine.STARTED) == 5
+    assert kinds.count(engine.FINISHED) == 5
+    assert kinds[-1] == engine.DONE
+    for job in jobs:
+        assert not os.path.exists(job.source)
+
+
+def test_weighted_total_progress(tmpdir):
+    jobs = make_jobs(tmpdir, 3)
+    jobs[0].weight = 30
+    jobs[1].weight = 10
+    # unknown weights count as the average of the known ones
+    jobs[2].source = str(tmpdir) + '/missing'
+    eng = engine.Engine(CopyConverter(max_jobs=1), jobs, max_jobs=1)
+    totals = [event.total_percent for event in eng.iter_events()
+              if event.kind == engine.FINISHED]
+    assert jobs[2].weight == 20
+    assert eng.total_weight == 60
+    assert totals == [50, 66, 100]
+
+
+class BatchCopyConverter(CopyConverter):
+    """CopyConverter that records the size of each batch."""
+    batch_size = 4
+
+    def __init__(self, max_jobs=None):
+        super(BatchCopyConverter, self).__init__(max_jobs)
+        self.batches = []
+
+    def convert_batch(self, engine, slot, jobs):
+        self.batches.append(len(jobs))
+        return super(BatchCopyConverter, self).convert_batch(
+                engine, slot, jobs)
+
+
+def test_batches(tmpdir):
+    jobs = make_jobs(tmpdir, 10)
+    jobs.insert(3, engine.Job(str(tmpdir) + '/missing', str(tmpdir) + '/x'))
+    converter = BatchCopyConverter(max_jobs=1)
+    eng = engine.Engine(converter, jobs, max_jobs=1)
+    results = eng.run()
+    # smaller batches at the end of the queue, missing files are not passed
+    # to the converter
+    assert converter.batches == [3, 4, 3]
+    assert [i.job for i in results] == jobs
+    assert [i.success for i in results] == [True] * 3 + [False] + [True] * 7
+
+
+def test_image_batch_command():
+    jobs = [engine.Job('a.png', 'a.jpg'), engine.Job('b.png', 'b.jpg')]
+    cmd = engine.ImageConverter('10x20', True, '-flip').batch_command(jobs)
+    assert cmd == ['convert', '(', 'a.png', '-resize', '10x20', '-flip',
+                   '-write', 'a.jpg', '+delete', ')', 'b.png', '-resize',
+                   '10x20', '-flip', 'b.jpg']
+
+
+def test_create_paths_list(tmpdir):
+    output = str(tmpdir)
+    open(os.path.join(output, 'a.mp4'), 'w').close()
+    files = ['/x/a.avi', '/y/a.avi', '/x/b.avi', '/z/a.mkv']
+    jobs = engine.create_paths_list(files, '.mp4', '', '', output, False,
+                                    False)
+    assert [i.source for i in jobs] == files
+    assert [os.path.basename(i.target) for i in jobs] == [
+            '~a.mp4', '~2~a.mp4', 'b.mp4', '~3~a.mp4']
+    # existing files are overwritten, but each job gets its own target
+    jobs = engine.create_paths_list(files[:2] + ['/x/a.mp4'], '.mp4', '', '',
+                                    output, False, True)
+    assert [i.target for i in jobs] == [output + '/a.mp4', output + '/~a.mp4',
+                                        output + '/~2~a.mp4']
+    jobs = engine.create_paths_list(files[:1], '.mp4', 'p-', '-s', output,
+                                    False, True)
+    assert jobs[0].target == output + '/p-a-s.mp4'
+    jobs = engine.create_paths_list(['/x/a.avi'], '.mp4', '', '', None,
+                                    True, False)
+    assert jobs[0].target == '/x/a.mp4'
+
+
+def test_commands():
+    job = engine.Job('/a b/in.avi', '/out/in.mp4')
+    cmd = engine.VideoConverter('ffmpeg', '-vcodec libx264').command(job)
+    assert cmd == ['ffmpeg', '-y', '-nostats', '-progress', 'pipe:1', '-i',
+                   '/a b/in.avi', '-vcodec', 'libx264', '/out/in.mp4']
+    cmd = engine.VideoConverter('avconv', '').command(job)
+    assert cmd == ['avconv', '-y', '-i', '/a b/in.avi', '/out/in.mp4']
+    cmd = engine.ImageConverter('10x20', False, '-flip').command(job)
+    assert cmd == ['convert', '/a b/in.avi', '-resize', '10x20!', '-flip',
+                   '/out/in.mp4']
+    job = engine.Job('/a/doc.odt', '/b/doc.pdf')
+    cmd = engine.DocumentConverter().command(job)
+    assert cmd == ['unoconv', '-f', 'pdf', '-o', '/b/doc.pdf', '/a/doc.odt']
+    cmd = engine.DocumentConverter().command(job, 2003)
+    assert cmd == ['unoconv', '-n', '-p', '2003', '-f', 'pdf', '-o',
+                   '/b/doc.pdf', '/a/doc.odt']
+
+
+def test_pillow_operations():
+    from ffmulticonverter import imaging
+    assert imaging.parse_operations('10x20', False, ' -trim +repage -flip') \
+            == [('resize', 10, 20, False), ('trim',), ('flip',)]
+    assert imaging.parse_operations('10x', True, '-rotate 90 -flop') \
+            == [('resize', 10, None, True), ('rotate', 90), ('flop',)]
+    # left to ImageMagick
+    assert imaging.parse_operations('10x', False, '') is None
+    assert imaging.parse_operations('', False, '-blur 2') is None
+    assert imaging.supported('/a/b.JPG')
+    assert not imaging.supported('/a/b.psd')
+
+
+def test_split_points():
+    keyframes = [i * 10 for i in range(100)]
+    assert engine.split_points(1000, keyframes, 4, 60) == [250, 500, 750]
+    # parts would be shorter than min_length
+    assert engine.split_points(1000, keyframes, 8, 300) == [340, 670]
+    assert engine.split_points(1000, [0, 990], 4, 60) == []
+
+    converter = engine.VideoConverter('ffmpeg', '-vcodec libx264', segments=2)
+    cmd = converter.segment_command(
+            engine.Job('in.avi', 'out.mp4'), 250, 500, 'part.mp4')
+    assert cmd == ['ffmpeg', '-y', '-nostats', '-progress', 'pipe:1', '-ss',
+                   '250.000000', '-i', 'in.avi', '-t', '250.000000',
+                   '-vcodec', 'libx264', 'part.mp4']
+
+
+def test_read_lines():
+    data = 'Duration: 00:01:00.00\nframe=1 time=00:00:01.00\rframe=2 ' \
+           'time=00:00:02.00\rénd'.encode('utf8')
+    for chunk_size in (1, 3, 1024):
+        stream = io.BufferedReader(io.BytesIO(data))
+        lines = [l for chunk in engine.read_lines(stream, chunk_size)
+                 for l in chunk]
+        assert ''.join(lines) == data.decode('utf8')
+        assert lines[0] == 'Duration: 00:01:00.00\n'
+        assert lines[-1] == 'énd'
+
+    # '\r\n' split between two reads is a single line end
+    data = b'Input #0\r\nDuration: 00:01:00.00\r\nend'
+    for chunk_size in range(1, len(data) + 1):
+        stream = io.BufferedReader(io.BytesIO(data))
+        lines = [l for chunk in engine.read_lines(stream, chunk_size)
+                 for l in chunk]
+        assert [l.rstrip('\r\n') for l in lines] == \
+                ['Input #0', 'Duration: 00:01:00.00', 'end']
+
+
+def test_read_progress():
+    data = (b'frame=10\nfps=25.00\nout_time_us=2000000\nspeed=1.5x\n'
+            b'progress=continue\nframe=20\nfps=N/A\nout_time_ms=4000000\n'
+            b'speed=N/A\nprogress=end\n')
+    stream = io.BufferedReader(io.BytesIO(data))
+    blocks = list(engine.read_progress(stream))
+    assert len(blocks) == 2
+    assert engine.progress_time(blocks[0]) == 2
+    assert engine.progress_value(blocks[0], 'speed') == 1.5
+    assert engine.progress_value(blocks[0], 'fps') == 25
+    assert engine.progress_time(blocks[1]) == 4
+    assert engine.progress_value(blocks[1], 'speed') is None
+
+
+class EmptyConverter(engine.Converter):
+    """Converter that succeeds without writing anything."""
+    name = 'TEST'
+
+    def command(self, job):
+        return ['touch', job.output]
+
+
+def test_unverified_outputs_keep_sources(tmpdir):
+    jobs = make_jobs(tmpdir, 2)
+    eng = engine.Engine(EmptyConverter(), jobs, delete=True)
+    eng.run()
+    assert (eng.ok, eng.error) == (0, 2)
+    for job in jobs:
+        assert os.path.exists(job.source)
+        assert not os.path.exists(job.target)
+        assert not os.path.exists(engine.temp_name(job.target))
+
+
+def test_scratch_dir(tmpdir, monkeypatch):
+    scratch = tmpdir.mkdir('scratch')
+    jobs = make_jobs(tmpdir, 6)
+    eng = engine.Engine(CopyConverter(), jobs, max_jobs=2,
+                        scratch_dir=str(scratch))
+    eng.run()
+    assert eng.ok == 6
+    for job in jobs:
+        assert os.path.exists(job.target)
+    assert scratch.listdir() == []
+    assert eng.scratch_reserved == 0
+
+    # outputs that do not fit are written next to their targets
+    monkeypatch.setattr(engine.config, 'scratch_min_free', 1 << 62)
+    jobs = make_jobs(tmpdir, 2)
+    eng = engine.Engine(CopyConverter(), jobs, scratch_dir=str(scratch))
+    assert eng.reserve_scratch(jobs) is None
+    eng.run()
+    assert eng.ok == 2
+
+
+class FailingConverter(CopyConverter):
+    """CopyConverter that raises instead of converting the first job."""
+    def convert(self, engine, slot, job):
+        if job.source.endswith('in0.txt'):
+            raise RuntimeError('converter bug')
+        return super(FailingConverter, self).convert(engine, slot, job)
+
+
+class FailingCache(object):
+    """Result cache whose results cannot be stored."""
+    def key(self, source, settings):
+        return source
+
+    def fetch(self, key, target):
+        return False
+
+    def store(self, key, target):
+        raise OSError('disk full')
+
+    def save(self):
+        pass
+
+
+def test_exceptions_fail_jobs(tmpdir):
+    jobs = make_jobs(tmpdir, 4)
+    eng = engine.Engine(FailingConverter(), jobs, max_jobs=2)
+    events = list(eng.iter_events())
+    assert events[-1].kind == engine.DONE
+    assert (eng.ok, eng.error) == (3, 1)
+    assert any('RuntimeError: converter bug' in (i.text or '')
+               for i in events if i.job is jobs[0])
+    assert not os.path.exists(engine.temp_name(jobs[0].target))
+
+    # outputs are completed in the mover thread
+    scratch = tmpdir.mkdir('scratch')
+    jobs = make_jobs(tmpdir.mkdir('again'), 3)
+    eng = engine.Engine(CopyConverter(), jobs, max_jobs=2,
+                        cache=FailingCache(), scratch_dir=str(scratch))
+    events = list(eng.iter_events())
+    assert [i.kind for i in events].count(engine.FINISHED) == 3
+    assert (eng.ok, eng.error) == (0, 3)
+    assert eng.scratch_reserved == 0
+
+
+class ScratchFullConverter(CopyConverter):
+    """CopyConverter that fails to write to the scratch folder."""
+    def __init__(self, scratch):
+        super(ScratchFullConverter, self).__init__()
+        self.scratch = scratch
+
+    def convert(self, engine, slot, job):
+        if job.output.startswith(self.scratch):
+            return False
+        return super(ScratchFullConverter, self).convert(engine, slot, job)
+
+
+def test_full_scratch_dir(tmpdir, monkeypatch):
+    scratch = str(tmpdir.mkdir('scratch'))
+    jobs = make_jobs(tmpdir, 3)
+    eng = engine.Engine(ScratchFullConverter(scratch), jobs,
+                        scratch_dir=scratch)
+    monkeypatch.setattr(eng, 'scratch_full', lambda: True)
+    reserved = eng.reserve_scratch(jobs[:1])
+    assert reserved == os.path.getsize(jobs[0].source)
+    eng.release_scratch(reserved)
+    eng.run()
+    assert eng.ok == 3
+    for job in jobs:
+        assert os.path.exists(job.target)
+
+
+def test_plan_segments(monkeypatch):
+    converter = engine.VideoConverter('ffmpeg', '-vcodec libx264', segments=4)
+    monkeypatch.setattr(engine.probe, 'keyframes',
+                        lambda path: list(range(0, 3600, 10)))
+    # the weight of unprobed jobs is the average of the batch
+    job = engine.Job('/a.avi', '/a.mp4', weight=3600)
+    monkeypatch.setattr(engine.probe, 'duration', lambda path: None)
+    assert converter.plan_segments(job) == []
+    monkeypatch.setattr(engine.probe, 'duration', lambda path: 3600)
+    assert converter.plan_segments(job) == [900, 1800, 2700]
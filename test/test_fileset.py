@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+
+sys.path.append('..')
+from ffmulticonverter import fileset
+
+
+def test_fileset():
+    files = fileset.FileSet(['/a', '/b', '/a'])
+    assert files.extend(['/c', '/b', '/d', '/c']) == ['/c', '/d']
+    assert list(files) == ['/a', '/b', '/c', '/d']
+    assert '/c' in files and '/e' not in files
+    assert files.row('/d') == 3
+
+    files.remove_rows([0, 2])
+    assert list(files) == ['/b', '/d']
+    assert files.row('/d') == 1
+    files.remove(['/b', '/missing'])
+    assert list(files) == ['/d'] and len(files) == 1
+    files.clear()
+    assert not files
+
+
+def test_ranges():
+    assert fileset.ranges([7, 1, 3, 2, 9, 8]) == [(1, 3), (7, 9)]
+    assert fileset.ranges([]) == []
+
+
+def test_scan(tmpdir):
+    root = str(tmpdir)
+    for name in ['b/2.avi', 'b/c/3.MKV', 'a.avi', 'b/notes.txt', '1.mp4']:
+        path = os.path.join(root, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        open(path, 'w').close()
+    os.symlink(root, os.path.join(root, 'b', 'loop'))
+
+    chunks = list(fileset.scan([root], ['avi', 'mkv', 'mp4'], chunk_size=2))
+    assert [len(i) for i in chunks] == [2, 2]
+    found = [os.path.relpath(i, root) for chunk in chunks for i in chunk]
+    assert found == ['1.mp4', 'a.avi', 'b/2.avi', 'b/c/3.MKV']
+    assert len([i for chunk in fileset.scan([root]) for i in chunk]) == 5
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+
+sys.path.append('..')
+from ffmulticonverter import engine
+from ffmulticonverter import journal
+
+
+class FailingConverter(engine.Converter):
+    """Converter that writes half of its output and fails."""
+    name = 'TEST'
+
+    def command(self, job):
+        return ['sh', '-c', 'echo partial > "$0"; exit 1', job.output]
+
+
+def test_batches(tmpdir):
+    jobs_journal = journal.Journal(str(tmpdir.join('jobs.db')))
+    jobs = []
+    for i in range(6):
+        source = tmpdir.join('a{0}'.format(i))
+        source.write('data')
+        source.setmtime(0)
+        jobs.append(engine.Job(str(source), 'b{0}'.format(i)))
+    settings = {'type' : 'VIDEO', 'command' : '-vcodec libx264'}
+    batch = jobs_journal.create_batch(settings, True, jobs)
+    jobs_journal.set_state(batch, [0], journal.DONE)
+    jobs_journal.set_state(batch, [1], journal.FAILED)
+    jobs_journal.set_state(batch, [2], journal.RUNNING)
+    jobs_journal.close()
+    # sources that were removed or modified are not resumed
+    tmpdir.join('a4').remove()
+    tmpdir.join('a5').setmtime(time.time() + 60)
+
+    # as after a crash
+    jobs_journal = journal.Journal(str(tmpdir.join('jobs.db')))
+    unfinished = jobs_journal.unfinished_batch()
+    assert unfinished.id == batch
+    assert unfinished.settings == settings
+    assert unfinished.delete
+    assert unfinished.remaining() == [(jobs[2].source, 'b2'),
+                                      (jobs[3].source, 'b3')]
+
+    resumed = jobs_journal.create_batch(
+            settings, True, jobs[2:4], replaces=batch)
+    # batches that are converting are not offered
+    assert jobs_journal.unfinished_batch() is None
+    jobs_journal.release_batch(resumed)
+    assert jobs_journal.unfinished_batch().id == resumed
+    jobs_journal.finish_batch(resumed)
+    assert jobs_journal.unfinished_batch() is None
+
+    # a new batch supersedes the unfinished ones, unless they are active
+    running = jobs_journal.create_batch(settings, False, jobs[:1])
+    cancelled = jobs_journal.create_batch(settings, False, jobs[1:2])
+    jobs_journal.release_batch(cancelled)
+    newest = jobs_journal.create_batch(settings, False, jobs[2:3])
+    jobs_journal.finish_batch(newest)
+    jobs_journal.release_batch(newest)
+    assert jobs_journal.unfinished_batch() is None
+    jobs_journal.release_batch(running)
+    assert jobs_journal.unfinished_batch().id == running
+
+
+def test_engine_records_jobs(tmpdir):
+    jobs_journal = journal.Journal(str(tmpdir.join('jobs.db')))
+    source = tmpdir.join('in.txt')
+    source.write('data')
+    job = engine.Job(str(source), str(tmpdir.join('out.txt')))
+
+    eng = engine.Engine(FailingConverter(), [job], journal=jobs_journal)
+    eng.run()
+    # failed conversions leave neither the target nor the temporary file
+    assert [i for i in os.listdir(str(tmpdir))
+            if not i.startswith('jobs.db')] == ['in.txt']
+    assert jobs_journal.unfinished_batch() is None
+    assert not jobs_journal.active
+
+
+def test_converter_from_settings():
+    converter = engine.VideoConverter('ffmpeg', '-vcodec libx264', 3, 2)
+    copy = engine.converter_from_settings(converter.settings(), 5)
+    assert isinstance(copy, engine.VideoConverter)
+    assert (copy.cmd, copy.segments, copy.max_jobs) == \
+            ('-vcodec libx264', 2, 5)
+
+    converter = engine.ImageConverter('100x100', True, '-flip')
+    copy = engine.converter_from_settings(converter.settings())
+    assert copy.command(engine.Job('a.png', 'b.png')) == \
+            converter.command(engine.Job('a.png', 'b.png'))
+    assert isinstance(engine.converter_from_settings({'type' : 'DOCUMENT'}),
+                      engine.DocumentConverter)
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+sys.path.append('..')
+from ffmulticonverter import config
+from ffmulticonverter import office
+
+
+def listen(port):
+    server = socket.socket()
+    server.bind(('127.0.0.1', port))
+    server.listen(5)
+    return server
+
+
+def test_pool_reuses_running_listeners(monkeypatch):
+    first_server = listen(0)
+    base = first_server.getsockname()[1]
+    try:
+        second_server = listen(base + 1)
+    except OSError:
+        first_server.close()
+        pytest.skip('port {0} is in use'.format(base + 1))
+    monkeypatch.setattr(config, 'office_base_port', base)
+
+    pool = office.ListenerPool(2)
+    first = pool.acquire()
+    second = pool.acquire()
+    assert {first.port, second.port} == {base, base + 1}
+    # listeners that are already running are not started again
+    assert first.process is None and second.process is None
+    pool.release(first)
+    assert pool.acquire() is first
+    pool.shutdown()
+    first_server.close()
+    second_server.close()
+
+
+def test_listener_that_exits(monkeypatch):
+    server = listen(0)
+    port = server.getsockname()[1]
+    server.close()
+    monkeypatch.setattr(config, 'office_start_timeout', 30)
+    listener = office.Listener(port)
+    listener.process = subprocess.Popen(['false'])
+    start = time.time()
+    # no need to wait for the timeout
+    assert not listener.wait_ready()
+    assert time.time() - start < 5
+    assert listener.process is None
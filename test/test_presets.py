@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import stat
+import xml.etree.ElementTree as etree
+
+import pytest
+
+sys.path.append('..')
+from ffmulticonverter import presets
+
+
+def make_store():
+    return presets.PresetStore([
+            presets.Preset('mp3', 'MP3 audio', '-vn -acodec libmp3lame',
+                           'mp3', 'Audio'),
+            presets.Preset('WavCD', 'Wav for CD', '-vn -ar 44100', 'wav',
+                           'Audio'),
+            presets.Preset('iPod', 'Apple iPod video', '-vcodec mpeg4', 'mp4',
+                           'Apple'),
+            ])
+
+
+def test_indexes():
+    store = make_store()
+    assert len(store) == 3
+    assert store.names() == ['WavCD', 'iPod', 'mp3']
+    assert [i.name for i in store.in_category('Audio')] == ['WavCD', 'mp3']
+    assert [i.name for i in store.with_extension('mp4')] == ['iPod']
+
+    store.add(presets.Preset('iPod', 'Apple iPod', '-f mp4', 'm4v', 'Apple'))
+    assert len(store) == 3
+    assert store.with_extension('mp4') == []
+    assert store.get('iPod').params == '-f mp4'
+    store.remove('WavCD')
+    assert 'WavCD' not in store
+    assert store.names() == ['iPod', 'mp3']
+    assert store.get('missing') is None
+
+
+def test_tokenize():
+    assert presets.tokenize('BlackberryCurvefs') == set([
+            'blackberrycurvefs', 'blackberry', 'curvefs'])
+    assert presets.tokenize('-vcodec libx264 -s 640x480') == set([
+            'vcodec', 'libx264', 'libx', '264', 's', '640x480', '640', 'x',
+            '480'])
+
+
+def test_search():
+    store = make_store()
+    # presets matching several words are listed once, those matching more
+    # words or more important fields first
+    assert [i.name for i in store.search('AUDIO mp3')] == ['mp3']
+    assert [i.name for i in store.search('wav ipod')] == ['WavCD', 'iPod']
+    assert [i.name for i in store.search('mp')] == ['mp3', 'iPod']
+    assert [i.name for i in store.search('vn ipod')] == ['iPod', 'WavCD',
+                                                         'mp3']
+    # prefixes of words, of their parts and of params
+    assert [i.name for i in store.search('ame')] == []
+    assert [i.name for i in store.search('libmp')] == ['mp3']
+    assert [i.name for i in store.search('lame')] == ['mp3']
+    assert [i.name for i in store.search('cd')] == ['WavCD']
+    assert [i.name for i in store.search('mpeg')] == ['iPod']
+    assert [i.name for i in store.search('-ar')] == ['WavCD']
+    assert store.search('  ') == []
+
+    store.remove('mp3')
+    assert store.search('libmp') == []
+    store.add(presets.Preset('ogg', 'Ogg audio', '-vn', 'ogg', 'Audio'))
+    assert [i.name for i in store.search('audio')] == ['ogg']
+    store.clear()
+    assert store.search('audio') == []
+
+
+def test_tree_round_trip():
+    store = make_store()
+    store.add(presets.Preset('raw', 'Raw', '-f rawvideo', 'yuv'))
+    tree = etree.ElementTree(etree.fromstring(
+            etree.tostring(store.to_tree().getroot())))
+    loaded = presets.PresetStore.from_tree(tree)
+    assert loaded.names() == store.names()
+    for preset in store:
+        other = loaded.get(preset.name)
+        assert other.values() == preset.values()
+        assert other.category == preset.category
+
+
+def test_synchronize():
+    store = make_store()
+    store.add(presets.Preset('custom', 'Mine', '-an', 'mkv'))
+    defaults = make_store()
+    defaults.add(presets.Preset('mp3', 'MP3 audio', '-vn -b:a 192k', 'mp3'))
+    defaults.add(presets.Preset('ogg', 'Ogg audio', '-vn', 'ogg', 'Audio'))
+    store.synchronize(defaults)
+    old = 'mp3' + presets.config.presets_old
+    assert store.names() == ['WavCD', 'custom', 'iPod', 'mp3', old, 'ogg']
+    assert store.get('mp3').params == '-vn -b:a 192k'
+    assert store.get(old).params == '-vn -acodec libmp3lame'
+
+    store.remove_old()
+    assert old not in store
+    assert len(store) == 5
+
+
+def test_presets_file(tmpdir, monkeypatch):
+    path = str(tmpdir.join('presets.xml'))
+    cache_file = str(tmpdir.join('cache', 'presets.json'))
+    # there are no user presets yet, the default ones are loaded
+    monkeypatch.setattr(presets, 'load_default_tree',
+                        lambda: make_store().to_tree())
+    pfile = presets.PresetsFile(path, cache_file)
+    assert pfile.load().names() == ['WavCD', 'iPod', 'mp3']
+    pfile.flush()
+    assert not tmpdir.join('presets.xml').exists()
+
+    # changes are written together
+    pfile.store.remove('mp3')
+    pfile.changed()
+    pfile.store.remove('iPod')
+    pfile.changed()
+    pfile.flush()
+    assert presets.PresetStore.from_tree(
+            etree.parse(path)).names() == ['WavCD']
+    assert sorted(i.basename for i in tmpdir.listdir()) == [
+            'cache', 'presets.xml']
+    umask = os.umask(0)
+    os.umask(umask)
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o666 & ~umask
+
+    # the cache is used while the file does not change
+    other = presets.PresetsFile(path, cache_file)
+    monkeypatch.setattr(presets.etree, 'parse', None)
+    assert other.load().names() == ['WavCD']
+    monkeypatch.undo()
+
+    # another program writes the file
+    with open(path, 'w') as f:
+        f.write('<presets><x><label>X</label><params>-an</params>'
+                '<extension>mkv</extension></x></presets>')
+    pfile.store.clear()
+    pfile.changed()
+    with pytest.raises(presets.ConflictError):
+        pfile.flush()
+    assert other.load().names() == ['x']
+    pfile.flush(force=True)
+    assert other.load().names() == []
+
+    # the permissions of the file are kept
+    os.chmod(path, 0o640)
+    pfile.store.add(presets.Preset('y', 'Y', '-an', 'mkv'))
+    pfile.changed()
+    pfile.flush()
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o640
+
+
+def test_shared_presets_file(tmpdir, monkeypatch):
+    path = str(tmpdir.join('presets.xml'))
+    make_store().to_tree().write(path)
+    monkeypatch.setattr(presets.config, 'presets_file', path)
+    monkeypatch.setattr(presets.config, 'use_presets_cache', False)
+    monkeypatch.setattr(presets, '_presets_file', None)
+    store = presets.load_store()
+    assert presets.get_presets_file() is presets.get_presets_file()
+    assert presets.load_store() is store
+    assert presets.find_preset('mp3') == ('-vn -acodec libmp3lame', 'mp3')
+    assert presets.find_preset('missing') is None
+
+    # unwritten changes are kept, and written ones are not read again
+    store.remove('mp3')
+    presets.get_presets_file().changed()
+    assert presets.load_store() is store
+    presets.get_presets_file().flush()
+    assert presets.load_store() is store
+
+    # the file is parsed again when another program changes it
+    presets.PresetStore([presets.Preset('x', 'X', '-an', 'mkv')]).to_tree() \
+            .write(path)
+    assert presets.load_store().names() == ['x']
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+
+sys.path.append('..')
+from ffmulticonverter import probe
+
+
+INFO = {
+        'format' : {'duration' : '90.5'},
+        'streams' : [
+            {'codec_type' : 'video', 'codec_name' : 'h264', 'width' : 1280,
+             'height' : 720},
+            {'codec_type' : 'audio', 'codec_name' : 'aac',
+             'sample_rate' : '44100'}
+            ]
+        }
+
+
+def test_cache(tmpdir):
+    media = tmpdir.join('a.mkv')
+    media.write('data')
+    cache_file = str(tmpdir.join('probe.json'))
+    cache = probe.ProbeCache(cache_file, 10)
+    assert cache.get(str(media)) == (False, None)
+    cache.put(str(media), INFO)
+    assert cache.get(str(media)) == (True, INFO)
+    # failures are cached too
+    other = tmpdir.join('b.txt')
+    other.write('text')
+    cache.put(str(other), None)
+    assert cache.get(str(other)) == (True, None)
+
+    cache.save()
+    cache = probe.ProbeCache(cache_file, 10)
+    assert cache.get(str(media)) == (True, INFO)
+
+    # modified files are probed again
+    media.write('new data')
+    os.utime(str(media), ns=(1, 1))
+    assert cache.get(str(media)) == (False, None)
+
+
+def test_cache_size(tmpdir):
+    cache = probe.ProbeCache(str(tmpdir.join('probe.json')), 3)
+    paths = []
+    for i in range(5):
+        path = tmpdir.join('{0}.mkv'.format(i))
+        path.write('')
+        paths.append(str(path))
+        cache.put(str(path), INFO)
+    assert [cache.get(i)[0] for i in paths] == [False, False, True, True, True]
+
+
+def test_cache_keeps_used_fields(tmpdir):
+    media = tmpdir.join('a.mkv')
+    media.write('data')
+    output = {
+            'format' : {'duration' : '90.5', 'bit_rate' : '1000',
+                        'tags' : {'title' : 'A'}},
+            'streams' : [{'codec_type' : 'video', 'codec_name' : 'h264',
+                          'avg_frame_rate' : '25/1', 'disposition' : {}}]
+            }
+    expected = {
+            'format' : {'duration' : '90.5', 'bit_rate' : '1000'},
+            'streams' : [{'codec_type' : 'video', 'codec_name' : 'h264',
+                          'avg_frame_rate' : '25/1'}]
+            }
+    assert probe.select_fields(output) == expected
+    assert probe.select_fields(None) is None
+    # caches that keep the whole output are trimmed when loaded
+    stat = os.stat(str(media))
+    cache_file = tmpdir.join('probe.json')
+    cache_file.write(json.dumps({os.path.realpath(str(media)) :
+                                 [stat.st_size, stat.st_mtime_ns, output]}))
+    cache = probe.ProbeCache(str(cache_file), 10)
+    assert cache.get(str(media)) == (True, expected)
+
+
+def test_describe():
+    assert probe.describe(INFO) == 'h264 1280x720, aac 44100 Hz, 00:01:30'
+    assert probe.describe(None) == ''
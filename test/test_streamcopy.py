@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+import sys
+
+sys.path.append('..')
+from ffmulticonverter import streamcopy
+
+
+STREAMS = [
+        {'codec_type' : 'video', 'codec_name' : 'h264', 'width' : 1280,
+         'height' : 720, 'avg_frame_rate' : '25/1', 'bit_rate' : '2000000'},
+        {'codec_type' : 'audio', 'codec_name' : 'aac', 'sample_rate' : '44100',
+         'channels' : 2, 'bit_rate' : '128000'}
+        ]
+
+
+def plan(command):
+    return streamcopy.plan(command.split(), STREAMS)[0]
+
+
+def test_copies_matching_streams():
+    assert plan('-vcodec libx264 -acodec aac') == \
+            ['-c:a', 'copy', '-c:v', 'copy']
+    assert plan('-vcodec libx264 -s 1280x720 -r 25 -acodec libmp3lame') == \
+            ['-acodec', 'libmp3lame', '-c:v', 'copy']
+    assert plan('-c:a aac -ar 44100 -ac 2 -b:a 192k -threads 2') == \
+            ['-threads', '2', '-c:a', 'copy']
+    assert plan('-c libx264') == ['-c:a', 'libx264', '-c:v', 'copy']
+
+
+def test_encodes_changed_streams():
+    for command in ('-vcodec libx264 -s 640x360', '-vcodec libx264 -vf hflip',
+                    '-vcodec libx264 -b:v 1000k', '-vcodec mpeg4', '-ss 10',
+                    '-vcodec libx264 -acodec aac -filter_complex x',
+                    '-vcodec', ''):
+        assert plan(command) == command.split()
+    assert plan('-vcodec libx264 -acodec aac -ar 48000') == \
+            ['-acodec', 'aac', '-ar', '48000', '-c:v', 'copy']
+
+
+def test_all_streams_of_a_type_must_match():
+    streams = STREAMS + [
+            {'codec_type' : 'audio', 'codec_name' : 'mp3',
+             'sample_rate' : '44100', 'channels' : 2}]
+    new_args, decisions = streamcopy.plan(
+            ['-vcodec', 'libx264', '-acodec', 'aac'], streams)
+    assert new_args == ['-acodec', 'aac', '-c:v', 'copy']
+    assert decisions[0] == 'audio: mp3 to aac, encoding'
+    streams[-1]['codec_name'] = 'aac'
+    streams[-1]['sample_rate'] = '48000'
+    assert streamcopy.plan(['-c:a', 'aac', '-ar', '44100'], streams)[0] == \
+            ['-c:a', 'aac', '-ar', '44100']
+
+
+def test_streams_of_type():
+    assert streamcopy.streams_of_type(STREAMS, 'audio') == STREAMS[1:]
+    assert streamcopy.first_stream(STREAMS, 'video') is STREAMS[0]
+    assert streamcopy.first_stream(STREAMS, 'subtitle') is None
+    assert streamcopy.first_stream([], 'video') is None
+
+
+def test_unknown_streams():
+    args = ['-vcodec', 'libx264']
+    new_args, decisions = streamcopy.plan(args, None)
+    assert new_args == args
+    assert decisions == ['input streams are unknown']